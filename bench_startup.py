@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+"""
+Measure worker cold-start cost for one or more settings modules.
+
+Each run starts a fresh interpreter, builds the WSGI application and loads
+the URLconf, then reports wall time, number of imported modules and peak RSS.
+
+    python bench_startup.py config.settings config.settings_student --runs 5
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+PROBE = r"""
+import json, os, resource, sys, time
+start = time.perf_counter()
+os.environ['DJANGO_SETTINGS_MODULE'] = sys.argv[1]
+from django.core.wsgi import get_wsgi_application
+from django.urls import get_resolver
+get_wsgi_application()
+get_resolver().url_patterns
+elapsed = time.perf_counter() - start
+print(json.dumps({
+    'seconds': elapsed,
+    'modules': len(sys.modules),
+    'rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    'heavy': sorted(m for m in ('import_export', 'tablib', 'openpyxl', 'diff_match_patch', 'crispy_forms') if m in sys.modules),
+}))
+"""
+
+
+def measure(settings_module, runs):
+    samples = []
+    for _ in range(runs):
+        out = subprocess.run(
+            [sys.executable, '-c', PROBE, settings_module],
+            capture_output=True, text=True, check=True,
+        )
+        samples.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    return {
+        'settings': settings_module,
+        'median_ms': round(statistics.median(s['seconds'] for s in samples) * 1000, 1),
+        'modules': samples[-1]['modules'],
+        'rss_mb': round(statistics.median(s['rss_kb'] for s in samples) / 1024, 1),
+        'heavy': samples[-1]['heavy'],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('settings', nargs='*', default=['config.settings', 'config.settings_student'])
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'settings':<28}{'startup':>10}{'modules':>9}{'rss':>10}  heavy imports")
+    for settings_module in args.settings:
+        r = measure(settings_module, args.runs)
+        print(f"{r['settings']:<28}{r['median_ms']:>8}ms{r['modules']:>9}{r['rss_mb']:>8}MB  {', '.join(r['heavy']) or '-'}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,43 +1,139 @@
 # activities/admin.py
-from django.contrib import admin
-from django.urls import path, reverse
-from django.http import HttpResponse
+from django.contrib import admin, messages
+from django.contrib.admin import helpers
 from django.template.response import TemplateResponse
+from django.urls import path, reverse
+from django.http import FileResponse, Http404, JsonResponse
+from django.shortcuts import get_object_or_404, redirect
 from django.utils.html import format_html
 from django.contrib.admin import SimpleListFilter
-from django.db.models import Count
-import csv
+from django.db.models import Count, Q
+from django.utils import timezone
+import time
+from datetime import timedelta
 
-from .models import Grade, Activity, StudentProfile, Booking
-from .forms import BookingAdminForm
+from . import capacity, enrollment, fillrate, jobs, journal, search, tenancy
+from .changelist import EstimatedCountPaginator, KeysetChangeList
+from .models import School, Term, Grade, Activity, StudentProfile, Booking, BookingEvent, ArchivedBooking, Job, SearchTerm, Occurrence, Attendance
+from .forms import BookingAdminForm, EnrollForm
 from import_export.admin import ImportExportModelAdmin
 from .resources import GradeResource, ActivityResource, StudentProfileResource, BookingResource
 
+def enroll_students(modeladmin, request, queryset, students):
+    """
+    Shared body of the bulk enroll actions: asks for the activity, then
+    books ``students`` into it and reports who was skipped and why.
+    """
+    form = EnrollForm(request.POST if 'apply' in request.POST else None)
+    if form.is_valid():
+        activity = form.cleaned_data['activity']
+        result = enrollment.enroll(students, activity, request.user)
+        modeladmin.message_user(request, f"{activity}: {result.summary()}.")
+        for reason, skipped in result.skipped.items():
+            names = ", ".join(s.name for s in skipped)
+            modeladmin.message_user(request, f"Skipped ({reason}): {names}", messages.WARNING)
+        return None
+    return TemplateResponse(request, 'admin/bookings/enroll.html', {
+        **modeladmin.admin_site.each_context(request),
+        'title': "Enroll students in an activity",
+        'opts': modeladmin.model._meta,
+        'form': form,
+        'queryset': queryset,
+        'student_count': len(students),
+        'action': request.POST.get('action'),
+        'action_checkbox_name': helpers.ACTION_CHECKBOX_NAME,
+    })
+
+
+def _booking_autocomplete_param(request, field_name, param):
+    """
+    The other booking field's value that booking_autocomplete.js sends with
+    an autocomplete lookup for ``field_name``, or None.
+    """
+    if request.GET.get('model_name') != 'booking' or request.GET.get('field_name') != field_name:
+        return None
+    value = request.GET.get(param, '')
+    return int(value) if value.isdigit() else None
+
+
+@admin.register(School)
+class SchoolAdmin(admin.ModelAdmin):
+    list_display = ('name', 'slug', 'hosts', 'db_alias')
+    prepopulated_fields = {'slug': ('name',)}
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        tenancy.clear_cache()
+
+
+@admin.register(Term)
+class TermAdmin(admin.ModelAdmin):
+    list_display = ('name', 'start_date', 'end_date', 'is_current', 'archived_count')
+    actions = ['term_booking_report', 'term_rosters', 'term_attendance']
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(_archived=Count('archived_bookings'))
+
+    def archived_count(self, obj):
+        return obj._archived
+    archived_count.short_description = "Archived bookings"
+
+    def term_booking_report(self, request, queryset):
+        term = queryset.first()
+        job = jobs.enqueue('booking_report', request.user, term_id=term.pk)
+        return redirect('admin:bookings_job_change', job.pk)
+    term_booking_report.short_description = "Booking report for selected term"
+
+    def term_rosters(self, request, queryset):
+        term = queryset.first()
+        job = jobs.enqueue('roster_bundle', request.user, term_id=term.pk)
+        return redirect('admin:bookings_job_change', job.pk)
+    term_rosters.short_description = "Printable rosters (ZIP) for selected term"
+
+    def term_attendance(self, request, queryset):
+        term = queryset.first()
+        job = jobs.enqueue('attendance_report', request.user, term_id=term.pk)
+        return redirect('admin:bookings_job_change', job.pk)
+    term_attendance.short_description = "Attendance percentages for selected term"
+
+
 @admin.register(Grade)
 class GradeAdmin(ImportExportModelAdmin):
     resource_class = GradeResource
     list_display = ('name', 'activities_count')
     search_fields = ('name',)
+    actions = ['enroll_grade']
 
     def activities_count(self, obj):
         return obj.activities.count()
     activities_count.short_description = "Activities"
 
+    def enroll_grade(self, request, queryset):
+        students = list(StudentProfile.objects.filter(grade__in=queryset).only('pk', 'name', 'grade_id'))
+        return enroll_students(self, request, queryset, students)
+    enroll_grade.short_description = "Enroll selected grades in an activity"
+
+
+
 
+# chart windows offered on the fill-rate page, in days
+FILL_RATE_WINDOWS = (1, 2, 7, 30, 90)
 
 
 @admin.register(Activity)
 class ActivityAdmin(ImportExportModelAdmin):
     resource_class = ActivityResource
-    list_display = ('name','day', 'time', 'capacity','bookings_count','spots_left','allowed_grades_list')
+    list_display = ('name','day', 'time', 'start_time', 'end_time', 'capacity','bookings_count','spots_left','allowed_grades_list','fill_rate_link')
     list_filter = ('day', 'allowed_grades')
     search_fields = ('name',)
+    # explicit, since the annotated queryset isn't ordered for the autocomplete pages
+    ordering = ('day', 'name')
     filter_horizontal = ('allowed_grades', )
     readonly_fields = ('bookings_count','spots_left')
-    actions = ['export_activities_csv']
+    actions = ['export_activities_csv', 'activity_rosters', 'capacity_what_if']
 
     fieldsets = (
-        (None, {'fields': ('name','day', 'time')}),
+        (None, {'fields': ('name','day', 'time', ('start_time', 'end_time'))}),
         ('Capacity & Grades', {'fields': ('capacity','allowed_grades','bookings_count','spots_left')}),
     )
 
@@ -47,30 +143,163 @@ class ActivityAdmin(ImportExportModelAdmin):
 
     def get_queryset(self, request):
         qs = super().get_queryset(request)
-        return qs.annotate(_bookings=Count('bookings'))
+        return qs.annotate(_bookings=Count('bookings')).prefetch_related('allowed_grades')
 
+    # from the annotation, not a COUNT per row
     def bookings_count(self, obj):
-        return obj.bookings.count()
+        return obj._bookings
     bookings_count.short_description = "Bookings"
 
-    # admin action to export activities
+    def spots_left(self, obj):
+        return "Unlimited" if obj.capacity == 0 else obj.capacity - obj._bookings
+    spots_left.short_description = "Spots left"
+
+    # admin action to export activities (runs in the background)
     def export_activities_csv(self, request, queryset):
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename=activities.csv'
-        writer = csv.writer(response)
-        writer.writerow(['ID','Name','Day','Capacity','BookingsCount','AllowedGrades'])
-        for a in queryset:
-            writer.writerow([a.pk, a.name, a.day, a.capacity, a.bookings.count(), ", ".join([g.name for g in a.allowed_grades.all()])])
-        return response
+        job = jobs.enqueue('export_activities', request.user, ids=list(queryset.values_list('pk', flat=True)))
+        return redirect('admin:bookings_job_change', job.pk)
     export_activities_csv.short_description = "Export selected activities to CSV"
 
+    def activity_rosters(self, request, queryset):
+        job = jobs.enqueue('roster_bundle', request.user, activity_ids=list(queryset.values_list('pk', flat=True)))
+        return redirect('admin:bookings_job_change', job.pk)
+    activity_rosters.short_description = "Printable rosters (ZIP) for selected activities"
+
+    def get_search_results(self, request, queryset, search_term):
+        queryset, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        student = _booking_autocomplete_param(request, 'activity', 'student')
+        if student:
+            queryset = queryset.filter(allowed_grades__studentprofile=student)
+        return queryset, may_have_duplicates
+
+    def capacity_what_if(self, request, queryset):
+        ids = ",".join(str(pk) for pk in queryset.values_list('pk', flat=True))
+        return redirect(f"{reverse('admin:bookings_activity_capacity_planner')}?ids={ids}")
+    capacity_what_if.short_description = "What-if capacities for selected activities"
+
+    # try capacities / allowed grades against past demand (see bookings.capacity)
+    def capacity_planner(self, request):
+        data = request.POST if request.method == 'POST' else request.GET
+        past_terms = list(Term.objects.filter(is_current=False))
+        if 'run' in data:
+            chosen = {t.pk for t in past_terms if str(t.pk) in data.getlist('term')}
+            include_current = 'current' in data
+        else:
+            chosen, include_current = {t.pk for t in past_terms}, True
+        demand = capacity.Demand.load([t for t in past_terms if t.pk in chosen], include_current)
+
+        ids = [int(pk) for pk in data.get('ids', '').split(',') if pk.isdigit()]
+        order = lambda pk: (demand.activities[pk]['day'], demand.activities[pk]['name'])
+        editable = sorted((pk for pk in demand.activities if not ids or pk in ids), key=order)
+        scale = data.get('scale', '100')
+        scale = int(scale) if scale.isdigit() else 100
+
+        new_capacity, new_grades = {}, {}
+        for pk in editable:
+            info = demand.activities[pk]
+            cap = data.get(f'cap-{pk}', '')
+            cap = int(cap) if cap.isdigit() else info['capacity']
+            if scale != 100 and cap == info['capacity'] and cap:
+                cap = max(round(cap * scale / 100), 1)
+            new_capacity[pk] = cap
+            grades = data.get(f'grades-{pk}')
+            if grades is not None:
+                new_grades[pk] = {g.strip() for g in grades.split(',') if g.strip()}
+
+        started = time.perf_counter()
+        baseline = capacity.simulate(demand)
+        scenario = capacity.simulate(demand, new_capacity, new_grades)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        rows = [
+            {
+                **scenario['rows'][pk],
+                'before': baseline['rows'][pk],
+                'cap_input': data.get(f'cap-{pk}', demand.activities[pk]['capacity']),
+                'grades_input': data.get(f'grades-{pk}', ", ".join(sorted(demand.activities[pk]['grades']))),
+            }
+            for pk in editable
+        ]
+        return TemplateResponse(request, 'admin/bookings/activity/capacity_planner.html', {
+            **self.admin_site.each_context(request),
+            'title': "Capacity what-if",
+            'opts': self.model._meta,
+            'past_terms': past_terms,
+            'chosen': chosen,
+            'include_current': include_current,
+            'terms_averaged': demand.terms,
+            'ids': data.get('ids', ''),
+            'scale': scale,
+            'rows': rows,
+            'baseline': baseline,
+            'scenario': scenario,
+            'elapsed_ms': elapsed_ms,
+        })
+
+    def fill_rate_link(self, obj):
+        return format_html('<a href="{}">Chart</a>', reverse('admin:bookings_activity_fill_rate', args=[obj.pk]))
+    fill_rate_link.short_description = "Fill rate"
+
+    def get_urls(self):
+        urls = super().get_urls()
+        custom = [
+            path('<int:pk>/fill-rate/', self.admin_site.admin_view(self.fill_rate), name='bookings_activity_fill_rate'),
+            path('capacity-planner/', self.admin_site.admin_view(self.capacity_planner), name='bookings_activity_capacity_planner'),
+        ]
+        return custom + urls
+
+    # how the activity filled up, from the FillRate rollup
+    def fill_rate(self, request, pk):
+        activity = get_object_or_404(Activity, pk=pk)
+        days = request.GET.get('days', '7')
+        days = int(days) if days.isdigit() and int(days) in FILL_RATE_WINDOWS else 7
+        end = timezone.now()
+        start = end - timedelta(days=days)
+        resolution, steps = fillrate.series(activity, start, end)
+        peak = max(booked for _, booked in steps)
+        ceiling = max(activity.capacity, peak, 1)
+        return TemplateResponse(request, 'admin/bookings/activity/fill_rate.html', {
+            **self.admin_site.each_context(request),
+            'title': f"Fill rate: {activity}",
+            'opts': self.model._meta,
+            'original': activity,
+            'activity': activity,
+            'days': days,
+            'windows': FILL_RATE_WINDOWS,
+            'resolution': resolution,
+            'steps': steps,
+            'start': steps[0][0],
+            'end': end,
+            'peak': peak,
+            'ceiling': ceiling,
+            'points': fillrate.polyline(steps, steps[0][0], end, ceiling),
+            'capacity_y': 240 - activity.capacity / ceiling * 240 if activity.capacity else None,
+        })
+
 
 @admin.register(StudentProfile)
 class StudentProfileAdmin(ImportExportModelAdmin):
     resource_class = StudentProfileResource
     list_display = ('name', 'user__email','grade')
     search_fields = ('name',)
+    search_help_text = "Name, email, grade or a booked activity; partial words match."
     list_filter = ('grade',)
+    list_select_related = ('user', 'grade')
+    ordering = ('name',)
+    actions = ['enroll_selected']
+
+    def enroll_selected(self, request, queryset):
+        students = list(queryset.only('pk', 'name', 'grade_id'))
+        return enroll_students(self, request, queryset, students)
+    enroll_selected.short_description = "Enroll selected students in an activity"
+
+    def get_search_results(self, request, queryset, search_term):
+        activity = _booking_autocomplete_param(request, 'student', 'activity')
+        if activity:
+            queryset = queryset.filter(grade__activities=activity).select_related('grade')
+        if not search_term:
+            return queryset, False
+        return queryset.filter(pk__in=search.search_students(search_term)), False
 
     # def user_link(self, obj):
     #     url = admin.site.reverse('admin:auth_user_change', args=(obj.user.pk,))
@@ -89,14 +318,35 @@ class BookingAdmin(ImportExportModelAdmin):
     list_display = ('student__name', 'student_email', "activity", 'student_grade','activity_day','date_created','attended')
     list_filter = ('activity__day','activity__name','attended')
     search_fields = ('student__user__username','student__user__email','activity__name')
+    search_help_text = "Student name, email or grade, or the activity name; partial words match."
     date_hierarchy = 'date_created'
+    # paginated JSON lookups instead of <select>s listing every student and activity
+    autocomplete_fields = ('student', 'activity')
     actions = ['export_bookings_csv','mark_attended']
+    # the table is large: no COUNT(*) per page load, keyset links for deep browsing
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    change_list_template = 'admin/bookings/booking/change_list.html'
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
+
+    class Media:
+        js = ('bookings/booking_autocomplete.js',)
 
     # def student_link(self, obj):
     #     url = reverse('admin:auth_user_change', args=(obj.student.user.pk,))
     #     return format_html('<a href="{}">{}</a>', url, obj.student.user.get_full_name() or obj.student.user.username)
     # student_link.short_description = "Student"
 
+    def get_search_results(self, request, queryset, search_term):
+        # students via the search index; activities are few enough to match directly
+        if not search_term:
+            return queryset, False
+        student_ids = search.search_students(search_term, fields=(SearchTerm.STUDENT,))
+        activity_ids = search.search_activities(search_term)
+        return queryset.filter(Q(student_id__in=student_ids) | Q(activity_id__in=activity_ids)), False
+
     def student_email(self, obj):
         return obj.student.user.email
     student_email.short_description = "Email"
@@ -114,23 +364,45 @@ class BookingAdmin(ImportExportModelAdmin):
         return obj.activity.day
     activity_day.short_description = "Day"
 
-    # Export selected bookings to CSV
+    # Export selected bookings to CSV (runs in the background)
     def export_bookings_csv(self, request, queryset):
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename=bookings.csv'
-        writer = csv.writer(response)
-        writer.writerow(['BookingID','Student','Email','Grade','Activity','Day','DateCreated','Attended'])
-        for b in queryset.select_related('student__user','activity'):
-            writer.writerow([b.pk, b.student.user, b.student.user.email, b.student.grade.name, b.activity.name, b.day, b.date_created.isoformat(), b.attended])
-        return response
+        job = jobs.enqueue('export_bookings', request.user, ids=list(queryset.values_list('pk', flat=True)))
+        return redirect('admin:bookings_job_change', job.pk)
     export_bookings_csv.short_description = "Export selected bookings to CSV"
 
     # mark selected as attended
     def mark_attended(self, request, queryset):
-        updated = queryset.update(attended=True)
+        with tenancy.atomic():
+            bookings = list(queryset.filter(attended=False).select_for_update())
+            updated = Booking.objects.filter(pk__in=[b.pk for b in bookings]).update(attended=True)
+            journal.record_many(BookingEvent.ATTENDANCE, bookings, request.user, attended=True)
         self.message_user(request, f"{updated} booking(s) marked as attended.")
     mark_attended.short_description = "Mark selected bookings as attended"
 
+    # Journal every admin write; the admin already wraps these in a transaction
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if not change:
+            journal.record(BookingEvent.BOOK, obj, request.user)
+            return
+        changed = set(form.changed_data)
+        if 'activity' in changed:
+            journal.record(BookingEvent.UNBOOK, obj, request.user, activity_id=form.initial['activity'])
+            journal.record(BookingEvent.BOOK, obj, request.user)
+        if 'attended' in changed:
+            journal.record(BookingEvent.ATTENDANCE, obj, request.user, attended=obj.attended)
+        changed -= {'activity', 'attended'}
+        if changed:
+            journal.record(BookingEvent.ADMIN_EDIT, obj, request.user, fields=sorted(changed))
+
+    def delete_model(self, request, obj):
+        journal.record(BookingEvent.UNBOOK, obj, request.user)
+        super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        journal.record_many(BookingEvent.UNBOOK, queryset, request.user)
+        super().delete_queryset(request, queryset)
+
     # Add a custom report to admin URLs
     def get_urls(self):
         urls = super().get_urls()
@@ -140,10 +412,119 @@ class BookingAdmin(ImportExportModelAdmin):
         return custom + urls
 
     def booking_report(self, request):
-        # aggregated counts per activity
-        activities = Activity.objects.annotate(bookings_count=Count('bookings')).order_by('day','name')
-        context = dict(
-            self.admin_site.each_context(request),
-            activities=activities,
+        # aggregated counts per activity, built by the job worker
+        job = jobs.enqueue('booking_report', request.user)
+        return redirect('admin:bookings_job_change', job.pk)
+
+
+class AttendanceInline(admin.TabularInline):
+    model = Attendance
+    fields = ('booking', 'archived_booking', 'present')
+    readonly_fields = ('booking', 'archived_booking')
+    extra = 0
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(Occurrence)
+class OccurrenceAdmin(admin.ModelAdmin):
+    list_display = ('activity', 'date', 'present_count', 'marked_count')
+    list_filter = ('activity__day', 'activity__name')
+    date_hierarchy = 'date'
+    list_select_related = ('activity',)
+    inlines = [AttendanceInline]
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            _marked=Count('attendance'),
+            _present=Count('attendance', filter=Q(attendance__present=True)),
         )
-        return TemplateResponse(request, "admin/activities/booking_report.html", context)
+
+    def present_count(self, obj):
+        return obj._present
+    present_count.short_description = "Present"
+
+    def marked_count(self, obj):
+        return obj._marked
+    marked_count.short_description = "On register"
+
+
+@admin.register(ArchivedBooking)
+class ArchivedBookingAdmin(admin.ModelAdmin):
+    list_display = ('student_name', 'student_email', 'activity_name', 'grade', 'day', 'date_created', 'attended', 'term')
+    list_filter = ('term', 'day', 'grade')
+    search_fields = ('student_name', 'student_email', 'activity_name')
+    list_select_related = ('term',)
+    actions = ['export_archived_bookings_csv']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def export_archived_bookings_csv(self, request, queryset):
+        job = jobs.enqueue('export_archived_bookings', request.user, ids=list(queryset.values_list('pk', flat=True)))
+        return redirect('admin:bookings_job_change', job.pk)
+    export_archived_bookings_csv.short_description = "Export selected archived bookings to CSV"
+
+
+@admin.register(BookingEvent)
+class BookingEventAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'booking_id', 'student_id', 'activity_id', 'day', 'actor_id', 'date_created')
+    list_filter = ('kind', 'day')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('__str__', 'kind', 'status', 'percent', 'created_by', 'date_created', 'download_link')
+    list_filter = ('kind', 'status')
+    readonly_fields = ('kind', 'params', 'status', 'progress', 'total', 'percent', 'download_link',
+                       'error', 'created_by', 'date_created', 'date_started', 'date_finished')
+    exclude = ('result',)
+    change_form_template = 'admin/bookings/job/change_form.html'
+
+    def has_add_permission(self, request):
+        return False
+
+    def download_link(self, obj):
+        if obj.status != Job.DONE or not obj.result:
+            return "-"
+        url = reverse('admin:bookings_job_download', args=(obj.pk,))
+        return format_html('<a href="{}">Download</a>', url)
+    download_link.short_description = "File"
+
+    def get_urls(self):
+        urls = super().get_urls()
+        custom = [
+            path('<int:pk>/status/', self.admin_site.admin_view(self.job_status), name='bookings_job_status'),
+            path('<int:pk>/download/', self.admin_site.admin_view(self.job_download), name='bookings_job_download'),
+        ]
+        return custom + urls
+
+    def job_status(self, request, pk):
+        job = get_object_or_404(Job, pk=pk)
+        return JsonResponse({
+            'status': job.status,
+            'progress': job.progress,
+            'total': job.total,
+            'percent': job.percent(),
+            'download': reverse('admin:bookings_job_download', args=(job.pk,)) if job.status == Job.DONE else None,
+        })
+
+    def job_download(self, request, pk):
+        job = get_object_or_404(Job, pk=pk)
+        if job.status != Job.DONE or not job.result:
+            raise Http404("Job has no result yet.")
+        return FileResponse(job.result.open('rb'), as_attachment=True, filename=job.result.name.rsplit('-', 1)[-1])
@@ -0,0 +1,93 @@
+# activities/attendance.py
+"""
+Dated attendance.
+
+An ``Occurrence`` is one session of an activity on a calendar date. They
+aren't generated for the whole term up front: ``occurrence()`` creates the
+row the first time a register is taken for that date. ``mark()`` writes the
+whole register (one ``Attendance`` row per booking) with a single upsert,
+and ``term_summary()`` works out each student's term percentage in one
+grouped query.
+"""
+from datetime import timedelta
+
+from django.db.models import Count, ExpressionWrapper, F, FloatField, Q
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import journal, tenancy
+from .models import Activity, Attendance, BookingEvent, Occurrence
+
+WEEKDAYS = [key for key, _ in Activity.DAYS]
+
+
+def last_date(day, today=None):
+    """The latest date on or before ``today`` that falls on ``day``."""
+    today = today or timezone.localdate()
+    return today - timedelta(days=(today.weekday() - WEEKDAYS.index(day)) % 7)
+
+
+def occurrence(activity, date, create=True):
+    """The ``activity`` session on ``date``, created if needed (or None if ``create`` is off)."""
+    if WEEKDAYS[date.weekday()] != activity.day:
+        raise ValueError(f"{activity.name} doesn't run on {date:%A}s.")
+    if not create:
+        return Occurrence.objects.filter(activity=activity, date=date).first()
+    return Occurrence.objects.get_or_create(activity=activity, date=date)[0]
+
+
+def register(activity, date):
+    """``[(booking, present or None)]`` for the activity's bookings on ``date``."""
+    session = occurrence(activity, date, create=False)
+    marks = {}
+    if session is not None:
+        marks = dict(session.attendance.values_list('booking_id', 'present'))
+    bookings = (
+        activity.bookings.select_related('student__user', 'student__grade')
+        .order_by('student__name')
+    )
+    return [(b, marks.get(b.pk)) for b in bookings]
+
+
+def mark(activity, date, present_ids, actor=None):
+    """
+    Take the register for ``activity`` on ``date``: bookings in
+    ``present_ids`` present, every other booking absent. Returns the
+    Occurrence. Marks that changed are journaled.
+    """
+    present_ids = set(present_ids)
+    with tenancy.atomic():
+        session = occurrence(activity, date)
+        before = dict(session.attendance.values_list('booking_id', 'present'))
+        bookings = list(activity.bookings.all())
+        rows = [Attendance(occurrence=session, booking=b, present=b.pk in present_ids) for b in bookings]
+        # MySQL's ON DUPLICATE KEY UPDATE doesn't take a conflict target
+        target = ['occurrence', 'booking'] if tenancy.get_connection().features.supports_update_conflicts_with_target else None
+        Attendance.objects.bulk_create(rows, update_conflicts=True, unique_fields=target, update_fields=['present'])
+
+        for present in (True, False):
+            changed = [b for b in bookings if (b.pk in present_ids) == present and before.get(b.pk) != present]
+            if changed:
+                journal.record_many(BookingEvent.ATTENDANCE, changed, actor, attended=present, date=date.isoformat())
+    return session
+
+
+def term_summary(term, activity=None):
+    """
+    Per-student attendance over ``term``'s registers: rows of student id and
+    name, sessions, attended and percent, lowest percentage first. Marks of
+    archived bookings count too, so past terms report the same as when
+    they were current (under the name the student had then).
+    """
+    marks = Attendance.objects.filter(occurrence__in=Occurrence.objects.in_term(term))
+    if activity is not None:
+        marks = marks.filter(occurrence__activity=activity)
+    return (
+        marks.values(
+            student_id=Coalesce('booking__student_id', 'archived_booking__student_id'),
+            student_name=Coalesce('booking__student__name', 'archived_booking__student_name'),
+        )
+        .annotate(sessions=Count('pk'), attended=Count('pk', filter=Q(present=True)))
+        .annotate(percent=ExpressionWrapper(F('attended') * 100.0 / F('sessions'), output_field=FloatField()))
+        .order_by('percent', 'student_name')
+    )
@@ -0,0 +1,73 @@
+# activities/caching.py
+"""
+Version counters for cache keys.
+
+Readers build keys from ``get_version()``; writers call ``bump_version()``
+and every cached entry built from the old version simply stops being used.
+Counters start from the clock, so a cache flush can never hand out a
+version that was already seen.
+
+The counters need a cache shared by every worker process (Redis or
+Memcached), where ``incr`` is atomic and keeps the key's timeout; see
+CACHES in the settings.
+"""
+import time
+
+from django.core.cache import cache
+
+from . import tenancy
+
+# how long a version counter is kept without being bumped
+VERSION_TIMEOUT = 60 * 60 * 24 * 30
+
+
+def version_key(scope, ident=None):
+    """The cache key of a version counter, for reading it together with other keys."""
+    return f'v:{scope}' if ident is None else f'v:{scope}:{ident}'
+
+
+def get_version(scope, ident=None):
+    return cache.get_or_set(version_key(scope, ident), lambda: int(time.time() * 1000), VERSION_TIMEOUT)
+
+
+def get_versions(scope, idents):
+    """``{ident: version}`` for many idents with a single cache round trip."""
+    keys = {version_key(scope, i): i for i in idents}
+    found = cache.get_many(keys)
+    versions = {keys[k]: v for k, v in found.items()}
+    for ident in set(idents) - set(versions):
+        versions[ident] = get_version(scope, ident)
+    return versions
+
+
+def get_current(key, scope, ident=None):
+    """
+    ``(value, version)``: what ``set_current()`` stored under ``key`` if it
+    was built at the scope's current version (None otherwise), read together
+    with that version in one round trip.
+    """
+    vkey = version_key(scope, ident)
+    found = cache.get_many([key, vkey])
+    version = found[vkey] if vkey in found else get_version(scope, ident)
+    entry = found.get(key)
+    if entry is not None and entry[0] == version:
+        return entry[1], version
+    return None, version
+
+
+def set_current(key, value, version, timeout):
+    """Cache ``value`` as built at ``version`` (read before building it)."""
+    cache.set(key, (version, value), timeout)
+
+
+def _bump(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, int(time.time() * 1000), VERSION_TIMEOUT)
+
+
+def bump_version(scope, ident=None):
+    """Invalidate ``scope`` once the current transaction (if any) commits."""
+    key = version_key(scope, ident)
+    tenancy.on_commit(lambda: _bump(key))
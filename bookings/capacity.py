@@ -0,0 +1,132 @@
+# activities/capacity.py
+"""
+Capacity what-if simulator.
+
+``Demand.load()`` reduces past bookings to the average seats wanted per
+activity and grade per term, with a few grouped queries. ``simulate()``
+runs a scenario (new capacities and/or allowed grades) over those numbers
+without touching the database, so many scenarios can be tried in a row.
+
+Only bookings are recorded, not turned-away attempts, so the demand for an
+activity that filled up is a lower bound; those are flagged ``censored``.
+A student who misses their activity is assumed to take any open activity
+their grade is allowed on the same day (the one most popular with their
+grade first); whoever is still left is unplaced.
+"""
+import math
+from collections import defaultdict
+
+from django.db.models import Count
+
+from .models import Activity, ArchivedBooking, Booking
+
+
+class Demand:
+    def __init__(self, activities, wanted, terms):
+        self.activities = activities  # id -> {'name', 'day', 'capacity', 'grades'}
+        self.wanted = wanted          # id -> {grade name: seats per term}
+        self.terms = terms            # number of terms averaged
+
+    @classmethod
+    def load(cls, terms=(), include_current=True):
+        """Demand from the archived bookings of ``terms`` and, optionally, the live bookings."""
+        activities = {
+            pk: {'name': name, 'day': day, 'capacity': capacity, 'grades': set()}
+            for pk, name, day, capacity in Activity.objects.values_list('pk', 'name', 'day', 'capacity')
+        }
+        for activity_id, grade in Activity.allowed_grades.through.objects.values_list('activity_id', 'grade__name'):
+            activities[activity_id]['grades'].add(grade)
+        by_name = {(a['name'], a['day']): pk for pk, a in activities.items()}
+
+        totals = defaultdict(lambda: defaultdict(int))
+        seen_terms = set()
+        archived = (
+            ArchivedBooking.objects.filter(term__in=terms)
+            .values_list('term_id', 'activity_id', 'activity_name', 'day', 'grade')
+            .annotate(n=Count('id')).order_by()
+        )
+        for term_id, activity_id, name, day, grade, n in archived:
+            # activities deleted since can't be re-planned
+            activity_id = activity_id if activity_id in activities else by_name.get((name, day))
+            if activity_id is not None:
+                totals[activity_id][grade] += n
+                seen_terms.add(term_id)
+        if include_current:
+            live = (
+                Booking.objects.values_list('activity_id', 'student__grade__name')
+                .annotate(n=Count('id')).order_by()
+            )
+            for activity_id, grade, n in live:
+                totals[activity_id][grade] += n
+                seen_terms.add(None)
+
+        count = len(seen_terms) or 1
+        wanted = {
+            activity_id: {grade: n / count for grade, n in grades.items()}
+            for activity_id, grades in totals.items()
+        }
+        return cls(activities, wanted, len(seen_terms))
+
+
+def simulate(demand, capacity=None, grades=None):
+    """
+    Run one scenario. ``capacity`` and ``grades`` map activity ids to a new
+    capacity (0 = unlimited) or set of allowed grade names; anything not
+    given keeps its current value. Returns ``{'rows': {id: row}, 'totals': {...},
+    'unplaced_by_grade': {...}}``.
+    """
+    capacity = capacity or {}
+    grades = grades or {}
+    rows, spare = {}, {}
+    left = defaultdict(float)  # (day, grade) -> seats wanted but not had
+
+    for pk, info in demand.activities.items():
+        cap = capacity.get(pk, info['capacity'])
+        allowed = grades.get(pk, info['grades'])
+        wanted = demand.wanted.get(pk, {})
+        eligible = sum(n for g, n in wanted.items() if g in allowed)
+        placed = eligible if cap == 0 else min(eligible, cap)
+        overflow = (eligible - placed) / eligible if eligible else 0
+        for g, n in wanted.items():
+            left[info['day'], g] += n * overflow if g in allowed else n
+        spare[pk] = math.inf if cap == 0 else cap - placed
+        rows[pk] = {
+            'id': pk, 'name': info['name'], 'day': info['day'],
+            'capacity': cap, 'grades': allowed,
+            'wanted': sum(wanted.values()), 'first_choice': placed, 'spill_in': 0.0,
+            'censored': bool(info['capacity']) and sum(wanted.values()) >= info['capacity'],
+        }
+
+    unplaced = defaultdict(float)
+    for (day, grade), n in sorted(left.items()):
+        options = sorted(
+            (pk for pk, row in rows.items() if row['day'] == day and grade in row['grades'] and spare[pk] > 0),
+            key=lambda pk: (-demand.wanted.get(pk, {}).get(grade, 0), rows[pk]['name']),
+        )
+        for pk in options:
+            if n <= 0:
+                break
+            take = min(n, spare[pk])
+            spare[pk] -= take
+            rows[pk]['spill_in'] += take
+            n -= take
+        if n > 1e-9:
+            unplaced[grade] += n
+
+    for row in rows.values():
+        row['placed'] = row['first_choice'] + row['spill_in']
+        row['fill'] = row['placed'] / row['capacity'] if row['capacity'] else None
+
+    wanted = sum(row['wanted'] for row in rows.values())
+    first_choice = sum(row['first_choice'] for row in rows.values())
+    return {
+        'rows': rows,
+        'totals': {
+            'wanted': wanted,
+            'first_choice': first_choice,
+            'placed': sum(row['placed'] for row in rows.values()),
+            'unplaced': sum(unplaced.values()),
+            'first_choice_rate': first_choice / wanted if wanted else None,
+        },
+        'unplaced_by_grade': dict(sorted(unplaced.items())),
+    }
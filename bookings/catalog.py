@@ -0,0 +1,65 @@
+# activities/catalog.py
+"""
+Cached activity catalog shared by ``activity_list`` and the JSON API.
+
+The static part of the catalog (names, times, venues, capacities) is cached
+per grade under the 'activities' version, so it is rebuilt only when an
+activity changes. Vacancy changes with every booking and is overlaid from
+``Activity.booked_count`` and live seat holds with two small queries.
+"""
+from . import seats
+from .caching import get_current, set_current
+from .models import Activity, Booking
+
+CATALOG_FIELDS = ['id', 'name', 'day', 'time', 'start_time', 'end_time', 'instructor', 'venue', 'capacity']
+BOOKING_FIELDS = ['id', 'activity_id', 'day', 'date_created', 'attended']
+
+CACHE_TIMEOUT = 60 * 60
+
+
+def _rows(queryset, fields):
+    return [dict(zip(fields, values)) for values in queryset.values_list(*fields)]
+
+
+def grade_catalog(grade_id=None):
+    """Activities open to ``grade_id`` (all activities for None), ordered by day and name."""
+    key = f'catalog:{grade_id}'
+    rows, version = get_current(key, 'activities')
+    if rows is None:
+        activities = Activity.objects.order_by('day', 'name')
+        if grade_id is not None:
+            activities = activities.filter(allowed_grades=grade_id)
+        rows = _rows(activities, CATALOG_FIELDS)
+        set_current(key, rows, version, CACHE_TIMEOUT)
+    return rows
+
+
+def with_vacancy(rows, student=None):
+    """
+    Copies of catalog rows with live ``booked`` and ``spots_left``. Seats
+    held in the booking wizard by anyone but ``student`` are not left.
+    """
+    ids = [r['id'] for r in rows]
+    booked = dict(Activity.objects.filter(pk__in=ids).values_list('pk', 'booked_count'))
+    held = seats.held_counts(ids, student)
+    result = []
+    for row in rows:
+        n = booked.get(row['id'], 0)
+        spots = "Unlimited" if row['capacity'] == 0 else max(row['capacity'] - n - held.get(row['id'], 0), 0)
+        result.append({**row, 'booked': n, 'spots_left': spots})
+    return result
+
+
+def student_bookings(student_id):
+    """The student's bookings, cached until their next booking change."""
+    key = f'bookings:{student_id}'
+    rows, version = get_current(key, 'student', student_id)
+    if rows is None:
+        rows = _rows(Booking.objects.filter(student_id=student_id).order_by('activity__day', 'pk'), BOOKING_FIELDS)
+        set_current(key, rows, version, CACHE_TIMEOUT)
+    return rows
+
+
+def encode(rows, fields):
+    """Array-of-rows encoding: ``{"fields": [...], "rows": [[...], ...]}``."""
+    return {'fields': fields, 'rows': [[row[f] for f in fields] for row in rows]}
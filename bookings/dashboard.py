@@ -0,0 +1,91 @@
+# activities/dashboard.py
+"""
+Admin dashboard panels.
+
+Each panel is computed by its own async function and rendered to an HTML
+fragment that is cached on its own TTL. The TTLs are staggered so panels
+don't all expire (and recompute) on the same request. The dashboard page
+inlines the fragments that are cached and the browser fetches the rest from
+``dashboard_panel``, one request per panel, so they load concurrently and
+the page paints as soon as the shell is sent.
+"""
+import asyncio
+
+from django.core.cache import cache
+from django.db.models import Count, ExpressionWrapper, F, FloatField
+from django.template.loader import render_to_string
+
+from .models import Activity, Booking, StudentProfile
+
+
+async def summary():
+    per_student = Booking.objects.order_by().values('student').annotate(total=Count('id'))
+    total_students, booked_all_7, booked_exactly_3, booked_between = await asyncio.gather(
+        StudentProfile.objects.acount(),
+        per_student.filter(total=7).acount(),
+        per_student.filter(total=3).acount(),
+        per_student.filter(total__gt=3, total__lt=7).acount(),
+    )
+    return {
+        'total_students': total_students,
+        'booked_all_7': booked_all_7,
+        'booked_exactly_3': booked_exactly_3,
+        'booked_between': booked_between,
+    }
+
+
+async def top_activities():
+    """Top 5 by percentage booked, excluding unlimited capacity."""
+    qs = (
+        Activity.objects.exclude(capacity=0)
+        .annotate(
+            num_bookings=F('booked_count'),
+            booking_percentage=ExpressionWrapper(F('booked_count') * 100.0 / F('capacity'), output_field=FloatField()),
+        )
+        .order_by('-booking_percentage')[:5]
+    )
+    return {'top_activities': [a async for a in qs]}
+
+
+async def unlimited_activities():
+    qs = Activity.objects.filter(capacity=0).annotate(num_bookings=F('booked_count')).order_by('-booked_count')[:5]
+    return {'unlimited_activities': [a async for a in qs]}
+
+
+async def students_by_grade():
+    qs = StudentProfile.objects.values('grade__name').annotate(total=Count('id')).order_by('grade')
+    return {'students_by_grade': [row async for row in qs]}
+
+
+async def zero_bookings():
+    qs = Activity.objects.filter(booked_count=0).order_by('day', 'name')
+    return {'activities': [a async for a in qs]}
+
+
+# name: (compute, cache TTL in seconds)
+PANELS = {
+    'summary': (summary, 30),
+    'top_activities': (top_activities, 45),
+    'unlimited_activities': (unlimited_activities, 60),
+    'students_by_grade': (students_by_grade, 300),
+    'zero_bookings': (zero_bookings, 75),
+}
+
+
+def _key(name):
+    return f'dashboard:{name}'
+
+
+async def cached_panels():
+    """{name: html} for the panels currently in the cache."""
+    found = await cache.aget_many([_key(name) for name in PANELS])
+    return {name: found[_key(name)] for name in PANELS if _key(name) in found}
+
+
+async def render_panel(name):
+    html = await cache.aget(_key(name))
+    if html is None:
+        compute, ttl = PANELS[name]
+        html = render_to_string(f'activities/panels/{name}.html', await compute())
+        await cache.aset(_key(name), html, ttl)
+    return html
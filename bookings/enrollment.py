@@ -0,0 +1,89 @@
+# activities/enrollment.py
+"""
+Bulk enrollment: book many students into one activity in one pass.
+
+Eligibility, same-day conflicts and capacity are worked out with set
+operations over three prefetched queries, and the bookings are written
+with a single ``bulk_create`` (journaled with ``record_many``).
+"""
+from collections import defaultdict
+
+from . import journal, search, tenancy
+from .models import Activity, Booking, BookingEvent, SearchTerm, SeatHold
+
+ALREADY_BOOKED = 'already booked'
+CONFLICT = 'conflict'
+INELIGIBLE = 'ineligible'
+FULL = 'full'
+
+
+class Result:
+    def __init__(self):
+        self.enrolled = []                # StudentProfile
+        self.skipped = defaultdict(list)  # reason -> [StudentProfile]
+
+    def summary(self):
+        parts = [f"{len(self.enrolled)} enrolled"]
+        parts += [f"{len(students)} skipped ({reason})" for reason, students in self.skipped.items()]
+        return ", ".join(parts)
+
+
+def enroll(students, activity, actor=None, dry_run=False):
+    """Book ``students`` (StudentProfiles) into ``activity``; returns a Result."""
+    students = sorted({s.pk: s for s in students}.values(), key=lambda s: s.name)
+    ids = {s.pk for s in students}
+    result = Result()
+
+    with tenancy.atomic():
+        # the row lock keeps concurrent bookings from taking the seats we count
+        activity = Activity.objects.select_for_update().get(pk=activity.pk)
+        allowed = set(activity.allowed_grades.values_list('pk', flat=True))
+        same_day = dict(
+            Booking.objects.filter(student__in=ids, day=activity.day)
+            .values_list('student_id', 'activity_id')
+        )
+        booked_here = {sid for sid, aid in same_day.items() if aid == activity.pk}
+        conflicts = set(same_day) - booked_here
+        ineligible = {s.pk for s in students if s.grade_id not in allowed}
+
+        excluded = booked_here | conflicts | ineligible
+        eligible = [s for s in students if s.pk not in excluded]
+        if activity.capacity:
+            held = (
+                SeatHold.objects.active().filter(activity=activity)
+                .exclude(student__in=[s.pk for s in eligible]).count()
+            )
+            room = max(activity.capacity - activity.booked_count - held, 0)
+        else:
+            room = len(eligible)
+
+        for s in students:
+            if s.pk in booked_here:
+                result.skipped[ALREADY_BOOKED].append(s)
+            elif s.pk in conflicts:
+                result.skipped[CONFLICT].append(s)
+            elif s.pk in ineligible:
+                result.skipped[INELIGIBLE].append(s)
+        result.enrolled = eligible[:room]
+        if eligible[room:]:
+            result.skipped[FULL] = eligible[room:]
+
+        if dry_run or not result.enrolled:
+            return result
+
+        # A student booked onto another activity that day since the read
+        # above would fail the whole insert on (student, day); skip their row
+        # instead and report them as a conflict.
+        Booking.objects.bulk_create([
+            Booking(student_id=s.pk, activity=activity, day=activity.day) for s in result.enrolled
+        ], ignore_conflicts=True)
+        # MySQL doesn't hand back the new ids, and the journal needs them
+        bookings = list(Booking.objects.filter(activity=activity, student_id__in=[s.pk for s in result.enrolled]))
+        inserted = {b.student_id for b in bookings}
+        lost = [s for s in result.enrolled if s.pk not in inserted]
+        if lost:
+            result.skipped[CONFLICT] += lost
+            result.enrolled = [s for s in result.enrolled if s.pk in inserted]
+        journal.record_many(BookingEvent.BOOK, bookings, actor, bulk=True)
+        search.schedule_reindex(inserted, fields=(SearchTerm.ACTIVITY,))
+    return result
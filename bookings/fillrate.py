@@ -0,0 +1,170 @@
+# activities/fillrate.py
+"""
+Fill-rate time series: how quickly each activity's seats were taken.
+
+``FillRate`` rows hold the net bookings per activity in minute and hour
+buckets. ``compact()`` folds journal events past the cursor into them
+(run it periodically with ``manage.py compact_fill_rates``), and
+``backfill()`` rebuilds the table from ``Booking.date_created``. The cursor
+is one ``FillRateCursor`` row, locked and moved in the same transaction as
+each fold, so concurrent compactors take turns and never count an event
+twice. Minute rows
+are kept for ``MINUTE_RETENTION``; hour rows are kept for good. Charts read
+only the rollup, never the raw bookings.
+"""
+from collections import Counter
+from datetime import timedelta
+
+from django.db.models import Max, Sum
+from django.utils import timezone
+
+from . import tenancy
+from .journal import DELTAS, SETTLE_DELAY
+from .models import Booking, BookingEvent, FillRate, FillRateCursor
+
+MINUTE_RETENTION = timedelta(days=14)
+# windows up to this long are charted from minute rows
+MINUTE_WINDOW = timedelta(days=2)
+BATCH = 5000
+
+
+def bucket(moment, resolution):
+    moment = moment.replace(second=0, microsecond=0)
+    return moment.replace(minute=0) if resolution == FillRate.HOUR else moment
+
+
+def _add(counts, activity_id, moment, delta):
+    for resolution in (FillRate.MINUTE, FillRate.HOUR):
+        counts[activity_id, resolution, bucket(moment, resolution)] += delta
+
+
+def _fold(counts):
+    """Add ``{(activity_id, resolution, bucket): delta}`` into the table."""
+    counts = {key: n for key, n in counts.items() if n}
+    if not counts:
+        return
+    buckets = [key[2] for key in counts]
+    existing = {
+        row[:3]: row[3]
+        for row in FillRate.objects.filter(
+            activity_id__in={key[0] for key in counts},
+            bucket__range=(min(buckets), max(buckets)),
+        ).values_list('activity_id', 'resolution', 'bucket', 'booked')
+    }
+    rows = [
+        FillRate(
+            activity_id=activity_id, resolution=resolution, bucket=moment,
+            booked=existing.get((activity_id, resolution, moment), 0) + n,
+        )
+        for (activity_id, resolution, moment), n in counts.items()
+    ]
+    target = ['activity', 'resolution', 'bucket'] if tenancy.get_connection().features.supports_update_conflicts_with_target else None
+    FillRate.objects.bulk_create(
+        rows, batch_size=1000,
+        update_conflicts=True, unique_fields=target, update_fields=['booked'],
+    )
+
+
+def cursor(lock=False):
+    """The cursor row (created at 0 if missing); ``lock`` it until the transaction ends."""
+    FillRateCursor.objects.get_or_create(pk=1)
+    rows = FillRateCursor.objects.filter(pk=1)
+    return (rows.select_for_update() if lock else rows).get()
+
+
+def compact(batch=BATCH):
+    """Fold settled journal events past the cursor into the rollup; returns how many."""
+    settled = timezone.now() - SETTLE_DELAY
+    folded = 0
+    while True:
+        with tenancy.atomic():
+            position = cursor(lock=True)
+            events = list(
+                BookingEvent.objects.filter(pk__gt=position.last_event, kind__in=DELTAS, date_created__lte=settled)
+                .order_by('pk').values_list('pk', 'activity_id', 'kind', 'date_created')[:batch]
+            )
+            if not events:
+                break
+            counts = Counter()
+            for _, activity_id, kind, created in events:
+                _add(counts, activity_id, created, DELTAS[kind])
+            _fold(counts)
+            # moves even when the batch nets to nothing and no row changed
+            position.last_event = events[-1][0]
+            position.save(update_fields=['last_event'])
+        folded += len(events)
+    FillRate.objects.filter(resolution=FillRate.MINUTE, bucket__lt=timezone.now() - MINUTE_RETENTION).delete()
+    return folded
+
+
+def backfill():
+    """Rebuild the table from the live bookings' ``date_created``; returns the booking count."""
+    counts = Counter()
+    with tenancy.atomic():
+        # take the cursor first so later bookings are left to compact()
+        position = cursor(lock=True)
+        position.last_event = BookingEvent.objects.aggregate(m=Max('pk'))['m'] or 0
+        rows = Booking.objects.order_by().values_list('activity_id', 'date_created')
+        total = 0
+        for activity_id, created in rows.iterator(chunk_size=5000):
+            _add(counts, activity_id, created, 1)
+            total += 1
+        FillRate.objects.all().delete()
+        recent = timezone.now() - MINUTE_RETENTION
+        counts = {
+            key: n for key, n in counts.items()
+            if key[1] == FillRate.HOUR or key[2] >= recent
+        }
+        _fold(counts)
+        position.save(update_fields=['last_event'])
+    return total
+
+
+def series(activity, start, end=None, points=200):
+    """
+    The activity's booked count over ``[start, end]`` as ``(resolution,
+    [(moment, booked)])``, thinned to at most ``points`` steps.
+    """
+    now = timezone.now()
+    end = end or now
+    fine = end - start <= MINUTE_WINDOW and start >= now - MINUTE_RETENTION
+    resolution = FillRate.MINUTE if fine else FillRate.HOUR
+    start = bucket(start, FillRate.HOUR)
+    rows = FillRate.objects.filter(activity=activity)
+    booked = rows.filter(resolution=FillRate.HOUR, bucket__lt=start).aggregate(n=Sum('booked'))['n'] or 0
+
+    steps = [(start, booked)]
+    for moment, delta in (
+        rows.filter(resolution=resolution, bucket__gte=start, bucket__lte=end)
+        .order_by('bucket').values_list('bucket', 'booked')
+    ):
+        booked += delta
+        steps.append((moment, booked))
+    steps.append((end, booked))
+    return resolution, downsample(steps, start, end, points)
+
+
+def downsample(steps, start, end, points):
+    """Keep the last step in each of ``points`` equal time slices (the curve is a step function)."""
+    if len(steps) <= points:
+        return steps
+    width = (end - start) / points
+    kept = {}
+    for moment, booked in steps:
+        kept[min(int((moment - start) / width), points - 1)] = (moment, booked)
+    return [steps[0]] + [kept[i] for i in sorted(kept)]
+
+
+def polyline(steps, start, end, ceiling, width=800, height=240):
+    """SVG ``points`` for the step curve of ``steps`` scaled to ``width`` x ``height``."""
+    span = (end - start).total_seconds() or 1
+    ceiling = ceiling or 1
+    points, last_y = [], None
+    for moment, booked in steps:
+        x = round((moment - start).total_seconds() / span * width, 1)
+        y = round(height - min(booked, ceiling) / ceiling * height, 1)
+        if last_y is not None:
+            points.append(f"{x},{last_y}")
+        points.append(f"{x},{y}")
+        last_y = y
+    return " ".join(points)
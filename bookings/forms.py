@@ -7,10 +7,21 @@ from accounts.models import CustomUser, AllowedUser
 from .models import StudentProfile
 
 class BookingAdminForm(forms.ModelForm):
+    """
+    Student and activity are picked with the admin's autocomplete widgets
+    (see BookingAdmin.autocomplete_fields); ``clean`` runs a fixed handful
+    of queries whatever the size of either table.
+    """
     class Meta:
         model = Booking
         fields = '__all__'
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # the widgets only render the selected rows; their labels use the grade
+        if 'student' in self.fields:
+            self.fields['student'].queryset = StudentProfile.objects.select_related('grade')
+
     def clean(self):
         cleaned = super().clean()
         student = cleaned.get('student')
@@ -19,24 +30,23 @@ class BookingAdminForm(forms.ModelForm):
             return cleaned
 
         # 1) check grade allowed
-        if student.grade not in activity.allowed_grades.all():
+        if not activity.allowed_grades.filter(pk=student.grade_id).exists():
             raise ValidationError("This student's grade is not allowed for the chosen activity.")
 
-        # 2) check capacity (if creating)
-        if self.instance.pk is None:
-            current_count = activity.bookings.count()
-            if current_count >= activity.capacity:
+        # 2) check capacity (if creating or moving to another activity)
+        if self.instance.pk is None or self.instance.activity_id != activity.pk:
+            if activity.capacity and activity.booked_count >= activity.capacity:
                 raise ValidationError("Activity capacity reached; cannot create booking.")
 
-        # 3) check unique day booking
-        existing = Booking.objects.filter(student=student, day=activity.day)
-        if self.instance.pk:
-            existing = existing.exclude(pk=self.instance.pk)
-        if existing.exists():
-            raise ValidationError(f"Student already has a booking on {activity.day}.")
+        # one booking per day: Booking.clean() sets the day, validate_unique() checks it
         return cleaned
 
 
+class EnrollForm(forms.Form):
+    """Activity picker for the bulk enroll admin actions."""
+    activity = forms.ModelChoiceField(queryset=Activity.objects.order_by('day', 'name'))
+
+
 class DaySelectionForm(forms.Form):
     def __init__(self, day, grade, *args, **kwargs):
         super().__init__(*args, **kwargs)
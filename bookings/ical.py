@@ -0,0 +1,161 @@
+# activities/ical.py
+"""iCalendar (.ics) feed of a student's weekly bookings."""
+from datetime import UTC, datetime, time, timedelta
+
+from django.core import signing
+from django.utils import timezone
+
+from . import tenancy
+from .models import Activity, Booking, Term
+
+SALT = 'bookings.ical'
+WEEKDAYS = [day for day, _ in Activity.DAYS]
+RRULE_DAYS = ['MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU']
+
+
+def _signer():
+    # per school, so a token can't be replayed against another school's host
+    return signing.Signer(salt=f'{SALT}:{tenancy.current().slug}')
+
+
+def make_token(student):
+    return _signer().sign(str(student.pk))
+
+
+def read_token(token):
+    """Student id from a feed token, or None if it was tampered with."""
+    try:
+        return int(_signer().unsign(token))
+    except (signing.BadSignature, ValueError):
+        return None
+
+
+def _escape(text):
+    return (
+        str(text).replace('\\', '\\\\').replace(';', '\\;')
+        .replace(',', '\\,').replace('\n', '\\n')
+    )
+
+
+def _fold(line):
+    # RFC 5545: lines longer than 75 octets continue on the next line after a space
+    raw = line.encode('utf-8')
+    if len(raw) <= 75:
+        return line
+    parts, chunk = [], b''
+    for ch in line:
+        b = ch.encode('utf-8')
+        if len(chunk) + len(b) > (75 if not parts else 74):
+            parts.append(chunk.decode('utf-8'))
+            chunk = b''
+        chunk += b
+    parts.append(chunk.decode('utf-8'))
+    return '\r\n '.join(parts)
+
+
+def _first_on_or_after(date, day):
+    return date + timedelta(days=(WEEKDAYS.index(day) - date.weekday()) % 7)
+
+
+def _offset(delta):
+    minutes = int(delta.total_seconds()) // 60
+    sign = '-' if minutes < 0 else '+'
+    return f'{sign}{abs(minutes) // 60:02d}{abs(minutes) % 60:02d}'
+
+
+def _observance(local_onset, before, after):
+    """STANDARD/DAYLIGHT block for the offset ``after`` (an aware datetime) takes from ``local_onset``."""
+    kind = 'DAYLIGHT' if after.dst() else 'STANDARD'
+    return [
+        f'BEGIN:{kind}',
+        f'DTSTART:{local_onset:%Y%m%dT%H%M%S}',
+        f'TZOFFSETFROM:{_offset(before)}',
+        f'TZOFFSETTO:{_offset(after.utcoffset())}',
+        f'TZNAME:{_escape(after.tzname())}',
+        f'END:{kind}',
+    ]
+
+
+def vtimezone(zone, start, end):
+    """
+    VTIMEZONE for ``zone`` (a ZoneInfo) with the offset in force on ``start``
+    and every transition up to ``end``, read from the zone's own rules.
+    """
+    moment = datetime.combine(start, time(), UTC)
+    stop = datetime.combine(end + timedelta(days=1), time(), UTC)
+    current = moment.astimezone(zone).utcoffset()
+    lines = ['BEGIN:VTIMEZONE', f'TZID:{zone.key}']
+    lines += _observance(datetime(1970, 1, 1), current, moment.astimezone(zone))
+    while moment < stop:
+        day_later = moment + timedelta(days=1)
+        if day_later.astimezone(zone).utcoffset() != current:
+            # narrow it down to the quarter hour it changed in
+            onset = moment
+            while onset.astimezone(zone).utcoffset() == current:
+                onset += timedelta(minutes=15)
+            # the onset is written in the local time that was in force before it
+            lines += _observance((onset + current).replace(tzinfo=None), current, onset.astimezone(zone))
+            current = onset.astimezone(zone).utcoffset()
+        moment = day_later
+    lines.append('END:VTIMEZONE')
+    return lines
+
+
+def build_calendar(student_id, host):
+    """
+    The student's bookings as weekly events. Timed events carry the
+    school's TZID (``settings.TIME_ZONE``) so they stay at the same wall
+    time across daylight-saving changes; the VTIMEZONE covers the current
+    term, or a year from today when it has no end date.
+    """
+    bookings = (
+        Booking.objects.filter(student_id=student_id)
+        .select_related('activity')
+        .order_by('activity__start_time')
+    )
+    term = Term.current()
+    zone = timezone.get_default_timezone()
+    today = timezone.localdate()
+    stamp = timezone.now().strftime('%Y%m%dT%H%M%SZ')
+
+    lines = [
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        f'PRODID:-//{_escape(tenancy.current().name)}//Activities//EN',
+        'CALSCALE:GREGORIAN',
+        'X-WR-CALNAME:My Activities',
+        f'X-WR-TIMEZONE:{zone.key}',
+    ]
+    events, first_dates = [], []
+    for b in bookings:
+        a = b.activity
+        start_date = term.start_date if term and term.start_date else b.date_created.date()
+        first = _first_on_or_after(start_date, a.day)
+        first_dates.append(first)
+        rrule = f'RRULE:FREQ=WEEKLY;BYDAY={RRULE_DAYS[WEEKDAYS.index(a.day)]}'
+        if term and term.end_date:
+            # UNTIL is in UTC when DTSTART has a TZID
+            until = datetime.combine(term.end_date, time(23, 59, 59), zone).astimezone(UTC)
+            rrule += f';UNTIL={until:%Y%m%dT%H%M%SZ}'
+
+        events += ['BEGIN:VEVENT', f'UID:booking-{b.pk}@{host}', f'DTSTAMP:{stamp}']
+        if a.start_time:
+            start = datetime.combine(first, a.start_time)
+            end = datetime.combine(first, a.end_time) if a.end_time else start + timedelta(hours=1)
+            events += [f'DTSTART;TZID={zone.key}:{start:%Y%m%dT%H%M%S}', f'DTEND;TZID={zone.key}:{end:%Y%m%dT%H%M%S}']
+        else:
+            events += [f'DTSTART;VALUE=DATE:{first:%Y%m%d}', f'DTEND;VALUE=DATE:{first + timedelta(days=1):%Y%m%d}']
+        events += [
+            rrule,
+            f'SUMMARY:{_escape(a.name)}',
+            f'LOCATION:{_escape(a.venue or "")}',
+            f'DESCRIPTION:{_escape(a.instructor or "")}',
+            'END:VEVENT',
+        ]
+    if events:
+        start = min(first_dates)
+        end = term.end_date if term and term.end_date else today + timedelta(days=366)
+        lines += vtimezone(zone, start, max(start, end))
+    lines += events
+    lines.append('END:VCALENDAR')
+    return ('\r\n'.join(_fold(l) for l in lines) + '\r\n').encode('utf-8')
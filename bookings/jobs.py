@@ -0,0 +1,234 @@
+# activities/jobs.py
+"""
+Database-backed background jobs.
+
+Admin actions call ``enqueue()`` and return immediately; ``manage.py run_jobs``
+claims pending rows one at a time and writes the output file to storage.
+Handlers return ``(filename, content)``, where content is bytes or an open
+binary file positioned at the start.
+"""
+import io
+import logging
+import tempfile
+import traceback
+
+from django.core.files.base import ContentFile, File
+from . import tenancy
+from django.db.models import Count
+from django.utils import timezone
+
+from .models import Activity, ArchivedBooking, Booking, Job, Term
+
+logger = logging.getLogger(__name__)
+
+HANDLERS = {}
+
+# how often (in rows) a handler writes its progress back to the Job row
+PROGRESS_EVERY = 200
+PROGRESS_EVERY_ROSTER = 10
+
+
+def handler(kind):
+    """Register a function as the handler for jobs of ``kind``."""
+    def decorator(func):
+        HANDLERS[kind] = func
+        return func
+    return decorator
+
+
+def enqueue(kind, user=None, **params):
+    if kind not in HANDLERS:
+        raise ValueError(f"Unknown job kind: {kind}")
+    return Job.objects.create(kind=kind, params=params, created_by=user)
+
+
+def claim_next():
+    """Mark the oldest pending job as running and return it (or None)."""
+    with tenancy.atomic():
+        job = (
+            Job.objects.select_for_update(skip_locked=True)
+            .filter(status=Job.PENDING)
+            .order_by('id')
+            .first()
+        )
+        if job is None:
+            return None
+        job.status = Job.RUNNING
+        job.date_started = timezone.now()
+        job.save(update_fields=['status', 'date_started'])
+    return job
+
+
+def run(job):
+    try:
+        filename, content = HANDLERS[job.kind](job, **job.params)
+        # bytes, or an open file for output too big to hold in memory; File streams it in chunks
+        with (ContentFile(content) if isinstance(content, bytes) else File(content)) as output:
+            job.result.save(f"{job.pk}-{filename}", output, save=False)
+        job.status = Job.DONE
+        job.progress = job.total
+    except Exception:
+        logger.exception("Job %s failed", job.pk)
+        job.status = Job.FAILED
+        job.error = traceback.format_exc()
+    job.date_finished = timezone.now()
+    job.save()
+    return job
+
+
+def _csv(rows, header, job, total):
+    import csv  # only the job worker needs it
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    job.set_progress(0, total)
+    for i, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if i % PROGRESS_EVERY == 0:
+            job.set_progress(i)
+    return buffer.getvalue().encode('utf-8')
+
+
+@handler('export_activities')
+def export_activities(job, ids=None):
+    activities = Activity.objects.annotate(num_bookings=Count('bookings')).prefetch_related('allowed_grades')
+    if ids is not None:
+        activities = activities.filter(pk__in=ids)
+    rows = (
+        [a.pk, a.name, a.day, a.capacity, a.num_bookings, ", ".join(g.name for g in a.allowed_grades.all())]
+        for a in activities
+    )
+    header = ['ID','Name','Day','Capacity','BookingsCount','AllowedGrades']
+    return 'activities.csv', _csv(rows, header, job, activities.count())
+
+
+@handler('export_bookings')
+def export_bookings(job, ids=None):
+    bookings = Booking.objects.select_related('student__user', 'student__grade', 'activity')
+    if ids is not None:
+        bookings = bookings.filter(pk__in=ids)
+    rows = (
+        [b.pk, b.student.user, b.student.user.email, b.student.grade.name, b.activity.name, b.day, b.date_created.isoformat(), b.attended]
+        for b in bookings.iterator(chunk_size=2000)
+    )
+    header = ['BookingID','Student','Email','Grade','Activity','Day','DateCreated','Attended']
+    return 'bookings.csv', _csv(rows, header, job, bookings.count())
+
+
+@handler('export_archived_bookings')
+def export_archived_bookings(job, ids=None):
+    bookings = ArchivedBooking.objects.select_related('term')
+    if ids is not None:
+        bookings = bookings.filter(pk__in=ids)
+    rows = (
+        [b.term.name, b.booking_id, b.student_name, b.student_email, b.grade, b.activity_name, b.day, b.date_created.isoformat(), b.attended]
+        for b in bookings.iterator(chunk_size=2000)
+    )
+    header = ['Term','BookingID','Student','Email','Grade','Activity','Day','DateCreated','Attended']
+    return 'archived_bookings.csv', _csv(rows, header, job, bookings.count())
+
+
+@handler('booking_report')
+def booking_report(job, term_id=None):
+    term = Term.objects.filter(pk=term_id).first() if term_id else None
+    if term is not None and not term.is_current:
+        return _archived_booking_report(job, term)
+    activities = Activity.objects.annotate(bookings_count=Count('bookings')).order_by('day','name')
+    rows = (
+        [
+            a.name, a.day, a.instructor or '', a.venue or '',
+            'Unlimited' if a.capacity == 0 else a.capacity,
+            a.bookings_count,
+            'Unlimited' if a.capacity == 0 else a.capacity - a.bookings_count,
+        ]
+        for a in activities
+    )
+    header = ['Activity','Day','Instructor','Venue','Capacity','Booked','Spots left']
+    return 'booking_report.csv', _csv(rows, header, job, activities.count())
+
+
+def _archived_booking_report(job, term):
+    # activities may have been renamed or deleted since, so group on the archived copy
+    activities = (
+        ArchivedBooking.objects.filter(term=term)
+        .values('activity_name', 'day')
+        .annotate(bookings_count=Count('id'))
+        .order_by('day', 'activity_name')
+    )
+    rows = ([a['activity_name'], a['day'], a['bookings_count']] for a in activities)
+    header = ['Activity','Day','Booked']
+    return f'booking_report_{term.pk}.csv', _csv(rows, header, job, len(activities))
+
+
+@handler('attendance_report')
+def attendance_report(job, term_id):
+    from .attendance import term_summary
+
+    term = Term.objects.get(pk=term_id)
+    summary = term_summary(term)
+    rows = (
+        [r['student_name'], r['sessions'], r['attended'], f"{r['percent']:.1f}"]
+        for r in summary
+    )
+    header = ['Student','Sessions','Attended','Percent']
+    return f'attendance_{term.pk}.csv', _csv(rows, header, job, summary.count())
+
+
+def _roster_groups(term, activity_ids=None):
+    """One ordered query, grouped into one dict per activity and day."""
+    from itertools import groupby
+
+    if term is not None and not term.is_current:
+        rows = (
+            ArchivedBooking.objects.filter(term=term)
+            .order_by('day', 'activity_name', 'student_name')
+            .values_list('activity_name', 'day', 'student_name', 'grade', 'student_email')
+        )
+        return [
+            {'activity': name, 'day': d, 'students': [r[2:] for r in group]}
+            for (name, d), group in groupby(rows.iterator(chunk_size=2000), key=lambda r: r[:2])
+        ]
+
+    bookings = Booking.objects.all()
+    if activity_ids is not None:
+        bookings = bookings.filter(activity_id__in=activity_ids)
+    rows = bookings.order_by('activity__day', 'activity__name', 'activity_id', 'student__name').values_list(
+        'activity_id', 'activity__name', 'activity__day', 'activity__time', 'activity__venue',
+        'activity__instructor', 'student__name', 'student__grade__name', 'student__user__email',
+    )
+    groups = []
+    for _, group in groupby(rows.iterator(chunk_size=2000), key=lambda r: r[0]):
+        group = list(group)
+        _, name, d, time, venue, instructor = group[0][:6]
+        groups.append({
+            'activity': name, 'day': d, 'time': time, 'venue': venue, 'instructor': instructor,
+            'students': [r[6:] for r in group],
+        })
+    return groups
+
+
+@handler('roster_bundle')
+def roster_bundle(job, term_id=None, activity_ids=None):
+    """
+    Rosters for a term, or for the chosen activities; a single day's
+    rosters are its activities picked from the changelist's day filter.
+    """
+    from . import rosters
+
+    term = Term.objects.filter(pk=term_id).first() if term_id else None
+    groups = _roster_groups(term, activity_ids)
+    days = [d for d, _ in Activity.DAYS]
+    groups.sort(key=lambda g: (days.index(g['day']) if g['day'] in days else len(days), g['activity']))
+
+    def progress(n):
+        if n % PROGRESS_EVERY_ROSTER == 0:
+            job.set_progress(n)
+
+    job.set_progress(0, len(groups))
+    # on disk, not in memory: a term's bundle can be large
+    bundle = tempfile.TemporaryFile()
+    rosters.write_bundle(groups, bundle, progress=progress)
+    bundle.seek(0)
+    suffix = f'_{term.pk}' if term else ''
+    return f'rosters{suffix}.zip', bundle
@@ -0,0 +1,104 @@
+# activities/journal.py
+"""
+Booking event journal.
+
+Every write to Booking goes through ``record()`` / ``record_many()`` inside
+the same transaction as the change, which also keeps ``Activity.booked_count``
+in step with the events.
+"""
+from collections import Counter
+from datetime import timedelta
+
+from . import tenancy
+from django.db.models import Count, F
+from django.utils import timezone
+
+from .caching import bump_version
+from .models import Activity, BookingEvent
+
+# effect of each event kind on Activity.booked_count
+DELTAS = {
+    BookingEvent.BOOK: 1,
+    BookingEvent.UNBOOK: -1,
+    BookingEvent.ARCHIVE: -1,
+}
+
+# Sequence numbers are handed out before commit, so a slow transaction can
+# commit an id lower than one a consumer has already seen. The feed (and
+# the fill-rate compactor) hold back events younger than this so cursors
+# don't skip past them.
+#
+# This is a heuristic, not a guarantee: it assumes no transaction stays
+# open longer than this between journaling and committing. Booking writes
+# run a handful of statements; the longest writers are rollover_term
+# chunks, so keep --chunk-size small enough that a chunk commits well
+# within it. A transaction held past it (a long lock wait, say) can
+# commit an event behind a consumer's cursor, and that consumer never
+# sees it. The counters and rebuild_counters don't depend on the feed.
+SETTLE_DELAY = timedelta(seconds=5)
+
+# most events changes_since() hands out at once
+MAX_PAGE = 5000
+
+
+def _event(kind, booking, actor=None, activity_id=None, **data):
+    return BookingEvent(
+        kind=kind,
+        booking_id=booking.pk,
+        student_id=booking.student_id,
+        activity_id=activity_id or booking.activity_id,
+        day=booking.day,
+        actor=actor,
+        data=data,
+    )
+
+
+def _apply(deltas):
+    for activity_id, delta in deltas.items():
+        if delta:
+            Activity.objects.filter(pk=activity_id).update(booked_count=F('booked_count') + delta)
+
+
+def record(kind, booking, actor=None, activity_id=None, claimed=False, **data):
+    """
+    Journal a single change to ``booking``. Must run inside the change's
+    transaction. ``claimed``: the seat was already counted by ``seats.claim()``.
+    """
+    event = _event(kind, booking, actor, activity_id, **data)
+    with tenancy.atomic():
+        event.save()
+        if not claimed:
+            _apply({event.activity_id: DELTAS.get(kind, 0)})
+        bump_version('student', event.student_id)
+    return event
+
+
+def record_many(kind, bookings, actor=None, **data):
+    events = [_event(kind, b, actor, **data) for b in bookings]
+    with tenancy.atomic():
+        BookingEvent.objects.bulk_create(events)
+        deltas = Counter()
+        for e in events:
+            deltas[e.activity_id] += DELTAS.get(kind, 0)
+        _apply(deltas)
+        for student_id in {e.student_id for e in events}:
+            bump_version('student', student_id)
+    return events
+
+
+def changes_since(since, limit):
+    """Settled events with a sequence number above ``since``, oldest first."""
+    cutoff = timezone.now() - SETTLE_DELAY
+    return list(
+        BookingEvent.objects.filter(pk__gt=since, date_created__lte=cutoff)
+        .order_by('pk')[:limit]
+    )
+
+
+def counts_from_journal():
+    """Replay the journal into {activity_id: booked count}."""
+    totals = Counter()
+    rows = BookingEvent.objects.filter(kind__in=DELTAS).values('activity_id', 'kind').annotate(n=Count('id'))
+    for row in rows:
+        totals[row['activity_id']] += DELTAS[row['kind']] * row['n']
+    return totals
@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from bookings import fillrate, tenancy
+
+
+class Command(BaseCommand):
+    help = "Fold new booking journal events into the fill-rate rollup for every school."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--backfill', action='store_true',
+            help="Rebuild the rollup from the live bookings' creation times first.",
+        )
+        parser.add_argument('--loop', action='store_true', help="Keep compacting every --sleep seconds.")
+        parser.add_argument('--sleep', type=float, default=60.0, help="Seconds between passes with --loop.")
+
+    def handle(self, *args, **options):
+        if options['backfill']:
+            for tenant in tenancy.all_tenants():
+                with tenancy.use(tenant):
+                    total = fillrate.backfill()
+                self.stdout.write(f"[{tenant.slug}] Backfilled from {total} booking(s).")
+
+        while True:
+            close_old_connections()
+            for tenant in tenancy.all_tenants():
+                with tenancy.use(tenant):
+                    folded = fillrate.compact()
+                if folded:
+                    self.stdout.write(f"[{tenant.slug}] Folded {folded} event(s).")
+            if not options['loop']:
+                return
+            time.sleep(options['sleep'])
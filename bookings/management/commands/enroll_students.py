@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from bookings import enrollment
+from bookings.models import Activity, StudentProfile
+
+
+class Command(BaseCommand):
+    help = "Book a whole grade, or the given students, into one activity."
+
+    def add_arguments(self, parser):
+        parser.add_argument('activity', type=int, help="Activity id.")
+        group = parser.add_mutually_exclusive_group(required=True)
+        group.add_argument('--grade', action='append', help="Grade name; repeat for several grades.")
+        group.add_argument('--students', type=int, nargs='+', help="StudentProfile ids.")
+        parser.add_argument('--dry-run', action='store_true', help="Report what would happen without booking.")
+
+    def handle(self, *args, **options):
+        try:
+            activity = Activity.objects.get(pk=options['activity'])
+        except Activity.DoesNotExist:
+            raise CommandError(f"No activity with id {options['activity']}.")
+
+        students = StudentProfile.objects.only('pk', 'name', 'grade_id')
+        if options['grade']:
+            students = students.filter(grade__name__in=options['grade'])
+        else:
+            students = students.filter(pk__in=options['students'])
+        students = list(students)
+        if not students:
+            raise CommandError("No matching students.")
+
+        result = enrollment.enroll(students, activity, dry_run=options['dry_run'])
+        for reason, skipped in result.skipped.items():
+            for s in skipped:
+                self.stdout.write(f"skipped ({reason}): {s.name} [{s.pk}]")
+        prefix = "Dry run: " if options['dry_run'] else ""
+        self.stdout.write(self.style.SUCCESS(f"{prefix}{activity}: {result.summary()}."))
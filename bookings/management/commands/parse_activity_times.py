@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from bookings.models import Activity
+from bookings.timeslots import parse_time_range
+
+
+class Command(BaseCommand):
+    help = "Fill Activity.start_time/end_time from the free-text time and list the ones that can't be parsed."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help="Re-parse activities that already have a start time.")
+
+    def handle(self, *args, **options):
+        activities = Activity.objects.all()
+        if not options['force']:
+            activities = activities.filter(start_time__isnull=True)
+
+        updated, unparsed = 0, []
+        for activity in activities:
+            parsed = parse_time_range(activity.time)
+            if parsed is None:
+                unparsed.append(activity)
+                continue
+            Activity.objects.filter(pk=activity.pk).update(start_time=parsed[0], end_time=parsed[1])
+            updated += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Parsed {updated} activit(y/ies)."))
+        for activity in unparsed:
+            self.stdout.write(self.style.WARNING(f"#{activity.pk} {activity} — can't parse {activity.time!r}"))
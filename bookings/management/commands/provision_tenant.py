@@ -0,0 +1,41 @@
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from bookings import tenancy
+from bookings.models import School
+
+
+class Command(BaseCommand):
+    help = "Register a school on a database alias and migrate that database."
+
+    def add_arguments(self, parser):
+        parser.add_argument('slug')
+        parser.add_argument('--name', help="Display name (defaults to the slug).")
+        parser.add_argument('--database', required=True, help="Alias in settings.DATABASES (see TENANT_DATABASES).")
+        parser.add_argument('--host', action='append', default=[], help="Host name served as this school; repeatable.")
+
+    def handle(self, *args, **options):
+        alias = options['database']
+        if alias not in settings.DATABASES:
+            raise CommandError(f"No database alias {alias!r}; add it to TENANT_DATABASES first.")
+        taken = School.objects.using('default').filter(db_alias=alias).exclude(slug=options['slug'])
+        if taken.exists():
+            raise CommandError(f"Database {alias!r} already belongs to {taken.first()}.")
+
+        school, created = School.objects.using('default').update_or_create(
+            slug=options['slug'],
+            defaults={
+                'name': options['name'] or options['slug'],
+                'db_alias': alias,
+                'hosts': ', '.join(options['host']),
+            },
+        )
+        tenancy.clear_cache()
+
+        self.stdout.write(f"Migrating {alias} for {school} ...")
+        with tenancy.use(school):
+            call_command('migrate', database=alias, interactive=False, verbosity=options['verbosity'])
+
+        verb = "Provisioned" if created else "Updated"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {school} on {alias}. Reach it via {', '.join(school.host_list()) or f'/t/{school.slug}/'}."))
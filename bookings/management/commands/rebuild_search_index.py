@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from bookings.models import StudentProfile
+from bookings.search import index_student
+
+
+class Command(BaseCommand):
+    help = "Rebuild the student search index from scratch."
+
+    def handle(self, *args, **options):
+        ids = list(StudentProfile.objects.values_list('pk', flat=True))
+        for i, student_id in enumerate(ids, 1):
+            index_student(student_id)
+            if i % 500 == 0:
+                self.stdout.write(f"  {i}/{len(ids)}")
+        self.stdout.write(self.style.SUCCESS(f"Indexed {len(ids)} student(s)."))
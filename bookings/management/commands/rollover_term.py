@@ -0,0 +1,71 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import BigIntegerField, Case, Value, When
+from bookings import tenancy
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from bookings import journal
+from bookings.models import ArchivedBooking, Attendance, Booking, BookingEvent, Term
+
+
+class Command(BaseCommand):
+    help = (
+        "Close the current term: move its bookings (and their attendance "
+        "marks) into the archive table in chunks and make a new term current."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('new_term', help="Name of the term that starts now.")
+        parser.add_argument('--start', help="Start date of the new term (YYYY-MM-DD).")
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        current = Term.current()
+        if current is None:
+            raise CommandError("There is no current term to roll over. Create one in the admin first.")
+        if Term.objects.filter(name=options['new_term']).exists():
+            raise CommandError(f"Term {options['new_term']!r} already exists.")
+        start = parse_date(options['start']) if options['start'] else None
+
+        total = Booking.objects.count()
+        self.stdout.write(f"Archiving {total} booking(s) from {current}.")
+        if options['dry_run']:
+            return
+
+        moved = 0
+        chunk_size = options['chunk_size']
+        while True:
+            with tenancy.atomic():
+                chunk = list(
+                    Booking.objects.select_related('student__user', 'student__grade', 'activity')
+                    .order_by('pk')[:chunk_size]
+                )
+                if not chunk:
+                    break
+                ids = [b.pk for b in chunk]
+                ArchivedBooking.objects.bulk_create(
+                    [ArchivedBooking.from_booking(b, current) for b in chunk]
+                )
+                self.move_attendance(current, ids)
+                journal.record_many(BookingEvent.ARCHIVE, chunk, term=current.name)
+                Booking.objects.filter(pk__in=ids).delete()
+            moved += len(chunk)
+            self.stdout.write(f"  {moved}/{total}")
+
+        with tenancy.atomic():
+            Term.objects.filter(pk=current.pk, end_date__isnull=True).update(end_date=timezone.localdate())
+            Term.objects.filter(is_current=True).update(is_current=False)
+            Term.objects.create(name=options['new_term'], start_date=start, is_current=True)
+
+        self.stdout.write(self.style.SUCCESS(f"Archived {moved} booking(s); {options['new_term']} is now the current term."))
+
+    def move_attendance(self, term, booking_ids):
+        """Point the chunk's attendance marks at their archived bookings, in one UPDATE."""
+        archived = ArchivedBooking.objects.filter(term=term, booking_id__in=booking_ids).values_list('booking_id', 'pk')
+        whens = [When(booking_id=booking_id, then=Value(pk)) for booking_id, pk in archived]
+        if whens:
+            Attendance.objects.filter(booking_id__in=booking_ids).update(
+                archived_booking_id=Case(*whens, output_field=BigIntegerField()),
+                booking=None,
+            )
@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from bookings import jobs, tenancy
+
+
+class Command(BaseCommand):
+    help = "Run queued background jobs (exports and reports) for every school."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Exit when the queue is empty.")
+        parser.add_argument('--sleep', type=float, default=2.0, help="Seconds to wait when idle.")
+
+    def handle(self, *args, **options):
+        while True:
+            close_old_connections()
+            ran = False
+            for tenant in tenancy.all_tenants():
+                with tenancy.use(tenant):
+                    job = jobs.claim_next()
+                    if job is None:
+                        continue
+                    ran = True
+                    self.stdout.write(f"[{tenant.slug}] Running {job}")
+                    job = jobs.run(job)
+                    self.stdout.write(f"[{tenant.slug}] Finished {job}")
+            if not ran:
+                if options['once']:
+                    return
+                time.sleep(options['sleep'])
@@ -0,0 +1,252 @@
+# activities/metrics.py
+"""
+In-process metrics with multi-process aggregation.
+
+Every sample (counter values and histogram buckets/sum/count) is additive,
+so each worker process keeps its own totals in memory and flushes them to
+a file in ``METRICS_DIR`` at most once per ``FLUSH_INTERVAL``. The metrics
+endpoint sums every file, which works for any number of workers. It also
+folds the files of workers that have exited into one ``exited`` file, so
+the directory holds one file per live worker plus that one, and the
+exited workers' counts are kept.
+"""
+import fcntl
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+
+FLUSH_INTERVAL = 1.0
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+METRICS = {
+    'http_request_duration_seconds': ('histogram', "Time spent in each view."),
+    'http_requests_total': ('counter', "Requests by view and status code."),
+    'booking_outcomes_total': ('counter', "Booking attempts by view and outcome."),
+    'booking_claim_conflicts_total': ('counter', "Seat claims lost to a concurrent booking."),
+    'admission_requests_total': ('counter', "Booking requests admitted or shed by admission control."),
+}
+
+_lock = threading.Lock()
+# held while this process writes its file, so snapshots land in order
+_write_lock = threading.Lock()
+_samples = defaultdict(float)
+_last_flush = 0.0
+_file = {}
+EXITED = 'exited'
+
+
+def _directory():
+    return getattr(settings, 'METRICS_DIR', None)
+
+
+def _key(name, labels):
+    return (name, tuple(sorted(labels.items())))
+
+
+def _path(directory):
+    # one file per process lifetime; a recycled pid must not overwrite a dead worker's totals
+    pid = os.getpid()
+    if _file.get('pid') != pid:
+        _file.update(pid=pid, name=f'{pid}-{time.time_ns()}.json')
+    return os.path.join(directory, _file['name'])
+
+
+def _flush(force=False):
+    """
+    Write this process's totals to its file. The snapshot is taken under
+    ``_lock`` but the file is written outside it, so other request threads
+    aren't held up by disk I/O. A request thread that finds another one
+    already writing skips its turn; ``force`` (the metrics endpoint) waits.
+    """
+    global _last_flush
+    directory = _directory()
+    if not directory:
+        return
+    if not _write_lock.acquire(blocking=force):
+        return
+    try:
+        with _lock:
+            now = time.monotonic()
+            if not force and now - _last_flush < FLUSH_INTERVAL:
+                return
+            _last_flush = now
+            data = [[name, dict(labels), value] for (name, labels), value in _samples.items()]
+        os.makedirs(directory, exist_ok=True)
+        path = _path(directory)
+        tmp = f'{path}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp, path)
+    finally:
+        _write_lock.release()
+
+
+def inc(name, amount=1, **labels):
+    with _lock:
+        _samples[_key(name, labels)] += amount
+    _flush()
+
+
+def observe(name, value, **labels):
+    """Record ``value`` in a histogram."""
+    with _lock:
+        for le in LATENCY_BUCKETS:
+            if value <= le:
+                _samples[_key(f'{name}_bucket', {**labels, 'le': str(le)})] += 1
+        _samples[_key(f'{name}_bucket', {**labels, 'le': '+Inf'})] += 1
+        _samples[_key(f'{name}_sum', labels)] += value
+        _samples[_key(f'{name}_count', labels)] += 1
+    _flush()
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _read(path, default):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+def _write(path, data):
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+def _pid(filename):
+    """The worker pid of a ``<pid>-<ns>.json`` file, or None for anything else."""
+    pid, dash, rest = filename.partition('-')
+    return int(pid) if dash and pid.isdigit() and rest.endswith('.json') else None
+
+
+def _fold_exited(directory):
+    """
+    Add the files of workers that have exited into the ``exited`` file and
+    delete them; returns the ``exited`` data. That file lists the files it
+    already holds, so a fold cut short before the deletes is finished, not
+    counted twice, by the next one. Call under the directory lock.
+    """
+    exited_path = os.path.join(directory, f'{EXITED}.json')
+    exited = _read(exited_path, {'merged': [], 'samples': []})
+    names = os.listdir(directory)
+    leftover = [n for n in exited['merged'] if n in names]
+    dead = [n for n in names if _pid(n) is not None and n not in leftover and not _alive(_pid(n))]
+    if dead:
+        totals = defaultdict(float)
+        for rows in [exited['samples']] + [_read(os.path.join(directory, n), []) for n in dead]:
+            for name, labels, value in rows:
+                totals[_key(name, labels)] += value
+        exited = {'merged': dead, 'samples': [[name, dict(labels), value] for (name, labels), value in totals.items()]}
+        _write(exited_path, exited)
+    for n in leftover + dead:
+        for path in (os.path.join(directory, n), os.path.join(directory, f'{n}.tmp')):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+    return exited
+
+
+def collect():
+    """
+    Samples summed over every worker's file (and this process's latest
+    values). Liveness is checked by pid, so ``METRICS_DIR`` must not be
+    shared between hosts.
+    """
+    _flush(force=True)
+    directory = _directory()
+    if not (directory and os.path.isdir(directory)):
+        with _lock:
+            return defaultdict(float, _samples)
+    totals = defaultdict(float)
+    # one collector at a time, so none reads a file that another is folding away
+    with open(os.path.join(directory, f'{EXITED}.lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        exited = _fold_exited(directory)
+        files = [exited['samples']] + [
+            _read(os.path.join(directory, n), [])
+            for n in os.listdir(directory)
+            if _pid(n) is not None and n not in exited['merged']
+        ]
+    for rows in files:
+        for name, labels, value in rows:
+            totals[_key(name, labels)] += value
+    return totals
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in labels) + '}'
+
+
+def _sort_key(item):
+    (name, labels), _ = item
+    # group series by their labels, buckets in numeric order with +Inf last
+    others = tuple((k, v) for k, v in labels if k != 'le')
+    le = next((float(v) for k, v in labels if k == 'le'), 0.0)
+    return name, others, le
+
+
+def _format_value(value):
+    # counts are written exactly; %g would round them to 6 significant digits
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+def _base_name(name):
+    for suffix in ('_bucket', '_sum', '_count'):
+        if name.endswith(suffix) and name[:-len(suffix)] in METRICS:
+            return name[:-len(suffix)]
+    return name
+
+
+def render():
+    """Prometheus text exposition format."""
+    by_metric = defaultdict(list)
+    for (name, labels), value in sorted(collect().items(), key=_sort_key):
+        by_metric[_base_name(name)].append((name, labels, value))
+
+    lines = []
+    for metric in sorted(set(by_metric) | set(METRICS)):
+        kind, help_text = METRICS.get(metric, ('untyped', ''))
+        lines.append(f'# HELP {metric} {help_text}')
+        lines.append(f'# TYPE {metric} {kind}')
+        for name, labels, value in by_metric.get(metric, []):
+            lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsMiddleware:
+    """Per-view latency histogram and request counter."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        response = self.get_response(request)
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else 'unresolved'
+        observe('http_request_duration_seconds', time.perf_counter() - start, view=view)
+        inc('http_requests_total', view=view, status=str(response.status_code))
+        return response
@@ -0,0 +1,199 @@
+# activities/middleware.py
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.shortcuts import render
+from django.urls import Resolver404, resolve
+
+from . import metrics, tenancy
+from .caching import get_version, version_key
+from .models import Activity, Booking, StudentProfile
+
+DEFAULTS = {
+    'MAX_IN_FLIGHT': 8,   # concurrent booking requests per school in each worker process
+    'RETRY_AFTER': 2,     # seconds, sent with 503/429 responses
+    'RATE': 1.0,          # tokens a client's bucket regains per second
+    'BURST': 5,           # bucket size: requests a client may make back to back
+}
+
+
+def admission_settings():
+    return {**DEFAULTS, **getattr(settings, 'BOOKING_ADMISSION', {})}
+
+
+class AdmissionControlMiddleware:
+    """
+    Keep the booking endpoints from exhausting database connections during
+    the rush. At most ``MAX_IN_FLIGHT`` booking requests per school run at
+    once in each worker process; the rest are shed with a fast 503. Each
+    client has a token bucket of ``BURST`` tokens refilled at ``RATE`` per
+    second, and rapid-fire retries that find it empty get 429. Both carry
+    ``Retry-After``.
+
+    Everything is decided in ``__call__`` from the URL and the session
+    cookie, before the session, user or student context is loaded, so a shed
+    request never touches the database. The state is per process: with N
+    workers the school-wide cap is N x ``MAX_IN_FLIGHT``, so size it against
+    the MySQL connection limit, and a client spreading retries over several
+    workers gets a bucket in each.
+    """
+    GUARDED_VIEWS = {'book_activity', 'swap_activity', 'unbook_activity', 'booking_wizard'}
+    # buckets are dropped once there are this many, keeping the ones still draining
+    MAX_BUCKETS = 10000
+
+    counters = Counter()
+    in_flight = Counter()
+    _lock = threading.Lock()
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.conf = admission_settings()
+        self.slots = {}
+        self.buckets = {}
+
+    def __call__(self, request):
+        capped, throttled = self.limits(request)
+        if not capped:
+            return self.get_response(request)
+        if throttled and not self.take_token(request):
+            self._count('shed_throttled')
+            return self.reject(request, 429, "You're going too fast. Please wait a moment and try again.")
+        alias = tenancy.db_alias()
+        slots = self._slots(alias)
+        if not slots.acquire(blocking=False):
+            self._count('shed_busy')
+            return self.reject(request, 503, "Booking is very busy right now. Please try again in a few seconds.")
+        self._count('admitted')
+        self._flight(alias, 1)
+        try:
+            return self.get_response(request)
+        finally:
+            self._flight(alias, -1)
+            slots.release()
+
+    def limits(self, request):
+        """``(capped, throttled)``: whether the in-flight cap and the per-client limit apply."""
+        try:
+            match = resolve(request.path_info, getattr(request, 'urlconf', None))
+        except Resolver404:
+            return False, False
+        if match.url_name not in self.GUARDED_VIEWS:
+            return False, False
+        if match.url_name == 'booking_wizard':
+            # each step's POST takes a seat hold, so it counts as in flight; only
+            # the finalize step writes bookings, so a normal pass isn't throttled
+            finalize = match.kwargs.get('step', 0) >= len(Activity.DAYS)
+            return request.method == 'POST' or finalize, finalize
+        return True, True
+
+    def client(self, request):
+        """The session cookie, or the address for clients without one (read, not validated)."""
+        session = request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+        return f's:{session}' if session else f'a:{request.META.get("REMOTE_ADDR", "")}'
+
+    def take_token(self, request):
+        """Take a token from the client's bucket; False when it is empty."""
+        rate, burst = self.conf['RATE'], self.conf['BURST']
+        key = (tenancy.current().slug, self.client(request))
+        now = time.monotonic()
+        with self._lock:
+            if len(self.buckets) >= self.MAX_BUCKETS:
+                self._prune(now)
+            tokens, stamp = self.buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - stamp) * rate)
+            taken = tokens >= 1
+            self.buckets[key] = (tokens - 1 if taken else tokens, now)
+        return taken
+
+    def _prune(self, now):
+        """Forget buckets that have refilled; they start full anyway."""
+        full = self.conf['BURST'] / self.conf['RATE']
+        self.buckets = {k: v for k, v in self.buckets.items() if now - v[1] < full}
+
+    def _slots(self, alias):
+        with self._lock:
+            if alias not in self.slots:
+                self.slots[alias] = threading.BoundedSemaphore(self.conf['MAX_IN_FLIGHT'])
+            return self.slots[alias]
+
+    def reject(self, request, status, message):
+        response = render(request, 'activities/busy.html', {
+            'message': message,
+            'retry_after': self.conf['RETRY_AFTER'],
+        }, status=status)
+        response['Retry-After'] = str(self.conf['RETRY_AFTER'])
+        return response
+
+    @classmethod
+    def _flight(cls, alias, n):
+        with cls._lock:
+            cls.in_flight[alias] += n
+
+    @classmethod
+    def _count(cls, name, n=1):
+        with cls._lock:
+            cls.counters[name] += n
+        metrics.inc('admission_requests_total', result=name)
+
+    @classmethod
+    def stats(cls):
+        """This worker's admitted/shed counters and the school's booking requests it has in flight."""
+        with cls._lock:
+            stats = dict(cls.counters)
+            stats['in_flight'] = cls.in_flight[tenancy.db_alias()]
+        return stats
+
+
+STUDENT_CONTEXT_TIMEOUT = 60 * 60
+# the student's pk (0 without a profile), so the context and both versions it
+# depends on can be read with one get_many
+STUDENT_ID_SESSION_KEY = '_student_id'
+
+
+def load_student_context(request):
+    """``(student, {day: activity_id})`` for ``request.user``; student is None for staff without a profile."""
+    user = request.user
+    student_id = request.session.get(STUDENT_ID_SESSION_KEY)
+    key, user_key, student_key = f'student-ctx:{user.pk}', version_key('user', user.pk), version_key('student', student_id)
+    found = cache.get_many([key, user_key, student_key] if student_id else [key, user_key])
+    if key in found:
+        student, bookings, user_version, student_version = found[key]
+        if user_version == found.get(user_key) and (
+            student is None and not student_id
+            or student is not None and student.pk == student_id and student_version == found.get(student_key)
+        ):
+            return student, bookings
+
+    # read the versions first: a change committed meanwhile bumps them past what we store
+    user_version = get_version('user', user.pk)
+    student = StudentProfile.objects.select_related('grade').filter(user=user).first()
+    bookings, student_version = {}, None
+    if student is not None:
+        student_version = get_version('student', student.pk)
+        bookings = dict(Booking.objects.filter(student=student).order_by().values_list('day', 'activity_id'))
+    cache.set(key, (student, bookings, user_version, student_version), STUDENT_CONTEXT_TIMEOUT)
+    if student_id != (student.pk if student else 0):
+        request.session[STUDENT_ID_SESSION_KEY] = student.pk if student else 0
+    return student, bookings
+
+
+class StudentContextMiddleware:
+    """
+    Attach ``request.student`` (with its grade, or None) and
+    ``request.student_bookings`` ({day: activity_id}) for logged-in users.
+    Both come from a per-user cache entry that booking writes and profile
+    edits invalidate, so a warm request runs no profile queries and reads
+    the cache once.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.student, request.student_bookings = None, {}
+        if request.user.is_authenticated:
+            request.student, request.student_bookings = load_student_context(request)
+        return self.get_response(request)
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.5 on 2026-10-19 09:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0005_alter_activity_options_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Term',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('start_date', models.DateField(blank=True, null=True)),
+                ('end_date', models.DateField(blank=True, null=True)),
+                ('is_current', models.BooleanField(default=False)),
+            ],
+            options={
+                'ordering': ['-start_date', '-id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedBooking',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('booking_id', models.BigIntegerField()),
+                ('student_name', models.CharField(max_length=250)),
+                ('student_email', models.EmailField(max_length=254)),
+                ('grade', models.CharField(max_length=10)),
+                ('activity_name', models.CharField(max_length=150)),
+                ('day', models.CharField(max_length=10)),
+                ('date_created', models.DateTimeField()),
+                ('attended', models.BooleanField(default=False)),
+                ('activity', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='bookings.activity')),
+                ('student', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='bookings.studentprofile')),
+                ('term', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='archived_bookings', to='bookings.term')),
+            ],
+            options={
+                'ordering': ['-date_created'],
+                'indexes': [models.Index(fields=['term', 'day', 'activity_name'], name='bookings_ar_term_id_951d4b_idx')],
+            },
+        ),
+    ]
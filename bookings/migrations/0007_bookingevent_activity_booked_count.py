@@ -0,0 +1,56 @@
+# Generated by Django 5.2.5 on 2026-10-19 09:46
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_journal(apps, schema_editor):
+    """Seed the journal with a 'book' event per existing booking and set the counters."""
+    Activity = apps.get_model('bookings', 'Activity')
+    Booking = apps.get_model('bookings', 'Booking')
+    BookingEvent = apps.get_model('bookings', 'BookingEvent')
+    events = [
+        BookingEvent(
+            kind='book', booking_id=b.pk, student_id=b.student_id,
+            activity_id=b.activity_id, day=b.day, data={'backfill': True},
+        )
+        for b in Booking.objects.order_by('date_created', 'pk').iterator()
+    ]
+    BookingEvent.objects.bulk_create(events, batch_size=1000)
+    for activity in Activity.objects.annotate(n=models.Count('bookings')):
+        Activity.objects.filter(pk=activity.pk).update(booked_count=activity.n)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0006_term_archivedbooking'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='activity',
+            name='booked_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.CreateModel(
+            name='BookingEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('book', 'Book'), ('unbook', 'Unbook'), ('attendance', 'Attendance'), ('admin_edit', 'Admin edit'), ('archive', 'Archive')], max_length=20)),
+                ('booking_id', models.BigIntegerField()),
+                ('day', models.CharField(max_length=10)),
+                ('data', models.JSONField(blank=True, default=dict)),
+                ('date_created', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('activity', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='bookings.activity')),
+                ('actor', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('student', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='bookings.studentprofile')),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+        migrations.RunPython(backfill_journal, migrations.RunPython.noop),
+    ]
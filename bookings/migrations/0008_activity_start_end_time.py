@@ -0,0 +1,51 @@
+# Generated by Django 5.2.5 on 2026-10-19 09:48
+
+from django.db import migrations, models
+
+from bookings.timeslots import parse_time_range
+
+
+def parse_times(apps, schema_editor):
+    Activity = apps.get_model('bookings', 'Activity')
+    unparsed = []
+    for activity in Activity.objects.all():
+        parsed = parse_time_range(activity.time)
+        if parsed is None:
+            unparsed.append(activity)
+            continue
+        Activity.objects.filter(pk=activity.pk).update(start_time=parsed[0], end_time=parsed[1])
+    if unparsed:
+        print(f"\n  Could not parse the time of {len(unparsed)} activit(y/ies); set them in the admin "
+              f"or run manage.py parse_activity_times:")
+        for activity in unparsed:
+            print(f"    #{activity.pk} {activity.name} ({activity.day}): {activity.time!r}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0007_bookingevent_activity_booked_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='activity',
+            name='end_time',
+            field=models.TimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='activity',
+            name='start_time',
+            field=models.TimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='activity',
+            name='time',
+            field=models.CharField(blank=True, help_text='e.g. 3:00pm - 4:00pm', max_length=50),
+        ),
+        migrations.AddIndex(
+            model_name='activity',
+            index=models.Index(fields=['day', 'start_time', 'end_time'], name='bookings_ac_day_63e9c1_idx'),
+        ),
+        migrations.RunPython(parse_times, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.5 on 2026-10-19 09:51
+
+import re
+import unicodedata
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# the tokenizer as it was when this migration was written; bookings.search
+# may change without changing what this migration does
+
+
+def terms_for(field, *texts):
+    rows = set()
+    for text in texts:
+        text = unicodedata.normalize('NFKD', str(text or '')).encode('ascii', 'ignore').decode()
+        for word in re.findall(r'[a-z0-9]+', text.lower()):
+            word = word[:40]
+            rows.add((field, word, True))
+            rows.update((field, word[i:i + 3], False) for i in range(len(word) - 2))
+    return rows
+
+
+def build_index(apps, schema_editor):
+    StudentProfile = apps.get_model('bookings', 'StudentProfile')
+    Booking = apps.get_model('bookings', 'Booking')
+    SearchTerm = apps.get_model('bookings', 'SearchTerm')
+    activities = {}
+    for student_id, name in Booking.objects.values_list('student_id', 'activity__name'):
+        activities.setdefault(student_id, []).append(name)
+    rows = []
+    for student in StudentProfile.objects.select_related('user', 'grade').iterator():
+        terms = terms_for('s', student.name, student.user.email, student.grade.name)
+        terms |= terms_for('a', *activities.get(student.pk, []))
+        rows += [SearchTerm(student_id=student.pk, field=f, term=t, is_word=w) for f, t, w in terms]
+    SearchTerm.objects.bulk_create(rows, batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0008_activity_start_end_time'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('field', models.CharField(choices=[('s', 'Student'), ('a', 'Activity')], max_length=1)),
+                ('term', models.CharField(max_length=40)),
+                ('is_word', models.BooleanField()),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='bookings.studentprofile')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['is_word', 'term', 'field', 'student'], name='bookings_se_is_word_3fabba_idx')],
+            },
+        ),
+        migrations.RunPython(build_index, migrations.RunPython.noop),
+    ]
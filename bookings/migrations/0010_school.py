@@ -0,0 +1,26 @@
+# Generated by Django 5.2.5 on 2026-10-19 09:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0009_searchterm'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='School',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('slug', models.SlugField(unique=True)),
+                ('name', models.CharField(max_length=150)),
+                ('hosts', models.CharField(blank=True, help_text='Comma-separated host names', max_length=500)),
+                ('db_alias', models.CharField(default='default', help_text='Key in settings.DATABASES', max_length=50)),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.5 on 2026-10-19 09:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0010_school'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='activity',
+            index=models.Index(fields=['day', 'name'], name='bookings_ac_day_59c096_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['student', 'activity'], name='bookings_bo_student_cf02a3_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['-date_created', '-id'], name='bookings_bo_date_cr_c692c7_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.5 on 2026-10-19 10:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0011_booking_activity_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SeatHold',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.CharField(max_length=10)),
+                ('expires_at', models.DateTimeField()),
+                ('activity', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='holds', to='bookings.activity')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='bookings.studentprofile')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['activity', 'expires_at'], name='bookings_se_activit_f61116_idx')],
+                'unique_together': {('student', 'day')},
+            },
+        ),
+    ]
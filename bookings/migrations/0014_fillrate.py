@@ -0,0 +1,29 @@
+# Generated by Django 5.2.5 on 2026-10-19 10:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0013_occurrence_attendance'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FillRate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.CharField(choices=[('minute', 'Minute'), ('hour', 'Hour')], max_length=6)),
+                ('bucket', models.DateTimeField()),
+                ('booked', models.IntegerField(default=0)),
+                ('last_event', models.BigIntegerField(default=0)),
+                ('activity', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='fill_rates', to='bookings.activity')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['last_event'], name='bookings_fi_last_ev_44e8b0_idx')],
+                'unique_together': {('activity', 'resolution', 'bucket')},
+            },
+        ),
+    ]
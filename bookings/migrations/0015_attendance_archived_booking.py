@@ -0,0 +1,28 @@
+# Generated by Django 5.2.5 on 2026-10-19 10:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0014_fillrate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attendance',
+            name='archived_booking',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='attendance', to='bookings.archivedbooking'),
+        ),
+        migrations.AlterField(
+            model_name='attendance',
+            name='booking',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='attendance', to='bookings.booking'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedbooking',
+            index=models.Index(fields=['term', 'booking_id'], name='bookings_ar_term_id_55ecad_idx'),
+        ),
+    ]
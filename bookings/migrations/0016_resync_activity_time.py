@@ -0,0 +1,32 @@
+from django.db import migrations
+
+from bookings.timeslots import parse_time_range
+
+
+def parse_missing(apps, schema_editor):
+    # activities saved since 0008 without a parsed slot: parse their label
+    # and report what still can't be read; labels are left as they are
+    Activity = apps.get_model('bookings', 'Activity')
+    unparsed = []
+    for activity in Activity.objects.filter(start_time__isnull=True).exclude(time=''):
+        parsed = parse_time_range(activity.time)
+        if parsed is None:
+            unparsed.append(activity)
+            continue
+        Activity.objects.filter(pk=activity.pk).update(start_time=parsed[0], end_time=parsed[1])
+    if unparsed:
+        print(f"\n  Could not parse the time of {len(unparsed)} activit(y/ies); set them in the admin "
+              f"or run manage.py parse_activity_times:")
+        for activity in unparsed:
+            print(f"    #{activity.pk} {activity.name} ({activity.day}): {activity.time!r}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0015_attendance_archived_booking'),
+    ]
+
+    operations = [
+        migrations.RunPython(parse_missing, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+import re
+import unicodedata
+
+from django.db import migrations
+
+
+# the tokenizer as of this migration: words, and their suffixes of three or
+# more letters in place of trigrams
+def terms_for(field, *texts):
+    rows = set()
+    for text in texts:
+        text = unicodedata.normalize('NFKD', str(text or '')).encode('ascii', 'ignore').decode()
+        for word in re.findall(r'[a-z0-9]+', text.lower()):
+            word = word[:40]
+            rows.add((field, word, True))
+            rows.update((field, word[i:], False) for i in range(len(word) - 2))
+    return rows
+
+
+def rebuild_index(apps, schema_editor):
+    StudentProfile = apps.get_model('bookings', 'StudentProfile')
+    Booking = apps.get_model('bookings', 'Booking')
+    SearchTerm = apps.get_model('bookings', 'SearchTerm')
+    SearchTerm.objects.filter(is_word=False).delete()
+    activities = {}
+    for student_id, name in Booking.objects.values_list('student_id', 'activity__name'):
+        activities.setdefault(student_id, []).append(name)
+    rows = []
+    for student in StudentProfile.objects.select_related('user', 'grade').iterator():
+        terms = terms_for('s', student.name, student.user.email, student.grade.name)
+        terms |= terms_for('a', *activities.get(student.pk, []))
+        rows += [SearchTerm(student_id=student.pk, field=f, term=t, is_word=w) for f, t, w in terms if not w]
+    SearchTerm.objects.bulk_create(rows, batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0016_resync_activity_time'),
+    ]
+
+    operations = [
+        migrations.RunPython(rebuild_index, migrations.RunPython.noop),
+    ]
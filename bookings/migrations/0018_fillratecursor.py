@@ -0,0 +1,37 @@
+# Generated by Django 5.2.5 on 2026-10-19 10:55
+
+from django.db import migrations, models
+
+
+def seed_cursor(apps, schema_editor):
+    """Start the cursor where the rollup rows left off."""
+    FillRate = apps.get_model('bookings', 'FillRate')
+    FillRateCursor = apps.get_model('bookings', 'FillRateCursor')
+    last_event = FillRate.objects.aggregate(m=models.Max('last_event'))['m'] or 0
+    FillRateCursor.objects.create(pk=1, last_event=last_event)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0017_searchterm_suffixes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FillRateCursor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_event', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(seed_cursor, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='fillrate',
+            name='bookings_fi_last_ev_44e8b0_idx',
+        ),
+        migrations.RemoveField(
+            model_name='fillrate',
+            name='last_event',
+        ),
+    ]
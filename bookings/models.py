@@ -4,13 +4,63 @@ from datetime import timedelta
 from django.utils import timezone
 from django.conf import settings
 
+from .tenancy import TenantManager
+from .timeslots import format_time_range, parse_time_range
+
+
+class School(models.Model):
+    """A tenant. Stored on the ``default`` database; its data lives on ``db_alias``."""
+    slug = models.SlugField(unique=True)
+    name = models.CharField(max_length=150)
+    hosts = models.CharField(max_length=500, blank=True, help_text="Comma-separated host names")
+    db_alias = models.CharField(max_length=50, default='default', help_text="Key in settings.DATABASES")
+
+    class Meta:
+        ordering = ['name']
+
+    def __str__(self):
+        return self.name
+
+    def host_list(self):
+        return [h.strip().lower() for h in self.hosts.split(',') if h.strip()]
+
+
+class Term(models.Model):
+    name = models.CharField(max_length=50, unique=True)
+    start_date = models.DateField(null=True, blank=True)
+    end_date = models.DateField(null=True, blank=True)
+    is_current = models.BooleanField(default=False)
+
+    class Meta:
+        ordering = ['-start_date', '-id']
+
+    def __str__(self):
+        return self.name
+
+    @classmethod
+    def current(cls):
+        return cls.objects.filter(is_current=True).first()
+
 
 class Grade(models.Model):
     name = models.CharField(max_length=10, unique=True)
+
+    objects = TenantManager()
+
     def __str__(self):
         return self.name
     
 
+class ActivityQuerySet(models.QuerySet):
+    def running_at(self, day, at):
+        """Activities on ``day`` whose slot contains the time ``at``."""
+        return self.filter(day=day, start_time__lte=at, end_time__gt=at)
+
+    def starting_after(self, day, at):
+        """Activities on ``day`` that haven't started by ``at``, soonest first."""
+        return self.filter(day=day, start_time__gt=at).order_by('start_time')
+
+
 class Activity(models.Model):
     DAYS = [
         ('Monday','Monday'),('Tuesday','Tuesday'),('Wednesday','Wednesday'),
@@ -24,16 +74,48 @@ class Activity(models.Model):
     venue = models.CharField(max_length=150, blank=True, null=True)
     capacity = models.PositiveIntegerField(default=0, help_text="0 = Unlimited capacity")
     
-    time = models.CharField(max_length=50)
+    time = models.CharField(max_length=50, blank=True, help_text="e.g. 3:00pm - 4:00pm")
+    start_time = models.TimeField(null=True, blank=True)
+    end_time = models.TimeField(null=True, blank=True)
+    # maintained by bookings.journal; rebuild with ``manage.py rebuild_counters``
+    booked_count = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = TenantManager.from_queryset(ActivityQuerySet)()
 
     class Meta:
         ordering = ['day','name']
         unique_together = ('name','day')
         verbose_name_plural = "Activities"
+        indexes = [
+            models.Index(fields=['day', 'start_time', 'end_time']),
+            # day filter + default ordering; unique_together is (name, day)
+            models.Index(fields=['day', 'name']),
+        ]
 
     def __str__(self):
         return f"{self.name} ({self.day})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._saved_slot = tuple(instance.__dict__.get(f) for f in ('time', 'start_time', 'end_time'))
+        return instance
+
+    def save(self, *args, **kwargs):
+        # Keep the label and the slot in step without rewriting labels that
+        # still describe the slot: a changed slot gets a fresh label unless
+        # the stored one already reads as that slot, and a label edited on
+        # its own (e.g. by an import) is parsed into the slot.
+        saved_time, saved_start, saved_end = getattr(self, '_saved_slot', (None, None, None))
+        slot = (self.start_time, self.end_time)
+        if slot != (saved_start, saved_end):
+            if self.start_time and parse_time_range(self.time) != slot:
+                self.time = format_time_range(*slot)
+        elif self.time != saved_time or self.start_time is None:
+            self.start_time, self.end_time = parse_time_range(self.time) or (None, None)
+        super().save(*args, **kwargs)
+        self._saved_slot = (self.time, self.start_time, self.end_time)
+
     def bookings_count(self):
         return self.bookings.count()
     bookings_count.short_description = "Bookings"
@@ -57,6 +139,8 @@ class StudentProfile(models.Model):
     name = models.CharField(max_length=250, help_text="Full Name")
     grade = models.ForeignKey(Grade, on_delete=models.PROTECT)
 
+    objects = TenantManager()
+
     def __str__(self):
         return f"{self.name} ({self.grade})"
 
@@ -65,6 +149,16 @@ class StudentProfile(models.Model):
     
     
 
+class BookingQuerySet(models.QuerySet):
+    def roll_call(self, day, at):
+        """Bookings for the activities running on ``day`` at ``at``."""
+        return self.filter(
+            activity__day=day,
+            activity__start_time__lte=at,
+            activity__end_time__gt=at,
+        )
+
+
 class Booking(models.Model):
     student = models.ForeignKey(StudentProfile, on_delete=models.CASCADE)
     activity = models.ForeignKey(Activity, on_delete=models.CASCADE, related_name='bookings')
@@ -72,9 +166,22 @@ class Booking(models.Model):
     date_created = models.DateTimeField(auto_now_add=True)
     attended = models.BooleanField(default=False)
 
+    objects = TenantManager.from_queryset(BookingQuerySet)()
+
     class Meta:
         unique_together = ('student', 'day')
         ordering = ['-date_created']
+        # (student, day) is covered by the unique constraint; see BookingIndexTests
+        indexes = [
+            models.Index(fields=['student', 'activity']),
+            models.Index(fields=['-date_created', '-id']),
+        ]
+
+    def clean(self):
+        if self.student_id is None or self.activity_id is None:
+            return
+        # as save() does, so validate_unique() checks one booking per day against the right day
+        self.day = self.activity.day
 
     def save(self, *args, **kwargs):
         if self.activity:
@@ -90,3 +197,273 @@ class Booking(models.Model):
 
     def __str__(self):
         return f"{self.student} → {self.activity} on {self.day}"
+
+
+
+class SeatHoldQuerySet(models.QuerySet):
+    def active(self, now=None):
+        return self.filter(expires_at__gt=now or timezone.now())
+
+
+class SeatHold(models.Model):
+    """
+    A seat reserved while a student is in the booking wizard. It counts
+    against capacity until ``expires_at``; expired rows are simply ignored
+    and cleared out lazily (see bookings.seats).
+    """
+    student = models.ForeignKey(StudentProfile, on_delete=models.CASCADE, related_name='+')
+    activity = models.ForeignKey(Activity, on_delete=models.CASCADE, related_name='holds')
+    day = models.CharField(max_length=10)
+    expires_at = models.DateTimeField()
+
+    objects = TenantManager.from_queryset(SeatHoldQuerySet)()
+
+    class Meta:
+        unique_together = ('student', 'day')
+        indexes = [models.Index(fields=['activity', 'expires_at'])]
+
+    def __str__(self):
+        return f"{self.student} holds {self.activity} until {self.expires_at:%H:%M}"
+
+
+class OccurrenceQuerySet(models.QuerySet):
+    def in_term(self, term):
+        qs = self
+        if term.start_date:
+            qs = qs.filter(date__gte=term.start_date)
+        if term.end_date:
+            qs = qs.filter(date__lte=term.end_date)
+        return qs
+
+
+class Occurrence(models.Model):
+    """
+    One dated session of an activity. Rows are created on demand, the first
+    time a register is taken for that date (see bookings.attendance).
+    """
+    activity = models.ForeignKey(Activity, on_delete=models.CASCADE, related_name='occurrences')
+    date = models.DateField()
+
+    objects = TenantManager.from_queryset(OccurrenceQuerySet)()
+
+    class Meta:
+        unique_together = ('activity', 'date')
+        ordering = ['-date']
+
+    def __str__(self):
+        return f"{self.activity.name} on {self.date:%a %d %b %Y}"
+
+
+class Attendance(models.Model):
+    """
+    A booking's mark on one occurrence's register. ``rollover_term`` moves
+    the marks of the bookings it archives from ``booking`` to
+    ``archived_booking``, so past terms keep their registers.
+    """
+    occurrence = models.ForeignKey(Occurrence, on_delete=models.CASCADE, related_name='attendance')
+    booking = models.ForeignKey(Booking, on_delete=models.CASCADE, null=True, blank=True, related_name='attendance')
+    archived_booking = models.ForeignKey(
+        'ArchivedBooking', on_delete=models.CASCADE, null=True, blank=True, related_name='attendance',
+    )
+    present = models.BooleanField(default=False)
+
+    objects = TenantManager()
+
+    class Meta:
+        unique_together = ('occurrence', 'booking')
+
+    def __str__(self):
+        return f"{self.booking or self.archived_booking} {'present' if self.present else 'absent'} ({self.occurrence.date})"
+
+
+class FillRate(models.Model):
+    """
+    Net bookings (booked minus unbooked/archived) on an activity within one
+    minute or hour, rolled up from the journal by ``compact_fill_rates``
+    (see bookings.fillrate).
+    """
+    MINUTE = 'minute'
+    HOUR = 'hour'
+    RESOLUTIONS = [(MINUTE, 'Minute'), (HOUR, 'Hour')]
+
+    activity = models.ForeignKey(Activity, on_delete=models.CASCADE, related_name='fill_rates')
+    resolution = models.CharField(max_length=6, choices=RESOLUTIONS)
+    bucket = models.DateTimeField()
+    booked = models.IntegerField(default=0)
+
+    objects = TenantManager()
+
+    class Meta:
+        unique_together = ('activity', 'resolution', 'bucket')
+
+    def __str__(self):
+        return f"{self.activity} {self.bucket:%Y-%m-%d %H:%M} ({self.resolution}): {self.booked:+d}"
+
+
+class FillRateCursor(models.Model):
+    """
+    The last journal event folded into FillRate. A single row, locked and
+    moved in the same transaction as each fold (see bookings.fillrate).
+    """
+    last_event = models.BigIntegerField(default=0)
+
+    objects = TenantManager()
+
+    def __str__(self):
+        return f"Fill rates folded up to event {self.last_event}"
+
+
+class ArchivedBooking(models.Model):
+    """A booking from a past term, moved out of the live Booking table by ``rollover_term``."""
+    term = models.ForeignKey(Term, on_delete=models.PROTECT, related_name='archived_bookings')
+    booking_id = models.BigIntegerField()
+    student = models.ForeignKey(StudentProfile, on_delete=models.SET_NULL, null=True, blank=True)
+    student_name = models.CharField(max_length=250)
+    student_email = models.EmailField()
+    grade = models.CharField(max_length=10)
+    activity = models.ForeignKey(Activity, on_delete=models.SET_NULL, null=True, blank=True)
+    activity_name = models.CharField(max_length=150)
+    day = models.CharField(max_length=10)
+    date_created = models.DateTimeField()
+    attended = models.BooleanField(default=False)
+
+    class Meta:
+        ordering = ['-date_created']
+        indexes = [
+            models.Index(fields=['term', 'day', 'activity_name']),
+            # rollover_term looks its new rows up by booking
+            models.Index(fields=['term', 'booking_id']),
+        ]
+
+    def __str__(self):
+        return f"{self.student_name} → {self.activity_name} on {self.day} ({self.term})"
+
+    @classmethod
+    def from_booking(cls, booking, term):
+        return cls(
+            term=term,
+            booking_id=booking.pk,
+            student_id=booking.student_id,
+            student_name=booking.student.name,
+            student_email=booking.student.user.email,
+            grade=booking.student.grade.name,
+            activity_id=booking.activity_id,
+            activity_name=booking.activity.name,
+            day=booking.day,
+            date_created=booking.date_created,
+            attended=booking.attended,
+        )
+
+
+class BookingEvent(models.Model):
+    """
+    Append-only journal of booking changes. The primary key doubles as the
+    sequence number consumers page through with ``?since=``.
+    """
+    BOOK = 'book'
+    UNBOOK = 'unbook'
+    ATTENDANCE = 'attendance'
+    ADMIN_EDIT = 'admin_edit'
+    ARCHIVE = 'archive'
+    KINDS = [
+        (BOOK, 'Book'), (UNBOOK, 'Unbook'), (ATTENDANCE, 'Attendance'),
+        (ADMIN_EDIT, 'Admin edit'), (ARCHIVE, 'Archive'),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KINDS)
+    booking_id = models.BigIntegerField()
+    student = models.ForeignKey(StudentProfile, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    activity = models.ForeignKey(Activity, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    day = models.CharField(max_length=10)
+    actor = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.DO_NOTHING, db_constraint=False,
+        null=True, blank=True, related_name='+',
+    )
+    data = models.JSONField(default=dict, blank=True)
+    date_created = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        ordering = ['id']
+
+    def __str__(self):
+        return f"#{self.pk} {self.kind} booking {self.booking_id}"
+
+    def save(self, *args, **kwargs):
+        if self.pk is not None:
+            raise ValueError("Booking events are append-only.")
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        raise ValueError("Booking events are append-only.")
+
+
+class SearchTerm(models.Model):
+    """A normalised word or trigram pointing at a student; see bookings.search."""
+    STUDENT = 's'
+    ACTIVITY = 'a'
+    FIELDS = [(STUDENT, 'Student'), (ACTIVITY, 'Activity')]
+    MAX_LENGTH = 40
+
+    student = models.ForeignKey(StudentProfile, on_delete=models.CASCADE, related_name='+')
+    field = models.CharField(max_length=1, choices=FIELDS)
+    term = models.CharField(max_length=MAX_LENGTH)
+    is_word = models.BooleanField()
+
+    class Meta:
+        indexes = [models.Index(fields=['is_word', 'term', 'field', 'student'])]
+
+    def __str__(self):
+        return self.term
+
+
+class Job(models.Model):
+    """A unit of background work picked up by ``manage.py run_jobs``."""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = [
+        (PENDING, 'Pending'), (RUNNING, 'Running'),
+        (DONE, 'Done'), (FAILED, 'Failed'),
+    ]
+
+    kind = models.CharField(max_length=50)
+    params = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUSES, default=PENDING)
+    progress = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(default=0)
+    result = models.FileField(upload_to='jobs/', blank=True)
+    error = models.TextField(blank=True)
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True, blank=True,
+    )
+    date_created = models.DateTimeField(auto_now_add=True)
+    date_started = models.DateTimeField(null=True, blank=True)
+    date_finished = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-date_created']
+        indexes = [models.Index(fields=['status', 'id'])]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} #{self.pk} ({self.status})"
+
+    def get_kind_display(self):
+        return self.kind.replace('_', ' ').capitalize()
+
+    def percent(self):
+        if not self.total:
+            return 100 if self.status == self.DONE else 0
+        return int(self.progress * 100 / self.total)
+    percent.short_description = "Progress %"
+
+    def set_progress(self, progress, total=None):
+        """Persist progress without touching the rest of the row."""
+        self.progress = progress
+        fields = {'progress': progress}
+        if total is not None:
+            self.total = fields['total'] = total
+        Job.objects.filter(pk=self.pk).update(**fields)
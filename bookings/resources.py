@@ -1,7 +1,8 @@
 # activities/resources.py
 from import_export import resources, fields
 from import_export.widgets import ManyToManyWidget
-from .models import Grade, Activity, StudentProfile, Booking
+from . import journal
+from .models import Grade, Activity, StudentProfile, Booking, BookingEvent
 
 
 class GradeResource(resources.ModelResource):
@@ -28,6 +29,8 @@ class ActivityResource(resources.ModelResource):
             "capacity",
             "allowed_grades",
             "time",
+            "start_time",
+            "end_time",
         )
 
 
@@ -60,3 +63,8 @@ class BookingResource(resources.ModelResource):
             "date_created",
             "attended",
         )
+
+    def do_instance_save(self, instance, is_create):
+        super().do_instance_save(instance, is_create)
+        kind = BookingEvent.BOOK if is_create else BookingEvent.ADMIN_EDIT
+        journal.record(kind, instance, source="import")
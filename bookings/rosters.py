@@ -0,0 +1,84 @@
+# activities/rosters.py
+"""
+Printable activity rosters, one HTML page per activity and day, bundled
+into a ZIP. HTML rather than XLSX (openpyxl is available) because a roster
+is for printing: it opens and prints from any browser with the layout
+fixed, without a spreadsheet program or page setup.
+
+The caller does the query and passes plain dicts in. Filling in a page is
+a string format per roster, so it is done in the job's own process; the
+work is dominated by the query and the compression.
+"""
+import re
+import zipfile
+from html import escape
+
+PAGE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<style>
+  body {{ font-family: sans-serif; margin: 2em; }}
+  table {{ border-collapse: collapse; width: 100%; }}
+  th, td {{ border: 1px solid #999; padding: 4px 8px; text-align: left; }}
+  td.tick {{ width: 4em; }}
+  @media print {{ body {{ margin: 0; }} }}
+</style>
+</head>
+<body>
+<h2>{title}</h2>
+<p>{details}</p>
+<table>
+<thead><tr><th>#</th><th>Student</th><th>Grade</th><th>Email</th><th>Present</th></tr></thead>
+<tbody>
+{rows}
+</tbody>
+</table>
+<p>{count} student(s)</p>
+</body>
+</html>
+"""
+
+
+def filename(roster):
+    slug = re.sub(r'[^A-Za-z0-9]+', '-', f"{roster['day']}-{roster['activity']}").strip('-')
+    return f"{slug or 'roster'}.html"
+
+
+def render(roster):
+    """``(filename, html bytes)`` for one roster dict (activity, day, time, venue, instructor, students)."""
+    details = " &middot; ".join(
+        escape(str(roster[k])) for k in ('time', 'venue', 'instructor') if roster.get(k)
+    )
+    rows = "\n".join(
+        f"<tr><td>{i}</td><td>{escape(name)}</td><td>{escape(str(grade))}</td>"
+        f"<td>{escape(email)}</td><td class=\"tick\"></td></tr>"
+        for i, (name, grade, email) in enumerate(roster['students'], 1)
+    )
+    html = PAGE.format(
+        title=escape(f"{roster['activity']} ({roster['day']})"),
+        details=details,
+        rows=rows,
+        count=len(roster['students']),
+    )
+    return filename(roster), html.encode('utf-8')
+
+
+def write_bundle(rosters, fileobj, progress=None):
+    """
+    Render ``rosters`` one at a time into a ZIP on ``fileobj``, so only one
+    page is in memory at once. ``progress(n)`` is called after each roster.
+    """
+    with zipfile.ZipFile(fileobj, 'w', zipfile.ZIP_DEFLATED) as bundle:
+        seen = set()
+        for i, roster in enumerate(rosters, 1):
+            name, content = render(roster)
+            # two activities can slug to the same name
+            if name in seen:
+                name = f"{name[:-5]}-{i}.html"
+            seen.add(name)
+            bundle.writestr(name, content)
+            if progress:
+                progress(i)
+    return fileobj
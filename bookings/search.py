@@ -0,0 +1,141 @@
+# activities/search.py
+"""
+Student search index.
+
+Each student gets rows in SearchTerm for every normalised word of their
+name, email, grade and booked activities (for prefix matching) and every
+suffix of at least three letters of those words (for matching inside
+words: "xand" is a prefix of the suffix "xander" of "alexander"). Both are
+indexed prefix lookups instead of ``LIKE '%x%'`` over joins, and a match
+inside a word always comes from that one word.
+"""
+import re
+import threading
+import unicodedata
+
+from django.db import router
+
+from . import tenancy
+from .models import Activity, Booking, SearchTerm, StudentProfile
+
+_WORD = re.compile(r'[a-z0-9]+')
+# shortest piece of a word that is matched inside it
+MIN_INFIX = 3
+_pending = threading.local()
+
+
+def normalize(text):
+    text = unicodedata.normalize('NFKD', str(text or '')).encode('ascii', 'ignore').decode()
+    return _WORD.findall(text.lower())
+
+
+def suffixes(word):
+    return {word[i:] for i in range(len(word) - MIN_INFIX + 1)}
+
+
+def terms_for(field, *texts):
+    """``{(field, term, is_word)}`` for the given texts."""
+    rows = set()
+    for text in texts:
+        for word in normalize(text):
+            word = word[:SearchTerm.MAX_LENGTH]
+            rows.add((field, word, True))
+            rows.update((field, suffix, False) for suffix in suffixes(word))
+    return rows
+
+
+def index_student(student_id, fields=(SearchTerm.STUDENT, SearchTerm.ACTIVITY)):
+    """
+    Bring the student's rows for ``fields`` up to date, deleting and
+    inserting only the terms that changed: a booking moves a handful of
+    activity terms and leaves the rest alone.
+    """
+    student = (
+        StudentProfile.objects.select_related('user', 'grade')
+        .filter(pk=student_id).first()
+    )
+    with tenancy.atomic():
+        if student is None:
+            SearchTerm.objects.filter(student_id=student_id).delete()
+            return
+        wanted = set()
+        if SearchTerm.STUDENT in fields:
+            wanted |= terms_for(SearchTerm.STUDENT, student.name, student.user.email, student.grade.name)
+        if SearchTerm.ACTIVITY in fields:
+            activity_names = Booking.objects.filter(student_id=student_id).values_list('activity__name', flat=True)
+            wanted |= terms_for(SearchTerm.ACTIVITY, *activity_names)
+        stale = []
+        for pk, *row in SearchTerm.objects.filter(student_id=student_id, field__in=fields).values_list(
+                'pk', 'field', 'term', 'is_word'):
+            if tuple(row) in wanted:
+                wanted.discard(tuple(row))
+            else:
+                stale.append(pk)
+        if stale:
+            SearchTerm.objects.filter(pk__in=stale).delete()
+        SearchTerm.objects.bulk_create([
+            SearchTerm(student_id=student_id, field=field, term=term, is_word=is_word)
+            for field, term, is_word in wanted
+        ])
+
+
+def schedule_reindex(student_ids, fields=(SearchTerm.STUDENT, SearchTerm.ACTIVITY)):
+    """Reindex ``fields`` of the students once the current transaction commits, once per student."""
+    connection = tenancy.get_connection()
+    if not connection.in_atomic_block:
+        for student_id in set(student_ids):
+            index_student(student_id, fields)
+        return
+
+    # reuse the batch already queued for this transaction on this school's
+    # database, unless it was discarded by a rollback
+    alias = router.db_for_write(SearchTerm)
+    batches = getattr(_pending, 'batches', None)
+    if batches is None:
+        batches = _pending.batches = {}
+    batch = batches.get(alias)
+    if batch is None or not any(func is batch for _, func, *_ in connection.run_on_commit):
+        tenant = tenancy.current()
+
+        def batch():
+            batches.pop(alias, None)
+            with tenancy.use(tenant):
+                for student_id, student_fields in batch.fields.items():
+                    index_student(student_id, tuple(student_fields))
+
+        batch.fields = {}
+        batches[alias] = batch
+        tenancy.on_commit(batch)
+    for student_id in student_ids:
+        batch.fields.setdefault(student_id, set()).update(fields)
+
+
+def search_students(query, fields=(SearchTerm.STUDENT, SearchTerm.ACTIVITY), limit=None):
+    """Ids of students matching every word of ``query``."""
+    words = normalize(query)
+    if not words:
+        return []
+    matched = None
+    for word in words:
+        # short words only match the start of a word; longer ones anywhere in one
+        is_word = len(word) < MIN_INFIX
+        ids = SearchTerm.objects.filter(
+            is_word=is_word, term__startswith=word[:SearchTerm.MAX_LENGTH], field__in=fields,
+        )
+        ids = set(ids.values_list('student_id', flat=True))
+        matched = ids if matched is None else matched & ids
+        if not matched:
+            return []
+    matched = sorted(matched)
+    return matched[:limit] if limit else matched
+
+
+def search_activities(query):
+    """Ids of activities whose name contains every word of ``query``; the table is small."""
+    words = normalize(query)
+    if not words:
+        return []
+    return [
+        a.pk for a in Activity.objects.only('name')
+        if all(any(w in n for n in normalize(a.name)) for w in words)
+    ]
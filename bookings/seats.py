@@ -0,0 +1,114 @@
+# activities/seats.py
+"""
+Seat claims against ``Activity.booked_count``.
+
+``claim()`` takes a seat with one conditional UPDATE, so two requests can
+never both get the last seat, and there is no count-then-insert window.
+
+Seat holds reserve a seat for a student working through the booking
+wizard. Other students' live holds count as taken seats; a hold lapses
+after ``HOLD_TTL`` without any cleanup job, since every count ignores
+expired rows and ``hold()`` deletes the expired rows of the activity it
+touches.
+"""
+from datetime import timedelta
+
+from django.db.models import Count, F, IntegerField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import journal, metrics, search, tenancy
+from .models import Activity, Booking, BookingEvent, SearchTerm, SeatHold
+
+HOLD_TTL = timedelta(minutes=10)
+
+
+class SeatTaken(ValueError):
+    """No seat left on ``activity``."""
+
+    def __init__(self, activity):
+        super().__init__(f"{activity} is already full.")
+        self.activity = activity
+
+
+def _other_holds(student, now=None):
+    holds = SeatHold.objects.active(now)
+    return holds.exclude(student=student) if student is not None else holds
+
+
+def held_counts(activity_ids, student=None):
+    """``{activity_id: live holds}``, not counting ``student``'s own."""
+    rows = (
+        _other_holds(student).filter(activity_id__in=activity_ids)
+        .order_by().values('activity_id').annotate(n=Count('pk'))
+    )
+    return {row['activity_id']: row['n'] for row in rows}
+
+
+def claim(activity, student=None):
+    """Take one seat on ``activity``; False if it is full (other students' holds count)."""
+    holds = (
+        _other_holds(student).filter(activity=OuterRef('pk'))
+        .order_by().values('activity').annotate(n=Count('pk')).values('n')
+    )
+    held = Coalesce(Subquery(holds, output_field=IntegerField()), Value(0))
+    return bool(
+        Activity.objects.filter(pk=activity.pk)
+        .filter(Q(capacity=0) | Q(capacity__gt=F('booked_count') + held))
+        .update(booked_count=F('booked_count') + 1)
+    )
+
+
+def hold(student, activity):
+    """
+    Hold a seat on ``activity`` for ``student`` for ``HOLD_TTL``, replacing
+    their hold for that day. False if the activity has no free seat.
+    """
+    now = timezone.now()
+    with tenancy.atomic():
+        # the row lock serialises holds on this activity
+        capacity, booked = (
+            Activity.objects.select_for_update().filter(pk=activity.pk)
+            .values_list('capacity', 'booked_count').get()
+        )
+        SeatHold.objects.filter(activity=activity, expires_at__lte=now).delete()
+        if capacity and booked + _other_holds(student, now).filter(activity=activity).count() >= capacity:
+            return False
+        SeatHold.objects.update_or_create(
+            student=student, day=activity.day,
+            defaults={'activity': activity, 'expires_at': now + HOLD_TTL},
+        )
+    return True
+
+
+def release(student, day=None):
+    """Drop ``student``'s holds (for one ``day``, or all of them)."""
+    holds = SeatHold.objects.filter(student=student)
+    if day is not None:
+        holds = holds.filter(day=day)
+    holds.delete()
+
+
+def swap(booking, activity, actor=None):
+    """
+    Move ``booking`` to ``activity`` (same day) in one transaction: claim the
+    new seat, repoint the booking row and release the old seat. Raises
+    ValueError, with nothing changed, if the new activity is full or the
+    booking changed underneath us.
+    """
+    if activity.day != booking.day:
+        raise ValueError(f"{activity.name} is not on {booking.day}.")
+    old_activity_id = booking.activity_id
+
+    with tenancy.atomic():
+        if not claim(activity, booking.student_id):
+            raise SeatTaken(activity)
+        moved = Booking.objects.filter(pk=booking.pk, activity_id=old_activity_id).update(activity=activity)
+        if not moved:
+            metrics.inc('booking_claim_conflicts_total', view='swap_activity')
+            raise ValueError("Your booking was changed by another request. Please try again.")
+        journal.record(BookingEvent.UNBOOK, booking, actor, activity_id=old_activity_id, swapped_to=activity.pk)
+        booking.activity = activity
+        journal.record(BookingEvent.BOOK, booking, actor, claimed=True, swapped_from=old_activity_id)
+        search.schedule_reindex([booking.student_id], fields=(SearchTerm.ACTIVITY,))
+    return booking
@@ -0,0 +1,72 @@
+# activities/signals.py
+from django.conf import settings
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import journal
+from .caching import bump_version
+from .models import Activity, Booking, BookingEvent, SearchTerm, StudentProfile, Term
+from .search import schedule_reindex
+
+
+@receiver(post_save, sender=Activity)
+@receiver(post_delete, sender=Activity)
+@receiver(m2m_changed, sender=Activity.allowed_grades.through)
+@receiver(post_save, sender=Term)
+def activity_changed(sender, **kwargs):
+    bump_version('activities')
+
+
+# keep the student search index current
+
+@receiver(post_save, sender=StudentProfile)
+def student_changed(sender, instance, **kwargs):
+    schedule_reindex([instance.pk], fields=(SearchTerm.STUDENT,))
+
+
+# cached request.student (StudentContextMiddleware)
+
+@receiver(post_save, sender=StudentProfile)
+@receiver(post_delete, sender=StudentProfile)
+def student_context_changed(sender, instance, **kwargs):
+    bump_version('user', instance.user_id)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def user_changed(sender, instance, created, **kwargs):
+    if not created:
+        schedule_reindex(StudentProfile.objects.filter(user=instance).values_list('pk', flat=True), fields=(SearchTerm.STUDENT,))
+
+
+@receiver(post_save, sender=Booking)
+@receiver(post_delete, sender=Booking)
+def booking_changed(sender, instance, **kwargs):
+    schedule_reindex([instance.student_id], fields=(SearchTerm.ACTIVITY,))
+
+
+# Bookings deleted by a cascade (a student, their user account or an
+# activity going away) are journaled as unbooks, like any other removal, so
+# booked_count and the journal stay in step. pre_delete runs while the
+# bookings are still there.
+
+@receiver(pre_delete, sender=StudentProfile)
+def student_deleted(sender, instance, **kwargs):
+    journal.record_many(BookingEvent.UNBOOK, Booking.objects.filter(student=instance), cascade='student')
+
+
+@receiver(pre_delete, sender=Activity)
+def activity_deleted(sender, instance, **kwargs):
+    journal.record_many(BookingEvent.UNBOOK, Booking.objects.filter(activity=instance), cascade='activity')
+
+
+@receiver(pre_save, sender=Activity)
+def remember_activity_name(sender, instance, **kwargs):
+    if instance.pk:
+        instance._old_name = Activity.objects.filter(pk=instance.pk).values_list('name', flat=True).first()
+
+
+@receiver(post_save, sender=Activity)
+def activity_renamed(sender, instance, created, **kwargs):
+    if created or getattr(instance, '_old_name', instance.name) == instance.name:
+        return
+    schedule_reindex(Booking.objects.filter(activity=instance).values_list('student_id', flat=True), fields=(SearchTerm.ACTIVITY,))
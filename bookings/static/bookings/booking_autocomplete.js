@@ -0,0 +1,21 @@
+/*
+ * Booking admin form: send the other field's current value with each
+ * autocomplete lookup, so students are narrowed to the activity's allowed
+ * grades and activities to the student's grade.
+ */
+'use strict';
+(function($) {
+    const forward = {student: 'activity', activity: 'student'};
+
+    $.ajaxPrefilter(function(options) {
+        if (typeof options.data !== 'string' || options.data.indexOf('model_name=booking') === -1) {
+            return;
+        }
+        const field = new URLSearchParams(options.data).get('field_name');
+        const other = forward[field];
+        const value = other && $('#id_' + other).val();
+        if (value) {
+            options.data += '&' + other + '=' + encodeURIComponent(value);
+        }
+    });
+})(django.jQuery);
@@ -0,0 +1,40 @@
+# activities/suggestions.py
+"""
+Alternatives to offer when the activity a student wanted is full.
+
+Candidates come from the per-grade catalog in the shared cache, so there
+is no catalog query. That entry holds only static fields: open seats are
+never cached but read on every call from ``Activity.booked_count`` and the
+live seat holds, as in ``catalog.with_vacancy``. Activities in the same
+time slot rank first, then the least full.
+"""
+from . import catalog
+
+LIMIT = 3
+
+
+def _fill(row):
+    return 0.0 if row['capacity'] == 0 else row['booked'] / row['capacity']
+
+
+def alternatives(activity, student, exclude=(), limit=LIMIT):
+    """
+    Up to ``limit`` catalog rows (with vacancy and ``same_slot``) on the
+    activity's day that ``student`` can still get a seat on.
+    """
+    skip = {activity.pk, *exclude}
+    rows = [
+        row for row in catalog.grade_catalog(student.grade_id)
+        if row['day'] == activity.day and row['id'] not in skip
+    ]
+    if not rows:
+        return []
+    slot = (activity.start_time, activity.end_time)
+    options = []
+    for row in catalog.with_vacancy(rows, student):
+        if row['spots_left'] == 0:
+            continue
+        row['same_slot'] = slot != (None, None) and (row['start_time'], row['end_time']) == slot
+        options.append(row)
+    options.sort(key=lambda r: (not r['same_slot'], _fill(r), r['name']))
+    return options[:limit]
@@ -0,0 +1,154 @@
+# activities/tenancy.py
+"""
+Multi-school tenancy.
+
+Each School (tenant) lives on its own database alias. The tenant for a
+request is resolved by ``TenantMiddleware`` from the host name or a
+``/t/<slug>/`` path prefix; management commands use the ``BOOKINGS_TENANT``
+environment variable. ``TenantRouter`` and the tenant-scoped managers send
+every query to the current tenant's database; the School registry itself
+always lives on ``default``. With no schools configured everything runs on
+``default`` exactly as a single-school deployment.
+
+Code that opens transactions must use ``tenancy.atomic()`` and
+``tenancy.on_commit()`` so they apply to the tenant's connection.
+"""
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import models, transaction
+from django.utils.encoding import iri_to_uri
+
+_current = ContextVar('bookings_tenant', default=None)
+
+# School lookups are cached in-process for this many seconds
+LOOKUP_TTL = 60
+_lookup_cache = {}
+
+
+def _default():
+    from .models import School
+    return School(slug='default', name='Default', db_alias='default')
+
+
+def _schools():
+    cached = _lookup_cache.get('schools')
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+    from .models import School
+    schools = list(School.objects.using('default').all())
+    _lookup_cache['schools'] = (time.monotonic() + LOOKUP_TTL, schools)
+    return schools
+
+
+def clear_cache():
+    _lookup_cache.clear()
+
+
+def by_slug(slug):
+    return next((s for s in _schools() if s.slug == slug), None)
+
+
+def by_host(host):
+    host = host.split(':')[0].lower()
+    return next((s for s in _schools() if host in s.host_list()), None)
+
+
+def all_tenants():
+    """One tenant per database alias, the default alias included."""
+    tenants = {s.db_alias: s for s in _schools()}
+    tenants.setdefault('default', _default())
+    return list(tenants.values())
+
+
+def current():
+    tenant = _current.get()
+    if tenant is None:
+        slug = os.environ.get('BOOKINGS_TENANT')
+        tenant = by_slug(slug) if slug else None
+    return tenant or _default()
+
+
+def db_alias():
+    return current().db_alias
+
+
+@contextmanager
+def use(tenant):
+    token = _current.set(tenant)
+    try:
+        yield tenant
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def atomic():
+    """``transaction.atomic`` on the current tenant's database; usable as a decorator."""
+    with transaction.atomic(using=db_alias()):
+        yield
+
+
+def on_commit(func):
+    transaction.on_commit(func, using=db_alias())
+
+
+def get_connection():
+    return transaction.get_connection(db_alias())
+
+
+def make_cache_key(key, key_prefix, version):
+    """CACHES KEY_FUNCTION: keep each school's cache entries apart."""
+    return f'{key_prefix}:{version}:{current().slug}:{key}'
+
+
+class TenantManager(models.Manager):
+    """Manager whose querysets run against the current tenant's database."""
+    def get_queryset(self):
+        qs = super().get_queryset()
+        return qs if self._db else qs.using(db_alias())
+
+
+class TenantRouter:
+    REGISTRY = {'bookings.school'}
+
+    def db_for_read(self, model, **hints):
+        if model._meta.label_lower in self.REGISTRY:
+            return 'default'
+        return db_alias()
+
+    db_for_write = db_for_read
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return obj1._state.db == obj2._state.db
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if f'{app_label}.{model_name}' in self.REGISTRY:
+            return db == 'default'
+        return None
+
+
+class TenantMiddleware:
+    """Resolve the tenant by host, or by a ``/t/<slug>/`` prefix that is then stripped."""
+    PREFIX = '/t/'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        tenant = by_host(request.get_host())
+        if tenant is None and request.path_info.startswith(self.PREFIX):
+            slug, _, rest = request.path_info[len(self.PREFIX):].partition('/')
+            tenant = by_slug(slug)
+            if tenant is not None:
+                prefix = f'{self.PREFIX}{slug}'
+                request.path_info = '/' + rest
+                request.path = request.META.get('SCRIPT_NAME', '').rstrip('/') + prefix + request.path_info
+                request.META['SCRIPT_NAME'] = request.META.get('SCRIPT_NAME', '').rstrip('/') + prefix
+                from django.urls import set_script_prefix
+                set_script_prefix(iri_to_uri(request.META['SCRIPT_NAME'] + '/'))
+        request.tenant = tenant or _default()
+        with use(request.tenant):
+            return self.get_response(request)
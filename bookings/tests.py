@@ -1,3 +1,1659 @@
-from django.test import TestCase
+import json
+import math
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time as time_module
+import timeit
+import zipfile
+from collections import defaultdict
+from io import StringIO
+from datetime import date, time, timedelta
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.admin.sites import site
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection, transaction
+from django.db.models import Count, QuerySet
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from . import attendance, capacity, changelist, enrollment, fillrate, ical, jobs, journal, metrics, search, seats, suggestions, tenancy
+from .forms import BookingAdminForm
+from .middleware import AdmissionControlMiddleware
+from .models import Activity, ArchivedBooking, Attendance, Booking, BookingEvent, FillRate, Grade, Job, School, SearchTerm, SeatHold, StudentProfile, Term
+
+
+class QueryPlanTestCase(TestCase):
+    """Fails when a hot query stops being served by an index.
+
+    sqlite: the plan must not contain a bare ``SCAN <table>`` (a full table
+    scan) and, with ``ordered=True``, no temporary sort. MySQL: every table
+    in the plan must have a usable key. ``index`` pins the plan to one
+    index, matched by name or by its columns.
+    """
+
+    def plan(self, queryset):
+        if connection.vendor == 'mysql':
+            return queryset.explain(format='json')
+        return queryset.explain()
+
+    def assertUsesIndex(self, queryset, index=None, ordered=False):
+        plan = self.plan(queryset)
+        if connection.vendor == 'mysql':
+            tables = []
+
+            def walk(node):
+                if isinstance(node, dict):
+                    if 'table_name' in node:
+                        tables.append(node)
+                    for value in node.values():
+                        walk(value)
+                elif isinstance(node, list):
+                    for value in node:
+                        walk(value)
+            walk(json.loads(plan))
+            for table in tables:
+                keys = table.get('key') or ','.join(table.get('possible_keys', []))
+                self.assertTrue(keys, f"no index for {table['table_name']}:\n{plan}")
+        else:
+            full_scans = re.findall(r'SCAN (\w+)$', plan, re.MULTILINE)
+            self.assertFalse(full_scans, f"full table scan of {full_scans}:\n{plan}")
+            if ordered:
+                self.assertNotIn('TEMP B-TREE', plan, f"sorted without an index:\n{plan}")
+        if index:
+            self.assertIn(index, plan)
+        return plan
+
+    def index_name(self, model, *fields):
+        for index in model._meta.indexes:
+            if tuple(index.fields) == fields:
+                return index.name
+        raise AssertionError(f"{model.__name__} has no index on {fields}")
+
+
+class BookingIndexTests(QueryPlanTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.grade = Grade.objects.create(name='Grade 7')
+        cls.activity = Activity.objects.create(
+            name='Chess', day='Monday', time='3:00pm - 4:00pm', capacity=10,
+        )
+        cls.activity.allowed_grades.add(cls.grade)
+        cls.user = get_user_model().objects.create_user('s1@example.com', 'x')
+        cls.student = StudentProfile.objects.create(user=cls.user, name='Student 1', grade=cls.grade)
+
+    # views.book_activity / booking_wizard
+    def test_existing_booking_for_day(self):
+        qs = Booking.objects.filter(student=self.student, day='Monday')
+        self.assertUsesIndex(qs, index='student_id_day')
+
+    def test_student_booking_total(self):
+        self.assertUsesIndex(Booking.objects.filter(student=self.student).order_by())
+
+    # views.unbook_activity
+    def test_booking_by_student_and_activity(self):
+        qs = Booking.objects.filter(student=self.student, activity_id=self.activity.pk).order_by()
+        self.assertUsesIndex(qs, index=self.index_name(Booking, 'student', 'activity'))
+
+    # Booking.save capacity check / Activity.bookings_count
+    def test_activity_booking_count(self):
+        self.assertUsesIndex(self.activity.bookings.order_by())
+
+    # views.dashboard
+    def test_bookings_per_student(self):
+        qs = Booking.objects.values('student').annotate(total=Count('id')).order_by()
+        self.assertUsesIndex(qs)
+
+    # views.roll_call
+    def test_roll_call(self):
+        self.assertUsesIndex(Booking.objects.roll_call('Monday', time(15)).order_by())
+
+    # admin changelist: default ordering, date_hierarchy and the day filter
+    def test_admin_changelist(self):
+        request = RequestFactory().get('/admin/bookings/booking/')
+        request.user = get_user_model().objects.create_superuser('admin@example.com', 'x')
+        changelist = site._registry[Booking].get_changelist_instance(request)
+        qs = changelist.get_queryset(request)
+        self.assertUsesIndex(qs[:100], index=self.index_name(Booking, '-date_created', '-id'), ordered=True)
+
+    def test_admin_date_hierarchy(self):
+        qs = Booking.objects.filter(date_created__year=2026)[:100]
+        self.assertUsesIndex(qs, index=self.index_name(Booking, '-date_created', '-id'), ordered=True)
+
+    def test_admin_day_filter(self):
+        self.assertUsesIndex(Booking.objects.filter(activity__day='Monday').order_by())
+
+    # views.booking_changes
+    def test_journal_feed(self):
+        self.assertUsesIndex(BookingEvent.objects.filter(pk__gt=0).order_by('pk')[:500], ordered=True)
+
+
+class ActivityIndexTests(QueryPlanTestCase):
+    # views.booking_wizard / admin list_filter
+    def test_activities_for_day(self):
+        qs = Activity.objects.filter(day='Monday')
+        self.assertUsesIndex(qs, index=self.index_name(Activity, 'day', 'name'), ordered=True)
+
+    # catalog.grade_catalog
+    def test_activities_for_grade(self):
+        self.assertUsesIndex(Activity.objects.filter(allowed_grades=1).order_by())
+
+    def test_catalog_ordering(self):
+        self.assertUsesIndex(Activity.objects.order_by('day', 'name'), ordered=True)
+
+    # views.roll_call
+    def test_running_at(self):
+        qs = Activity.objects.running_at('Monday', time(15)).order_by()
+        self.assertUsesIndex(qs, index=self.index_name(Activity, 'day', 'start_time', 'end_time'))
+
+
+class TenantLoginTests(TestCase):
+    """A school reached by ``/t/<slug>/`` keeps that prefix through login."""
+
+    def setUp(self):
+        School.objects.create(slug='b', name='School B', db_alias='default')
+        tenancy.clear_cache()
+        self.addCleanup(tenancy.clear_cache)
+
+    def test_login_required_redirect(self):
+        response = self.client.get('/t/b/activity/')
+        self.assertRedirects(response, '/t/b/login/?next=/t/b/activity/', fetch_redirect_response=False)
+
+    def test_login_returns_to_tenant(self):
+        get_user_model().objects.create_user('student@example.com', 'pw')
+        response = self.client.post('/t/b/login/', {'username': 'student@example.com', 'password': 'pw'})
+        self.assertRedirects(response, '/t/b/', fetch_redirect_response=False)
+
+        response = self.client.post('/t/b/logout/')
+        self.assertRedirects(response, '/t/b/login/', fetch_redirect_response=False)
+
+
+def make_student(email, grade, name=None):
+    user = get_user_model().objects.create_user(email, 'pw')
+    return StudentProfile.objects.create(user=user, name=name or email.split('@')[0], grade=grade)
+
+
+def make_activity(name, grade, day='Monday', capacity=0, start=time(15), end=time(16)):
+    activity = Activity.objects.create(name=name, day=day, capacity=capacity, start_time=start, end_time=end)
+    activity.allowed_grades.add(grade)
+    return activity
+
+
+class StudentContextTests(TestCase):
+    """request.student comes from one cache read until a booking or profile change."""
+
+    def setUp(self):
+        cache.clear()
+        self.grade = Grade.objects.create(name='9')
+        self.student = make_student('ctx@example.com', self.grade)
+        self.activity = make_activity('Chess', self.grade)
+        self.client.login(username='ctx@example.com', password='pw')
+
+    def get_context(self):
+        with CaptureQueriesContext(connection) as captured, \
+                mock.patch.object(cache, 'get_many', wraps=cache.get_many) as get_many:
+            response = self.client.get('/my-bookings/')
+        profile_queries = [q for q in captured if 'bookings_studentprofile' in q['sql']]
+        return response.wsgi_request, profile_queries, get_many.call_count
+
+    def test_warm_request(self):
+        request, queries, _ = self.get_context()
+        self.assertEqual(request.student, self.student)
+        self.assertEqual(len(queries), 1)
+        request, queries, reads = self.get_context()
+        self.assertEqual((request.student.grade, request.student_bookings), (self.grade, {}))
+        self.assertEqual((queries, reads), ([], 1))
+
+    def test_booking_invalidates(self):
+        self.get_context()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/book/{self.activity.pk}/')
+        request, queries, _ = self.get_context()
+        self.assertEqual(request.student_bookings, {'Monday': self.activity.pk})
+        self.assertEqual(len(queries), 1)
+
+    def test_profile_edit_invalidates(self):
+        self.get_context()
+        self.student.name = 'Renamed'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.student.save()
+        request, _, _ = self.get_context()
+        self.assertEqual(request.student.name, 'Renamed')
+
+
+class ActivityTimeTests(TestCase):
+    """The free-text time label and the structured slot stay in step."""
+
+    def setUp(self):
+        self.grade = Grade.objects.create(name='9')
+
+    def test_label_parsed_and_kept(self):
+        activity = Activity.objects.create(name='Chess', day='Monday', time='3 to 4 PM')
+        self.assertEqual((activity.start_time, activity.end_time), (time(15), time(16)))
+        activity = Activity.objects.get(pk=activity.pk)
+        activity.venue = 'Hall'
+        activity.save()
+        self.assertEqual(Activity.objects.get(pk=activity.pk).time, '3 to 4 PM')
+
+    def test_slot_change_relabels(self):
+        activity = Activity.objects.create(name='Chess', day='Monday', time='3 to 4 PM')
+        activity.start_time, activity.end_time = time(17), time(18, 30)
+        activity.save()
+        self.assertEqual(activity.time, '5:00pm - 6:30pm')
+        activity = Activity.objects.create(name='Drama', day='Monday', start_time=time(9), end_time=time(10))
+        self.assertEqual(activity.time, '9:00am - 10:00am')
+
+    def test_label_edit_reparses(self):
+        activity = Activity.objects.create(name='Chess', day='Monday', time='3 to 4 PM')
+        activity = Activity.objects.get(pk=activity.pk)
+        activity.time = '16:00-17:00'
+        activity.save()
+        self.assertEqual((activity.start_time, activity.end_time, activity.time), (time(16), time(17), '16:00-17:00'))
+        activity.time = 'after lunch'
+        activity.save()
+        self.assertEqual((activity.start_time, activity.end_time), (None, None))
+
+    def test_slot_queries(self):
+        chess = make_activity('Chess', self.grade, start=time(15), end=time(16))
+        drama = make_activity('Drama', self.grade, start=time(16), end=time(17))
+        make_activity('Art', self.grade, day='Tuesday', start=time(15), end=time(16))
+        self.assertEqual(list(Activity.objects.running_at('Monday', time(15, 30))), [chess])
+        self.assertEqual(list(Activity.objects.running_at('Monday', time(16))), [drama])
+        self.assertEqual(list(Activity.objects.starting_after('Monday', time(15, 30))), [drama])
+        student = make_student('roll@example.com', self.grade)
+        booking = Booking.objects.create(student=student, activity=chess)
+        self.assertEqual(list(Booking.objects.roll_call('Monday', time(15))), [booking])
+        self.assertEqual(list(Booking.objects.roll_call('Monday', time(16))), [])
+
+    def test_roll_call_view(self):
+        make_activity('Chess', self.grade)
+        self.client.force_login(get_user_model().objects.create_superuser('staff@example.com', 'pw'))
+        response = self.client.get('/roll-call/', {'day': 'Monday', 'at': '15:30'})
+        self.assertContains(response, 'Chess')
+        self.assertEqual(self.client.get('/roll-call/', {'day': 'Someday'}).status_code, 400)
+        self.assertEqual(self.client.get('/roll-call/', {'day': 'Monday', 'at': '25:00'}).status_code, 400)
+
+    def test_one_booking_per_day(self):
+        student = make_student('day@example.com', self.grade)
+        Booking.objects.create(student=student, activity=make_activity('Chess', self.grade))
+        booking = Booking(student=student, activity=make_activity('Drama', self.grade))
+        with self.assertRaises(ValidationError):
+            booking.full_clean()
+        self.assertEqual(booking.day, 'Monday')
+
+
+class JournalTests(TestCase):
+    """Every booking write leaves a journal event and keeps booked_count in step."""
+
+    def setUp(self):
+        self.grade = Grade.objects.create(name='9')
+        self.student = make_student('journal@example.com', self.grade)
+        self.activities = {day: make_activity(f'Chess {day}', self.grade, day=day) for day, _ in Activity.DAYS[:4]}
+        self.chess = self.activities['Monday']
+        self.admin = get_user_model().objects.create_superuser('admin@example.com', 'pw')
+
+    def kinds(self):
+        return list(BookingEvent.objects.values_list('kind', 'activity_id'))
+
+    def assertCountersMatchLiveRows(self):
+        for activity in Activity.objects.annotate(live=Count('bookings')):
+            self.assertEqual(activity.booked_count, activity.live, activity)
+        call_command('rebuild_counters', '--verify', stdout=(out := StringIO()))
+        self.assertIn("0 activit(y/ies) out of step", out.getvalue())
+
+    def test_book_and_unbook(self):
+        self.client.login(username='journal@example.com', password='pw')
+        for activity in self.activities.values():
+            self.client.post(f'/book/{activity.pk}/')
+        self.client.post(f'/unbook/{self.chess.pk}/')
+        self.assertEqual(self.kinds(), [(BookingEvent.BOOK, a.pk) for a in self.activities.values()] + [(BookingEvent.UNBOOK, self.chess.pk)])
+        self.assertCountersMatchLiveRows()
+
+    def test_admin_edits(self):
+        self.client.force_login(self.admin)
+        data = {'student': self.student.pk, 'activity': self.chess.pk, 'day': 'Monday'}
+        self.client.post('/admin/bookings/booking/add/', data)
+        booking = Booking.objects.get()
+        other = make_activity('Drama', self.grade)
+        self.client.post(f'/admin/bookings/booking/{booking.pk}/change/', {**data, 'activity': other.pk, 'attended': 'on'})
+        self.assertEqual(self.kinds(), [
+            (BookingEvent.BOOK, self.chess.pk),
+            (BookingEvent.UNBOOK, self.chess.pk), (BookingEvent.BOOK, other.pk),
+            (BookingEvent.ATTENDANCE, other.pk),
+        ])
+        self.client.post(f'/admin/bookings/booking/{booking.pk}/delete/', {'post': 'yes'})
+        self.assertEqual(self.kinds()[-1], (BookingEvent.UNBOOK, other.pk))
+        self.assertCountersMatchLiveRows()
+
+    def test_cascade_delete(self):
+        journal.record(BookingEvent.BOOK, Booking.objects.create(student=self.student, activity=self.chess))
+        pk = self.chess.pk
+        self.chess.delete()
+        self.assertEqual(self.kinds()[-1], (BookingEvent.UNBOOK, pk))
+        self.assertCountersMatchLiveRows()
+
+    def test_archive(self):
+        Term.objects.create(name='Autumn', is_current=True)
+        journal.record(BookingEvent.BOOK, Booking.objects.create(student=self.student, activity=self.chess))
+        call_command('rollover_term', 'Spring', stdout=StringIO())
+        self.assertEqual(self.kinds()[-1], (BookingEvent.ARCHIVE, self.chess.pk))
+        self.assertCountersMatchLiveRows()
+
+    def test_rebuild_counters(self):
+        journal.record(BookingEvent.BOOK, Booking.objects.create(student=self.student, activity=self.chess))
+        Activity.objects.update(booked_count=7)
+        call_command('rebuild_counters', stdout=StringIO())
+        self.assertEqual(Activity.objects.get(pk=self.chess.pk).booked_count, 1)
+        self.assertCountersMatchLiveRows()
+
+        # a booking the journal never saw: only --recount repairs it
+        Booking.objects.create(student=self.student, activity=self.activities['Tuesday'])
+        call_command('rebuild_counters', stdout=StringIO())
+        self.assertEqual(Activity.objects.get(day='Tuesday').booked_count, 0)
+        call_command('rebuild_counters', '--recount', stdout=StringIO())
+        self.assertEqual(Activity.objects.get(day='Tuesday').booked_count, 1)
+
+
+class RolloverTests(TestCase):
+    """rollover_term moves the live bookings into the archive in chunks."""
+
+    def setUp(self):
+        self.autumn = Term.objects.create(name='Autumn', is_current=True)
+        self.grade = Grade.objects.create(name='9')
+        self.chess = make_activity('Chess', self.grade, capacity=5)
+        self.drama = make_activity('Drama', self.grade, day='Tuesday')
+        self.bookings = []
+        for n, activity in enumerate([self.chess, self.chess, self.drama]):
+            student = make_student(f'a{n}@example.com', self.grade, name=f'Student {n}')
+            self.bookings.append(Booking.objects.create(student=student, activity=activity))
+            journal.record(BookingEvent.BOOK, self.bookings[-1])
+
+    def rollover(self, *args):
+        call_command('rollover_term', 'Spring', *args, stdout=(out := StringIO()))
+        return out.getvalue()
+
+    def test_archive_in_chunks(self):
+        out = self.rollover('--chunk-size', '2', '--start', '2026-01-05')
+        self.assertIn("  2/3", out)
+        self.assertFalse(Booking.objects.exists())
+
+        archived = ArchivedBooking.objects.get(booking_id=self.bookings[2].pk)
+        self.assertEqual(
+            (archived.term, archived.student_name, archived.student_email, archived.grade, archived.activity_name, archived.day),
+            (self.autumn, 'Student 2', 'a2@example.com', '9', 'Drama', 'Tuesday'),
+        )
+        self.assertEqual(ArchivedBooking.objects.filter(term=self.autumn).count(), 3)
+
+        self.autumn.refresh_from_db()
+        self.assertFalse(self.autumn.is_current)
+        self.assertEqual(self.autumn.end_date, timezone.localdate())
+        spring = Term.current()
+        self.assertEqual((spring.name, str(spring.start_date)), ('Spring', '2026-01-05'))
+
+    def test_journal_and_counters(self):
+        self.rollover()
+        events = BookingEvent.objects.filter(kind=BookingEvent.ARCHIVE)
+        self.assertEqual(sorted(e.booking_id for e in events), sorted(b.pk for b in self.bookings))
+        self.assertEqual({e.data['term'] for e in events}, {'Autumn'})
+        # the archived seats are free again for the new term
+        self.assertEqual(list(Activity.objects.values_list('booked_count', flat=True)), [0, 0])
+
+    def test_dry_run(self):
+        self.assertIn("Archiving 3 booking(s) from Autumn.", self.rollover('--dry-run'))
+        self.assertEqual(Booking.objects.count(), 3)
+        self.assertEqual(Term.current(), self.autumn)
+
+    def test_refuses(self):
+        with self.assertRaisesMessage(CommandError, "already exists"):
+            call_command('rollover_term', 'Autumn', stdout=StringIO())
+        Term.objects.update(is_current=False)
+        with self.assertRaisesMessage(CommandError, "no current term"):
+            self.rollover()
+
+
+class CalendarFeedTests(TestCase):
+    """The tokenized .ics feed: 304s on an unchanged ETag, zoned weekly events."""
+
+    def setUp(self):
+        cache.clear()
+        self.grade = Grade.objects.create(name='9')
+        self.student = make_student('cal@example.com', self.grade)
+        self.chess = make_activity('Chess', self.grade, start=time(15, 30), end=time(16, 30))
+        with self.captureOnCommitCallbacks(execute=True):
+            Booking.objects.create(student=self.student, activity=self.chess)
+        self.url = f'/calendar/{ical.make_token(self.student)}.ics'
+
+    def test_tampered_token(self):
+        self.assertIsNone(ical.read_token(ical.make_token(self.student) + 'x'))
+        self.assertEqual(self.client.get(f'/calendar/{self.student.pk}:forged.ics').status_code, 404)
+
+    def test_etag_not_modified(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response['Content-Type'], 'text/calendar; charset=utf-8')
+        self.assertIn(b'SUMMARY:Chess', response.content)
+
+        with self.assertNumQueries(0):
+            again = self.client.get(self.url, headers={'If-None-Match': response['ETag']})
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(again['ETag'], response['ETag'])
+
+    def test_booking_changes_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Booking.objects.create(student=self.student, activity=make_activity('Drama', self.grade, day='Tuesday'))
+        response = self.client.get(self.url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertIn(b'SUMMARY:Drama', response.content)
+
+    @override_settings(TIME_ZONE='Europe/London')
+    def test_zoned_events(self):
+        Term.objects.create(name='Spring', is_current=True, start_date=date(2026, 1, 5), end_date=date(2026, 6, 30))
+        lines = ical.build_calendar(self.student.pk, 'school.example').decode().split('\r\n')
+        self.assertIn('DTSTART;TZID=Europe/London:20260105T153000', lines)
+        self.assertIn('DTEND;TZID=Europe/London:20260105T163000', lines)
+        # the last Monday of term, 23:59:59 BST, in UTC
+        self.assertIn('RRULE:FREQ=WEEKLY;BYDAY=MO;UNTIL=20260630T225959Z', lines)
+
+        zone = lines[lines.index('BEGIN:VTIMEZONE'):lines.index('END:VTIMEZONE') + 1]
+        self.assertEqual(zone[1], 'TZID:Europe/London')
+        daylight = zone[zone.index('BEGIN:DAYLIGHT'):zone.index('END:DAYLIGHT')]
+        self.assertEqual(daylight[1:4], ['DTSTART:20260329T010000', 'TZOFFSETFROM:+0000', 'TZOFFSETTO:+0100'])
+
+    def test_long_lines_folded(self):
+        Activity.objects.filter(pk=self.chess.pk).update(name='Chess ' * 20)
+        body = ical.build_calendar(self.student.pk, 'school.example')
+        self.assertTrue(all(len(line) <= 75 for line in body.split(b'\r\n')))
+        self.assertIn(b'SUMMARY:' + b'Chess ' * 11, body.replace(b'\r\n ', b''))
+
+
+class CatalogApiTests(TestCase):
+    """The compact JSON endpoints: array-of-rows bodies, field selection, live vacancy."""
+
+    def setUp(self):
+        cache.clear()
+        self.grade = Grade.objects.create(name='9')
+        self.student = make_student('api@example.com', self.grade)
+        self.other = make_student('other@example.com', self.grade)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.chess = make_activity('Chess', self.grade, capacity=3)
+            self.drama = make_activity('Drama', self.grade, day='Tuesday')
+            make_activity('Rugby', Grade.objects.create(name='10'))
+            journal.record(BookingEvent.BOOK, Booking.objects.create(student=self.student, activity=self.chess))
+        self.client.login(username='api@example.com', password='pw')
+
+    def get(self, url, **params):
+        response = self.client.get(url, params)
+        return response.status_code, json.loads(response.content)
+
+    def test_login_required(self):
+        self.client.logout()
+        self.assertEqual(self.get('/api/catalog/'), (401, {'error': 'login required'}))
+        self.assertEqual(self.get('/api/my-bookings/')[0], 401)
+
+    def test_catalog_rows(self):
+        status, body = self.get('/api/catalog/', fields='name,day,booked,spots_left')
+        self.assertEqual(status, 200)
+        self.assertEqual(body, {
+            'fields': ['name', 'day', 'booked', 'spots_left'],
+            'rows': [['Chess', 'Monday', 1, 2], ['Drama', 'Tuesday', 0, 'Unlimited']],
+        })
+        self.assertNotIn(b', ', self.client.get('/api/catalog/').content)
+
+    def test_unknown_field(self):
+        status, body = self.get('/api/catalog/', fields='name,password')
+        self.assertEqual(status, 400)
+        self.assertIn('fields must be from', body['error'])
+
+    def test_other_students_holds(self):
+        seats.hold(self.other, self.chess)
+        self.assertEqual(self.get('/api/catalog/', fields='name,spots_left')[1]['rows'][0], ['Chess', 1])
+        # the student's own hold is still theirs to book
+        seats.hold(self.student, self.chess)
+        self.client.login(username='other@example.com', password='pw')
+        self.assertEqual(self.get('/api/catalog/', fields='name,spots_left')[1]['rows'][0], ['Chess', 1])
+
+    def test_catalog_follows_changes(self):
+        self.get('/api/catalog/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.drama.name = 'Theatre'
+            self.drama.save()
+        self.assertEqual(self.get('/api/catalog/', fields='name')[1]['rows'], [['Chess'], ['Theatre']])
+
+    def test_my_bookings(self):
+        status, body = self.get('/api/my-bookings/', fields='activity_id,day,attended')
+        self.assertEqual((status, body['rows']), (200, [[self.chess.pk, 'Monday', False]]))
+        with self.captureOnCommitCallbacks(execute=True):
+            journal.record(BookingEvent.BOOK, Booking.objects.create(student=self.student, activity=self.drama))
+        self.assertEqual(len(self.get('/api/my-bookings/')[1]['rows']), 2)
+
+    def test_gzip(self):
+        response = self.client.get('/api/catalog/', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+
+
+class MetricsTests(TestCase):
+    """Each worker flushes its own totals; collect() sums them and folds in exited workers."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.dir = directory.name
+        metrics_settings = override_settings(METRICS_DIR=self.dir)
+        metrics_settings.enable()
+        self.addCleanup(metrics_settings.disable)
+        self.reset()
+        self.addCleanup(self.reset)
+
+    def reset(self):
+        metrics._samples.clear()
+        metrics._file.clear()
+
+    def write_worker(self, pid, value):
+        with open(os.path.join(self.dir, f'{pid}-1.json'), 'w') as f:
+            json.dump([['http_requests_total', {'view': 'home', 'status': '200'}, value]], f)
+
+    def requests_total(self):
+        return metrics.collect()[metrics._key('http_requests_total', {'view': 'home', 'status': '200'})]
+
+    def test_sums_workers(self):
+        metrics.inc('http_requests_total', view='home', status='200')
+        self.write_worker(os.getpid() + 1, 4)
+        with mock.patch.object(metrics, '_alive', return_value=True):
+            self.assertEqual(self.requests_total(), 5)
+
+    def test_fold_exited(self):
+        metrics.inc('http_requests_total', view='home', status='200')
+        self.write_worker(90001, 2)
+        self.write_worker(90002, 3)
+        with mock.patch.object(metrics, '_alive', lambda pid: pid == os.getpid()):
+            self.assertEqual(self.requests_total(), 6)
+            self.assertEqual(sorted(n for n in os.listdir(self.dir) if n.endswith('.json')),
+                             sorted([f'{metrics.EXITED}.json', metrics._file['name']]))
+            # folded once, not again on the next scrape
+            self.assertEqual(self.requests_total(), 6)
+
+    def test_fold_cut_short(self):
+        # the exited file was written but the merged worker file never deleted
+        self.write_worker(90001, 2)
+        with open(os.path.join(self.dir, f'{metrics.EXITED}.json'), 'w') as f:
+            json.dump({'merged': ['90001-1.json'], 'samples': [['http_requests_total', {'view': 'home', 'status': '200'}, 2]]}, f)
+        with mock.patch.object(metrics, '_alive', return_value=False):
+            self.assertEqual(self.requests_total(), 2)
+        self.assertNotIn('90001-1.json', os.listdir(self.dir))
+
+    def test_exact_values(self):
+        metrics.inc('booking_outcomes_total', 1234567, view='book_activity', outcome='booked')
+        self.assertIn('booking_outcomes_total{outcome="booked",view="book_activity"} 1234567\n', metrics.render())
+
+    def test_histogram(self):
+        metrics.observe('http_request_duration_seconds', 0.03, view='home')
+        metrics.observe('http_request_duration_seconds', 2.0, view='home')
+        lines = [l for l in metrics.render().splitlines() if l.startswith('http_request_duration_seconds')]
+        self.assertEqual(lines[:2], [
+            'http_request_duration_seconds_bucket{le="0.05",view="home"} 1',
+            'http_request_duration_seconds_bucket{le="0.1",view="home"} 1',
+        ])
+        self.assertIn('http_request_duration_seconds_bucket{le="+Inf",view="home"} 2', lines)
+        self.assertIn('http_request_duration_seconds_sum{view="home"} 2.03', lines)
+        self.assertIn('http_request_duration_seconds_count{view="home"} 2', lines)
+
+    @override_settings(METRICS_TOKEN='scrape')
+    def test_endpoint(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        grade = Grade.objects.create(name='9')
+        make_student('m@example.com', grade)
+        self.client.login(username='m@example.com', password='pw')
+        self.client.post(f'/book/{make_activity("Chess", grade).pk}/')
+
+        response = self.client.get('/metrics', headers={'Authorization': 'Bearer scrape'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('booking_outcomes_total{outcome="booked",view="book_activity"} 1', response.content.decode())
+        self.assertIn('# TYPE http_request_duration_seconds histogram', response.content.decode())
+
+
+class BookingChangelistTests(TestCase):
+    """The Booking changelist pages by keyset and doesn't COUNT(*) the whole table."""
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(get_user_model().objects.create_superuser('staff@example.com', 'pw'))
+        grade = Grade.objects.create(name='9')
+        chess = make_activity('Chess', grade)
+        start = timezone.now() - timedelta(days=1)
+        self.bookings = []
+        # the 3rd and 4th share a timestamp across a page boundary; the id breaks the tie
+        for n, minutes in enumerate([0, 1, 2, 2, 3]):
+            booking = Booking.objects.create(student=make_student(f'c{n}@example.com', grade), activity=chess)
+            Booking.objects.filter(pk=booking.pk).update(date_created=start + timedelta(minutes=minutes))
+            self.bookings.append(booking.pk)
+        self.newest_first = self.bookings[::-1]
+        per_page = mock.patch.object(site._registry[Booking], 'list_per_page', 2)
+        per_page.start()
+        self.addCleanup(per_page.stop)
+
+    def page(self, url='/admin/bookings/booking/'):
+        cl = self.client.get(url).context['cl']
+        return [b.pk for b in cl.result_list], cl
+
+    def test_before_cursor(self):
+        rows, cl = self.page()
+        self.assertEqual(rows, self.newest_first[:2])
+        self.assertEqual(cl.next_cursor_url, f'?before={rows[-1]}')
+
+        rows, cl = self.page('/admin/bookings/booking/' + cl.next_cursor_url)
+        self.assertEqual(rows, self.newest_first[2:4])
+        self.assertEqual(cl.newest_url, '?')
+        # links built from a keyset page drop the cursor
+        self.assertNotIn('before', cl.get_query_string({'o': '1'}))
+
+        rows, cl = self.page('/admin/bookings/booking/' + cl.next_cursor_url)
+        self.assertEqual(rows, self.newest_first[4:])
+        self.assertIsNone(cl.next_cursor_url)
+
+    def test_sorted_pages_by_offset(self):
+        rows, cl = self.page('/admin/bookings/booking/?o=-1&before=%d' % self.newest_first[0])
+        self.assertIsNone(cl.next_cursor_url)
+        self.assertEqual(len(rows), 2)
+
+    def test_estimated_count(self):
+        with mock.patch.object(changelist, 'estimated_rows', return_value=changelist.ESTIMATE_THRESHOLD):
+            self.assertEqual(changelist.EstimatedCountPaginator(Booking.objects.all(), 2).count, changelist.ESTIMATE_THRESHOLD)
+        # a small table is counted exactly
+        with mock.patch.object(changelist, 'estimated_rows', return_value=10):
+            self.assertEqual(changelist.EstimatedCountPaginator(Booking.objects.all(), 2).count, 5)
+
+    def test_filtered_count_cached(self):
+        filtered = Booking.objects.filter(pk__in=self.bookings[:3])
+        self.assertEqual(changelist.EstimatedCountPaginator(filtered, 2).count, 3)
+        with self.assertNumQueries(0):
+            self.assertEqual(changelist.EstimatedCountPaginator(filtered, 2).count, 3)
+
+
+class AttendanceTests(TestCase):
+    """Registers are taken per dated session and summed per term."""
+
+    def setUp(self):
+        self.grade = Grade.objects.create(name='9')
+        self.chess = make_activity('Chess', self.grade)
+        self.bookings = {}
+        for name in ('Ann', 'Ben'):
+            student = make_student(f'{name.lower()}@example.com', self.grade, name=name)
+            self.bookings[name] = Booking.objects.create(student=student, activity=self.chess)
+            journal.record(BookingEvent.BOOK, self.bookings[name])
+        self.ann, self.ben = self.bookings['Ann'].pk, self.bookings['Ben'].pk
+        self.term = Term.objects.create(name='Spring', is_current=True, start_date=date(2026, 1, 5), end_date=date(2026, 3, 27))
+        self.mondays = [date(2026, 1, 5), date(2026, 1, 12)]
+
+    def test_last_date(self):
+        self.assertEqual(attendance.last_date('Monday', date(2026, 1, 11)), date(2026, 1, 5))
+        self.assertEqual(attendance.last_date('Monday', date(2026, 1, 12)), date(2026, 1, 12))
+
+    def test_wrong_weekday(self):
+        with self.assertRaisesMessage(ValueError, "Chess doesn't run on Tuesdays."):
+            attendance.mark(self.chess, date(2026, 1, 6), [])
+
+    def test_mark_and_register(self):
+        self.assertEqual([present for _, present in attendance.register(self.chess, self.mondays[0])], [None, None])
+        attendance.mark(self.chess, self.mondays[0], [self.ann])
+        self.assertEqual([(b.student.name, p) for b, p in attendance.register(self.chess, self.mondays[0])], [('Ann', True), ('Ben', False)])
+
+        # taking it again updates the same rows and journals only what changed
+        attendance.mark(self.chess, self.mondays[0], [self.ann, self.ben])
+        self.assertEqual(Attendance.objects.count(), 2)
+        events = BookingEvent.objects.filter(kind=BookingEvent.ATTENDANCE).order_by('pk')
+        self.assertEqual(
+            [(e.booking_id, e.data['attended']) for e in events],
+            [(self.ann, True), (self.ben, False), (self.ben, True)],
+        )
+        self.assertEqual(events[0].data['date'], '2026-01-05')
+
+    def test_term_summary(self):
+        attendance.mark(self.chess, self.mondays[0], [self.ann, self.ben])
+        attendance.mark(self.chess, self.mondays[1], [self.ben])
+        # outside the term
+        attendance.mark(self.chess, date(2026, 4, 6), [])
+        summary = [(r['student_name'], r['sessions'], r['attended'], r['percent']) for r in attendance.term_summary(self.term)]
+        self.assertEqual(summary, [('Ann', 2, 1, 50.0), ('Ben', 2, 2, 100.0)])
+
+    def test_summary_survives_rollover(self):
+        attendance.mark(self.chess, self.mondays[0], [self.ann])
+        call_command('rollover_term', 'Summer', stdout=StringIO())
+        self.assertEqual(Attendance.objects.filter(booking__isnull=True, archived_booking__isnull=False).count(), 2)
+        summary = [(r['student_name'], r['percent']) for r in attendance.term_summary(self.term)]
+        self.assertEqual(summary, [('Ben', 0.0), ('Ann', 100.0)])
+
+    def test_take_register_view(self):
+        staff = get_user_model().objects.create_superuser('staff@example.com', 'pw')
+        self.client.force_login(staff)
+        url = f'/roll-call/{self.chess.pk}/?date=2026-01-12'
+        self.assertEqual(self.client.get(f'/roll-call/{self.chess.pk}/?date=2026-01-13').status_code, 404)
+
+        response = self.client.post(url, {'present': [str(self.ben)]})
+        self.assertRedirects(response, url, fetch_redirect_response=False)
+        self.assertEqual(dict(Attendance.objects.values_list('booking_id', 'present')), {self.ann: False, self.ben: True})
+        self.assertEqual(BookingEvent.objects.filter(kind=BookingEvent.ATTENDANCE).first().actor, staff)
+        self.assertTrue(self.client.get(url).context['taken'])
+
+        self.client.login(username='ann@example.com', password='pw')
+        self.assertRedirects(self.client.get(url), '/booking-wizard/0/', fetch_redirect_response=False)
+
+
+class BookingAdminFormTests(TestCase):
+    """The booking admin form picks students and activities by autocomplete."""
+
+    def setUp(self):
+        self.client.force_login(get_user_model().objects.create_superuser('staff@example.com', 'pw'))
+        self.grade = Grade.objects.create(name='9')
+        self.senior = Grade.objects.create(name='12')
+        self.student = make_student('ann@example.com', self.grade, name='Ann')
+        self.senior_student = make_student('sam@example.com', self.senior, name='Sam')
+        self.chess = make_activity('Chess', self.grade, capacity=1)
+        self.debate = make_activity('Debate', self.senior, day='Tuesday')
+
+    def form(self, student, activity, instance=None):
+        return BookingAdminForm({'student': student.pk, 'activity': activity.pk, 'day': activity.day}, instance=instance)
+
+    def autocomplete(self, field_name, **forwarded):
+        response = self.client.get('/admin/autocomplete/', {
+            'app_label': 'bookings', 'model_name': 'booking', 'field_name': field_name, 'term': '', **forwarded,
+        })
+        return [r['text'] for r in response.json()['results']]
+
+    def test_add_page_lists_no_rows(self):
+        response = self.client.get('/admin/bookings/booking/add/')
+        self.assertContains(response, 'class="admin-autocomplete"', count=2)
+        self.assertNotContains(response, 'Sam')
+        self.assertContains(response, 'bookings/booking_autocomplete.js')
+
+    def test_lookups_narrowed_by_other_field(self):
+        self.assertEqual(len(self.autocomplete('student')), 2)
+        self.assertEqual(self.autocomplete('student', activity=self.chess.pk), [str(self.student)])
+        self.assertEqual(self.autocomplete('activity', student=self.senior_student.pk), [str(self.debate)])
+
+    def test_grade_not_allowed(self):
+        form = self.form(self.senior_student, self.chess)
+        self.assertFalse(form.is_valid())
+        self.assertIn("grade is not allowed", str(form.errors))
+
+    def test_capacity(self):
+        unlimited = make_activity('Art', self.grade, day='Wednesday')
+        form = self.form(self.student, unlimited)
+        self.assertTrue(form.is_valid(), form.errors)
+        booking = Booking.objects.create(student=self.student, activity=self.chess)
+        Activity.objects.filter(pk=self.chess.pk).update(booked_count=1)
+        other = make_student('ben@example.com', self.grade)
+        self.assertIn("capacity reached", str(self.form(other, self.chess).errors))
+        # re-saving an existing booking doesn't count its own seat twice
+        self.assertTrue(self.form(self.student, self.chess, instance=booking).is_valid())
+
+    def test_clean_query_count(self):
+        def queries(activity):
+            with CaptureQueriesContext(connection) as ctx:
+                self.form(self.student, activity).is_valid()
+            return len(ctx)
+
+        few = queries(self.chess)
+        busy = make_activity('Art', self.grade, day='Wednesday')
+        busy.allowed_grades.add(*[Grade.objects.create(name=str(n)) for n in range(1, 6)])
+        for n in range(5):
+            Booking.objects.create(student=make_student(f'art{n}@example.com', self.grade), activity=busy)
+        self.assertEqual(queries(busy), few)
+
+
+class CapacityPlannerTests(TestCase):
+    """The what-if simulator: demand from past bookings, scenarios run in memory."""
+
+    def setUp(self):
+        self.demand = capacity.Demand(
+            activities={
+                1: {'name': 'Chess', 'day': 'Monday', 'capacity': 2, 'grades': {'9'}},
+                2: {'name': 'Art', 'day': 'Monday', 'capacity': 3, 'grades': {'9', '10'}},
+                3: {'name': 'Drama', 'day': 'Tuesday', 'capacity': 1, 'grades': {'10'}},
+            },
+            wanted={1: {'9': 4}, 2: {'10': 1, '9': 0.5}, 3: {'10': 2}},
+            terms=1,
+        )
+
+    def test_baseline(self):
+        result = capacity.simulate(self.demand)
+        chess, art = result['rows'][1], result['rows'][2]
+        self.assertEqual((chess['first_choice'], chess['spill_in'], chess['censored']), (2, 0, True))
+        # two of Chess's overflow go to Art, the only other Monday activity open to grade 9
+        self.assertEqual((art['first_choice'], art['spill_in'], art['fill'], art['censored']), (1.5, 1.5, 1.0, False))
+        self.assertEqual(result['totals'], {
+            'wanted': 7.5, 'first_choice': 4.5, 'placed': 6.0, 'unplaced': 1.5, 'first_choice_rate': 0.6,
+        })
+        self.assertEqual(result['unplaced_by_grade'], {'10': 1.0, '9': 0.5})
+
+    def test_scenario(self):
+        result = capacity.simulate(self.demand, capacity={1: 4, 3: 0}, grades={2: {'9'}})
+        self.assertEqual(result['rows'][1]['placed'], 4)
+        self.assertIsNone(result['rows'][3]['fill'])
+        # grade 10 lost Art and has nothing else on Monday
+        self.assertEqual(result['unplaced_by_grade'], {'10': 1.0})
+        # scenarios don't change the demand they run over
+        self.assertEqual(capacity.simulate(self.demand)['totals']['placed'], 6.0)
+
+    def test_load(self):
+        grade = Grade.objects.create(name='9')
+        chess = make_activity('Chess', grade)
+        autumn = Term.objects.create(name='Autumn', is_current=True)
+        students = [make_student(f'd{n}@example.com', grade) for n in range(4)]
+        for student in students:
+            journal.record(BookingEvent.BOOK, Booking.objects.create(student=student, activity=chess))
+        call_command('rollover_term', 'Spring', stdout=StringIO())
+        # Chess was deleted and set up again; the archive still finds it by name and day
+        chess.delete()
+        chess = make_activity('Chess', grade)
+        for student in students[:2]:
+            journal.record(BookingEvent.BOOK, Booking.objects.create(student=student, activity=chess))
+
+        demand = capacity.Demand.load([autumn])
+        self.assertEqual((demand.terms, demand.wanted[chess.pk]), (2, {'9': 3.0}))
+        self.assertEqual(capacity.Demand.load([autumn], include_current=False).wanted[chess.pk], {'9': 4.0})
+        self.assertEqual(demand.activities[chess.pk]['grades'], {'9'})
+
+    def test_admin_planner(self):
+        self.client.force_login(get_user_model().objects.create_superuser('staff@example.com', 'pw'))
+        grade = Grade.objects.create(name='9')
+        chess = make_activity('Chess', grade)
+        make_activity('Art', grade, capacity=1)
+        for n in range(2):
+            Booking.objects.create(student=make_student(f'p{n}@example.com', grade), activity=chess)
+        # two students booked it; the baseline is a single seat
+        Activity.objects.filter(pk=chess.pk).update(capacity=1)
+
+        response = self.client.post('/admin/bookings/activity/', {'action': 'capacity_what_if', '_selected_action': [chess.pk]})
+        self.assertRedirects(response, f'/admin/bookings/activity/capacity-planner/?ids={chess.pk}', fetch_redirect_response=False)
+
+        response = self.client.get('/admin/bookings/activity/capacity-planner/', {'ids': chess.pk, 'run': '1', 'current': '1', f'cap-{chess.pk}': '2'})
+        self.assertEqual([(r['name'], r['before']['first_choice'], r['first_choice']) for r in response.context['rows']], [('Chess', 1, 2)])
+        self.assertEqual(response.context['scenario']['totals']['unplaced'], 0)
+
+
+class EnrollmentTests(TestCase):
+    """Bulk enrollment books the eligible students and reports every skip."""
+
+    def setUp(self):
+        self.grade = Grade.objects.create(name='9')
+        self.chess = make_activity('Chess', self.grade, capacity=3)
+        self.drama = make_activity('Drama', self.grade)
+        self.students = {name: make_student(f'{name}@example.com', self.grade, name=name) for name in 'abcdfg'}
+        self.students['e'] = make_student('e@example.com', Grade.objects.create(name='10'), name='e')
+        for name, activity in (('f', self.drama), ('g', self.chess)):
+            self.assertTrue(seats.claim(activity))
+            Booking.objects.create(student=self.students[name], activity=activity)
+
+    def enroll(self, **kwargs):
+        result = enrollment.enroll(self.students.values(), self.chess, **kwargs)
+        return (
+            [s.name for s in result.enrolled],
+            {reason: [s.name for s in students] for reason, students in result.skipped.items()},
+        )
+
+    def test_skip_reasons(self):
+        enrolled, skipped = self.enroll()
+        self.assertEqual(enrolled, ['a', 'b'])
+        self.assertEqual(skipped, {
+            enrollment.ALREADY_BOOKED: ['g'],
+            enrollment.CONFLICT: ['f'],
+            enrollment.INELIGIBLE: ['e'],
+            enrollment.FULL: ['c', 'd'],
+        })
+        self.assertEqual(Activity.objects.get(pk=self.chess.pk).booked_count, 3)
+        self.assertEqual(BookingEvent.objects.filter(kind=BookingEvent.BOOK, data__bulk=True).count(), 2)
+
+    def test_dry_run(self):
+        enrolled, _ = self.enroll(dry_run=True)
+        self.assertEqual(enrolled, ['a', 'b'])
+        self.assertEqual(Booking.objects.filter(activity=self.chess).count(), 1)
+
+    def test_concurrent_booking_is_a_conflict(self):
+        bulk_create = Booking.objects.bulk_create
+
+        def racing_bulk_create(objs, **kwargs):
+            # another request books "a" onto Drama after the conflict check
+            Booking.objects.create(student=self.students['a'], activity=self.drama)
+            return bulk_create(objs, **kwargs)
+
+        with mock.patch.object(Booking.objects, 'bulk_create', side_effect=racing_bulk_create):
+            enrolled, skipped = self.enroll()
+        self.assertEqual(enrolled, ['b'])
+        self.assertEqual(skipped[enrollment.CONFLICT], ['f', 'a'])
+        self.assertEqual(Activity.objects.get(pk=self.chess.pk).booked_count, 2)
+
+    def test_command(self):
+        out = StringIO()
+        call_command('enroll_students', self.chess.pk, '--grade', '9', stdout=out)
+        self.assertIn("2 enrolled", out.getvalue())
+        self.assertIn("skipped (full): c", out.getvalue())
+
+    def test_admin_action(self):
+        self.client.force_login(get_user_model().objects.create_superuser('staff@example.com', 'pw'))
+        response = self.client.post('/admin/bookings/grade/', {
+            'action': 'enroll_grade', '_selected_action': [self.grade.pk],
+            'apply': '1', 'activity': self.chess.pk,
+        }, follow=True)
+        self.assertContains(response, "2 enrolled")
+        self.assertContains(response, "Skipped (conflict): f")
+
+
+def use_temp_media(test):
+    """Point MEDIA_ROOT at a directory removed when ``test`` finishes."""
+    media = tempfile.TemporaryDirectory()
+    test.addCleanup(media.cleanup)
+    media_settings = override_settings(MEDIA_ROOT=media.name)
+    media_settings.enable()
+    test.addCleanup(media_settings.disable)
+
+
+class JobTests(TestCase):
+    """Workers claim pending jobs one at a time and store their output."""
+
+    def setUp(self):
+        use_temp_media(self)
+        self.grade = Grade.objects.create(name='9')
+        self.chess = make_activity('Chess', self.grade, capacity=5)
+        for n in range(3):
+            Booking.objects.create(student=make_student(f'j{n}@example.com', self.grade), activity=self.chess)
+
+    def test_claim_oldest_pending(self):
+        first = jobs.enqueue('export_bookings')
+        second = jobs.enqueue('export_activities')
+        with mock.patch.object(QuerySet, 'select_for_update', autospec=True, side_effect=QuerySet.select_for_update) as lock:
+            claimed = jobs.claim_next()
+        # a second worker skips the locked row instead of waiting on it
+        self.assertEqual(lock.call_args.kwargs, {'skip_locked': True})
+        self.assertEqual(claimed, first)
+        first.refresh_from_db()
+        self.assertEqual(first.status, Job.RUNNING)
+        self.assertIsNotNone(first.date_started)
+
+        self.assertEqual(jobs.claim_next(), second)
+        self.assertIsNone(jobs.claim_next())
+
+    def test_run_stores_result(self):
+        job = jobs.run(jobs.enqueue('export_bookings'))
+        self.assertEqual((job.status, job.progress, job.total), (Job.DONE, 3, 3))
+        self.assertIsNotNone(job.date_finished)
+        with job.result.open('rb') as f:
+            lines = f.read().decode().splitlines()
+        self.assertEqual(lines[0].split(',')[:2], ['BookingID', 'Student'])
+        self.assertEqual(len(lines), 4)
+
+    def test_progress(self):
+        job = jobs.enqueue('export_bookings')
+        with mock.patch.object(jobs, 'PROGRESS_EVERY', 2), \
+                mock.patch.object(Job, 'set_progress', autospec=True, side_effect=Job.set_progress) as set_progress:
+            jobs.run(job)
+        self.assertEqual([c.args[1:] for c in set_progress.call_args_list], [(0, 3), (2,)])
+
+    def test_failure_is_recorded(self):
+        def boom(job):
+            raise ValueError("no such term")
+
+        with mock.patch.dict(jobs.HANDLERS, {'boom': boom}), self.assertLogs('bookings.jobs', 'ERROR'):
+            job = jobs.run(jobs.enqueue('boom'))
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertIn("ValueError: no such term", job.error)
+        self.assertFalse(job.result)
+
+    def test_unknown_kind(self):
+        with self.assertRaises(ValueError):
+            jobs.enqueue('nope')
+
+    def test_run_jobs_once(self):
+        job = jobs.enqueue('export_activities')
+        out = StringIO()
+        call_command('run_jobs', '--once', stdout=out)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.DONE)
+        self.assertIn(f"Finished {job}", out.getvalue())
+
+    def test_admin_action_enqueues(self):
+        self.client.force_login(get_user_model().objects.create_superuser('staff@example.com', 'pw'))
+        response = self.client.post('/admin/bookings/booking/', {
+            'action': 'export_bookings_csv', '_selected_action': list(Booking.objects.values_list('pk', flat=True)),
+        })
+        job = Job.objects.get()
+        self.assertRedirects(response, f'/admin/bookings/job/{job.pk}/change/', fetch_redirect_response=False)
+        self.assertEqual((job.kind, job.status), ('export_bookings', Job.PENDING))
+
+
+class RosterTests(TestCase):
+    """Roster bundles are written to storage as a ZIP by the job worker."""
+
+    def setUp(self):
+        use_temp_media(self)
+        self.grade = Grade.objects.create(name='9')
+        self.chess = make_activity('Chess', self.grade)
+        self.drama = make_activity('Drama', self.grade, day='Tuesday')
+        for n, activity in enumerate([self.chess, self.chess, self.drama]):
+            student = make_student(f'r{n}@example.com', self.grade, name=f'Student {n}')
+            journal.record(BookingEvent.BOOK, Booking.objects.create(student=student, activity=activity))
+
+    def members(self, job):
+        with job.result.open('rb') as f, zipfile.ZipFile(f) as bundle:
+            return {name: bundle.read(name).decode() for name in bundle.namelist()}
+
+    def test_bundle_job(self):
+        job = jobs.enqueue('roster_bundle', activity_ids=[self.chess.pk, self.drama.pk])
+        self.assertEqual(jobs.claim_next(), job)
+        job = jobs.run(Job.objects.get(pk=job.pk))
+        self.assertEqual((job.status, job.progress, job.total), (Job.DONE, 2, 2))
+        members = self.members(job)
+        self.assertEqual(sorted(members), ['Monday-Chess.html', 'Tuesday-Drama.html'])
+        self.assertIn('Student 1', members['Monday-Chess.html'])
+        self.assertIn('3:00pm - 4:00pm', members['Monday-Chess.html'])
+
+    def test_bundle_is_streamed(self):
+        job = jobs.enqueue('roster_bundle')
+        _, content = jobs.roster_bundle(job)
+        # an open temporary file, handed to storage in chunks, not bytes in memory
+        self.assertNotIsInstance(content, bytes)
+        content.close()
+
+    def test_archived_term(self):
+        term = Term.objects.create(name='Autumn', is_current=True)
+        call_command('rollover_term', 'Spring', stdout=StringIO())
+        job = jobs.run(jobs.enqueue('roster_bundle', term_id=term.pk))
+        self.assertEqual(job.status, Job.DONE)
+        self.assertIn('Student 2', self.members(job)['Tuesday-Drama.html'])
+
+    def test_admin_action(self):
+        self.client.force_login(get_user_model().objects.create_superuser('staff@example.com', 'pw'))
+        response = self.client.post('/admin/bookings/activity/', {
+            'action': 'activity_rosters', '_selected_action': [self.chess.pk],
+        })
+        job = Job.objects.get()
+        self.assertRedirects(response, f'/admin/bookings/job/{job.pk}/change/', fetch_redirect_response=False)
+        self.assertEqual(job.params, {'activity_ids': [self.chess.pk]})
+
+
+class FillRateTests(TestCase):
+    """Compaction of journal events into the fill-rate rollup."""
+
+    def setUp(self):
+        self.grade = Grade.objects.create(name='9')
+        self.chess = make_activity('Chess', self.grade)
+        self.students = [make_student(f'fill{n}@example.com', self.grade) for n in range(3)]
+        self.opened = timezone.now().replace(minute=0, second=0, microsecond=0) - timedelta(hours=2)
+
+    def event(self, kind, student, minutes):
+        booking = Booking(pk=student.pk, student=student, activity=self.chess, day=self.chess.day)
+        event = journal.record(kind, booking, claimed=True)
+        BookingEvent.objects.filter(pk=event.pk).update(date_created=self.opened + timedelta(minutes=minutes))
+        return event
+
+    def minutes(self):
+        return dict(FillRate.objects.filter(resolution=FillRate.MINUTE).values_list('bucket', 'booked'))
+
+    def test_compact(self):
+        self.event(BookingEvent.BOOK, self.students[0], 0)
+        self.event(BookingEvent.BOOK, self.students[1], 0)
+        self.event(BookingEvent.BOOK, self.students[2], 3)
+        self.assertEqual(fillrate.compact(), 3)
+        self.assertEqual(self.minutes(), {self.opened: 2, self.opened + timedelta(minutes=3): 1})
+        self.assertEqual(FillRate.objects.get(resolution=FillRate.HOUR).booked, 3)
+
+    def test_compact_is_idempotent(self):
+        self.event(BookingEvent.BOOK, self.students[0], 0)
+        fillrate.compact()
+        self.assertEqual(fillrate.compact(), 0)
+        self.event(BookingEvent.UNBOOK, self.students[0], 1)
+        self.assertEqual(fillrate.compact(), 1)
+        self.assertEqual(fillrate.compact(), 0)
+        self.assertEqual(self.minutes(), {self.opened: 1, self.opened + timedelta(minutes=1): -1})
+
+    def test_zero_net_batch_moves_cursor(self):
+        self.event(BookingEvent.BOOK, self.students[0], 0)
+        last = self.event(BookingEvent.UNBOOK, self.students[0], 0)
+        self.assertEqual(fillrate.compact(), 2)
+        self.assertFalse(FillRate.objects.exists())
+        self.assertEqual(fillrate.cursor().last_event, last.pk)
+        self.assertEqual(fillrate.compact(), 0)
+
+    def test_unsettled_events_wait(self):
+        journal.record(BookingEvent.BOOK, Booking(pk=1, student=self.students[0], activity=self.chess), claimed=True)
+        self.assertEqual(fillrate.compact(), 0)
+        self.assertEqual(fillrate.cursor().last_event, 0)
+
+    def test_backfill(self):
+        for student in self.students[:2]:
+            Booking.objects.create(student=student, activity=self.chess)
+        Booking.objects.update(date_created=self.opened)
+        last = self.event(BookingEvent.BOOK, self.students[2], 5)
+        self.assertEqual(fillrate.backfill(), 2)
+        self.assertEqual(self.minutes(), {self.opened: 2})
+        # events up to the backfill are already counted
+        self.assertEqual(fillrate.cursor().last_event, last.pk)
+        self.assertEqual(fillrate.compact(), 0)
+
+
+class SeatTests(TestCase):
+    """Seat claims, swaps and wizard holds against booked_count."""
+
+    def setUp(self):
+        self.grade = Grade.objects.create(name='9')
+        self.student = make_student('seat@example.com', self.grade)
+        self.other = make_student('other@example.com', self.grade)
+        self.chess = make_activity('Chess', self.grade, capacity=5)
+        self.drama = make_activity('Drama', self.grade, capacity=1)
+
+    def book(self, student, activity):
+        self.assertTrue(seats.claim(activity, student))
+        return Booking.objects.create(student=student, activity=activity)
+
+    def counts(self):
+        return dict(Activity.objects.filter(pk__in=[self.chess.pk, self.drama.pk]).values_list('name', 'booked_count'))
+
+    def test_swap(self):
+        booking = self.book(self.student, self.chess)
+        seats.swap(booking, self.drama)
+        self.assertEqual(Booking.objects.get(pk=booking.pk).activity, self.drama)
+        self.assertEqual(self.counts(), {'Chess': 0, 'Drama': 1})
+        self.assertEqual(
+            list(BookingEvent.objects.filter(booking_id=booking.pk).values_list('kind', 'activity_id')),
+            [(BookingEvent.UNBOOK, self.chess.pk), (BookingEvent.BOOK, self.drama.pk)],
+        )
+
+    def test_swap_to_full_activity_keeps_seat(self):
+        self.book(self.other, self.drama)
+        booking = self.book(self.student, self.chess)
+        with self.assertRaises(seats.SeatTaken):
+            seats.swap(booking, self.drama)
+        self.assertEqual(Booking.objects.get(pk=booking.pk).activity, self.chess)
+        self.assertEqual(self.counts(), {'Chess': 1, 'Drama': 1})
+
+    def test_swap_rolls_back(self):
+        booking = self.book(self.student, self.chess)
+        # another request moved the booking since it was read: the claim on
+        # Drama is undone along with everything else
+        stale = Booking.objects.get(pk=booking.pk)
+        stale.activity_id = self.drama.pk
+        with self.assertRaisesMessage(ValueError, "changed by another request"):
+            seats.swap(stale, make_activity('Art', self.grade))
+        self.assertEqual(Booking.objects.get(pk=booking.pk).activity, self.chess)
+        self.assertEqual(Activity.objects.get(name='Art').booked_count, 0)
+        self.assertFalse(BookingEvent.objects.filter(booking_id=booking.pk).exclude(kind=BookingEvent.BOOK).exists())
+
+    def test_swap_view(self):
+        booking = self.book(self.student, self.chess)
+        self.book(self.other, self.drama)
+        self.client.login(username='seat@example.com', password='pw')
+        response = self.client.post(f'/swap/{self.drama.pk}/', follow=True)
+        self.assertContains(response, "You are still booked for Chess")
+        self.assertEqual(Booking.objects.get(pk=booking.pk).activity, self.chess)
+
+    def test_holds_count_against_capacity(self):
+        self.assertTrue(seats.hold(self.other, self.drama))
+        self.assertFalse(seats.hold(self.student, self.drama))
+        self.assertFalse(seats.claim(self.drama, self.student))
+        # the holder's own hold doesn't block them
+        self.assertTrue(seats.claim(self.drama, self.other))
+
+    def test_holds_expire_lazily(self):
+        self.assertTrue(seats.hold(self.other, self.drama))
+        SeatHold.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(seats.held_counts([self.drama.pk]), {})
+        self.assertTrue(seats.claim(self.drama, self.student))
+        Activity.objects.filter(pk=self.drama.pk).update(booked_count=0)
+        # the next hold on the activity clears the expired row
+        self.assertTrue(seats.hold(self.student, self.drama))
+        self.assertEqual(list(SeatHold.objects.values_list('student_id', flat=True)), [self.student.pk])
+
+    def test_last_seat_goes_once(self):
+        # both requests passed their checks while one seat was left
+        self.assertTrue(seats.claim(self.drama, self.student))
+        self.assertFalse(seats.claim(self.drama, self.other))
+        self.assertEqual(self.counts()['Drama'], 1)
+
+
+class BookingWizardTests(TestCase):
+    """Wizard choices hold seats until the last step books them all at once."""
+
+    def setUp(self):
+        cache.clear()
+        self.grade = Grade.objects.create(name='9')
+        self.student = make_student('wizard@example.com', self.grade)
+        self.other = make_student('other@example.com', self.grade)
+        self.days = [day for day, _ in Activity.DAYS]
+        self.picks = {
+            'Monday': make_activity('Chess', self.grade, capacity=5),
+            'Tuesday': make_activity('Drama', self.grade, day='Tuesday', capacity=1),
+            'Wednesday': make_activity('Art', self.grade, day='Wednesday'),
+        }
+        self.client.login(username='wizard@example.com', password='pw')
+
+    def choose(self, day, activity=None):
+        step = self.days.index(day)
+        return self.client.post(f'/booking-wizard/{step}/', {'activity': activity.pk if activity else ''})
+
+    def choose_all(self):
+        self.client.get('/booking-wizard/0/')
+        for day in self.days:
+            self.choose(day, self.picks.get(day))
+
+    def finish(self):
+        return self.client.get(f'/booking-wizard/{len(self.days)}/')
+
+    def test_choices_hold_seats(self):
+        self.client.get('/booking-wizard/0/')
+        self.choose('Tuesday', self.picks['Tuesday'])
+        self.assertEqual(list(SeatHold.objects.values_list('student_id', 'activity_id')), [(self.student.pk, self.picks['Tuesday'].pk)])
+        # picking nothing for the day gives the seat back
+        self.choose('Tuesday')
+        self.assertFalse(SeatHold.objects.exists())
+
+    def test_held_seat_is_not_offered(self):
+        self.assertTrue(seats.hold(self.other, self.picks['Tuesday']))
+        response = self.client.get(f'/booking-wizard/{self.days.index("Tuesday")}/')
+        self.assertEqual([(a.name, a.vacancy) for a in response.context['activities']], [('Drama', 0)])
+
+        response = self.choose('Tuesday', self.picks['Tuesday'])
+        self.assertRedirects(response, f'/booking-wizard/{self.days.index("Tuesday")}/', fetch_redirect_response=False)
+        self.assertFalse(SeatHold.objects.filter(student=self.student).exists())
+
+    def test_finish_books_held_seats(self):
+        self.choose_all()
+        self.assertRedirects(self.finish(), '/my-bookings/', fetch_redirect_response=False)
+        self.assertEqual(
+            sorted(Booking.objects.filter(student=self.student).values_list('activity__name', flat=True)),
+            ['Art', 'Chess', 'Drama'],
+        )
+        self.assertFalse(SeatHold.objects.exists())
+        # claimed once, by the claim itself and not again by the journal
+        self.assertEqual(list(Activity.objects.order_by('name').values_list('booked_count', flat=True)), [1, 1, 1])
+        self.assertEqual(BookingEvent.objects.filter(kind=BookingEvent.BOOK).count(), 3)
+
+    def test_lapsed_hold_books_nothing(self):
+        self.choose_all()
+        # the student's hold ran out and someone else took the last seat
+        SeatHold.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertTrue(seats.claim(self.picks['Tuesday'], self.other))
+
+        self.assertRedirects(self.finish(), f'/booking-wizard/{self.days.index("Tuesday")}/', fetch_redirect_response=False)
+        self.assertFalse(Booking.objects.exists())
+        self.assertEqual(Activity.objects.get(name='Chess').booked_count, 0)
+
+    def test_fewer_than_three(self):
+        del self.picks['Wednesday']
+        self.choose_all()
+        self.assertRedirects(self.finish(), '/booking-wizard/0/', fetch_redirect_response=False)
+        self.assertFalse(Booking.objects.exists())
+
+
+class SuggestionTests(TestCase):
+    """A full activity offers the day's open alternatives, same time slot first."""
+
+    def setUp(self):
+        cache.clear()
+        self.grade = Grade.objects.create(name='9')
+        self.student = make_student('s@example.com', self.grade)
+        self.other = make_student('o@example.com', self.grade)
+        self.full = make_activity('Chess', self.grade, capacity=1)
+        self.busy = make_activity('Art', self.grade, capacity=4)
+        self.quiet = make_activity('Music', self.grade, capacity=4)
+        self.later = make_activity('Drama', self.grade, start=time(16), end=time(17))
+        make_activity('Rugby', self.grade, day='Tuesday')
+        make_activity('Debate', Grade.objects.create(name='12'))
+        Activity.objects.filter(pk=self.full.pk).update(booked_count=1)
+        Activity.objects.filter(pk=self.busy.pk).update(booked_count=3)
+        Activity.objects.filter(pk=self.quiet.pk).update(booked_count=1)
+
+    def names(self, **kwargs):
+        return [(r['name'], r['same_slot']) for r in suggestions.alternatives(self.full, self.student, **kwargs)]
+
+    def test_ranking(self):
+        self.assertEqual(self.names(), [('Music', True), ('Art', True), ('Drama', False)])
+        self.assertEqual(self.names(limit=1), [('Music', True)])
+        self.assertEqual(self.names(exclude=[self.quiet.pk]), [('Art', True), ('Drama', False)])
+
+    def test_vacancy_is_live(self):
+        suggestions.alternatives(self.full, self.student)
+        Activity.objects.filter(pk=self.busy.pk).update(booked_count=4)
+        # Art filled up since the catalog was cached; another student's hold takes Music's last seats
+        Activity.objects.filter(pk=self.quiet.pk).update(booked_count=3)
+        seats.hold(self.other, self.quiet)
+        with self.assertNumQueries(2):
+            self.assertEqual(self.names(), [('Drama', False)])
+
+    def test_full_message_links(self):
+        self.client.login(username='s@example.com', password='pw')
+        response = self.client.post(f'/book/{self.full.pk}/', follow=True)
+        message = str(list(response.context['messages'])[0])
+        self.assertIn("This activity is full. Still open on Monday:", message)
+        self.assertIn(f'<a href="/book/{self.quiet.pk}/">Music</a> (same time)', message)
+
+
+class SeatRaceTests(TransactionTestCase):
+    """Two claimants in separate connections race for the last seat."""
+
+    def test_last_seat(self):
+        grade = Grade.objects.create(name='9')
+        students = [make_student(f'race{n}@example.com', grade) for n in range(2)]
+        activity = make_activity('Drama', grade, capacity=1)
+        barrier = threading.Barrier(len(students))
+        results = []
+
+        def claim(student):
+            try:
+                barrier.wait()
+                for _ in range(50):
+                    try:
+                        with tenancy.atomic():
+                            results.append(seats.claim(activity, student))
+                        return
+                    except OperationalError:
+                        # sqlite reports a locked table instead of waiting
+                        time_module.sleep(0.01)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=claim, args=(s,)) for s in students]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(results), [False, True])
+        self.assertEqual(Activity.objects.get(pk=activity.pk).booked_count, 1)
+
+
+class SearchTests(TestCase):
+    """The student search index and its upkeep on booking changes."""
+
+    def setUp(self):
+        self.grade = Grade.objects.create(name='9')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.alexander = make_student('alex@example.com', self.grade, name='Alexander Ndlovu')
+            self.other = make_student('sam@example.com', self.grade, name='Sander Alek')
+        self.chess = make_activity('Chess Club', self.grade)
+        self.drama = make_activity('Drama Club', self.grade, day='Tuesday')
+
+    def test_matches(self):
+        self.assertEqual(search.search_students('xand'), [self.alexander.pk])
+        self.assertEqual(search.search_students('al ndl'), [self.alexander.pk])
+        self.assertEqual(search.search_students('sand'), [self.other.pk])
+        self.assertEqual(search.search_students('sam@example'), [self.other.pk])
+
+    def test_match_within_one_word(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            make_student('rob@example.com', self.grade, name='Rob Obert')
+        # "rob" and "obe" are both there, but in different words
+        self.assertEqual(search.search_students('robe'), [])
+        self.assertEqual(search.search_students('ober'), [StudentProfile.objects.get(name='Rob Obert').pk])
+
+    def test_booking_reindexes_activity_terms_only(self):
+        student_terms = set(SearchTerm.objects.filter(student=self.alexander, field=SearchTerm.STUDENT).values_list('pk', flat=True))
+        with self.captureOnCommitCallbacks(execute=True):
+            Booking.objects.create(student=self.alexander, activity=self.chess)
+            Booking.objects.create(student=self.alexander, activity=self.drama)
+        self.assertEqual(search.search_students('chess'), [self.alexander.pk])
+        self.assertEqual(set(SearchTerm.objects.filter(student=self.alexander, field=SearchTerm.STUDENT).values_list('pk', flat=True)), student_terms)
+
+        club = SearchTerm.objects.get(student=self.alexander, term='club', is_word=True).pk
+        with self.captureOnCommitCallbacks(execute=True):
+            Booking.objects.get(student=self.alexander, activity=self.chess).delete()
+        self.assertEqual(search.search_students('chess'), [])
+        # "club" still comes from Drama Club: the row is kept, not rewritten
+        self.assertEqual(SearchTerm.objects.get(student=self.alexander, term='club', is_word=True).pk, club)
+
+    def test_one_batch_per_transaction(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            with tenancy.atomic():
+                Booking.objects.create(student=self.alexander, activity=self.chess)
+                Booking.objects.create(student=self.other, activity=self.chess)
+        self.assertEqual(len(callbacks), 1)
+        callbacks[0]()
+        self.assertEqual(search.search_students('chess'), [self.alexander.pk, self.other.pk])
+
+
+class AdmissionControlTests(TestCase):
+    """Booking requests over the limits are answered before any database work."""
+
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def middleware(self, **conf):
+        with override_settings(BOOKING_ADMISSION={'MAX_IN_FLIGHT': 1, 'RATE': 1.0, 'BURST': 2, **conf}):
+            return AdmissionControlMiddleware(lambda request: HttpResponse('ok'))
+
+    def post(self, path='/book/1/', session='abc'):
+        request = self.factory.post(path)
+        request.COOKIES[settings.SESSION_COOKIE_NAME] = session
+        return request
+
+    def test_shed_when_full(self):
+        mw = self.middleware()
+        slots = mw._slots(tenancy.db_alias())
+        self.assertTrue(slots.acquire(blocking=False))
+        self.addCleanup(slots.release)
+        with self.assertNumQueries(0):
+            response = mw(self.post())
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '2')
+
+    def test_slot_released(self):
+        mw = self.middleware()
+        for _ in range(2):
+            self.assertEqual(mw(self.post(session=str(_))).status_code, 200)
+        self.assertEqual(AdmissionControlMiddleware.stats()['in_flight'], 0)
+
+    def test_token_bucket(self):
+        mw = self.middleware()
+        now = 1000.0
+        with mock.patch('bookings.middleware.time.monotonic', side_effect=lambda: now):
+            codes = [mw(self.post()).status_code for _ in range(3)]
+            self.assertEqual(codes, [200, 200, 429])
+            # another client has its own bucket
+            self.assertEqual(mw(self.post(session='other')).status_code, 200)
+            # one token back per second, never more than BURST
+            now += 1
+            self.assertEqual([mw(self.post()).status_code for _ in range(2)], [200, 429])
+            now += 60
+            self.assertEqual([mw(self.post()).status_code for _ in range(3)], [200, 200, 429])
+
+    def test_unguarded_paths(self):
+        mw = self.middleware(BURST=0)
+        self.assertEqual(mw(self.post('/activity/')).status_code, 200)
+        # wizard steps before the last aren't throttled
+        self.assertEqual(mw(self.post('/booking-wizard/0/')).status_code, 200)
+        self.assertEqual(mw(self.post(f'/booking-wizard/{len(Activity.DAYS)}/')).status_code, 429)
+
+
+BUDGETS_FILE = Path(__file__).with_name('benchmark_budgets.json')
+
+BENCH_GRADES = ['7', '8', '9', '10', '11', '12']
+BENCH_ACTIVITIES_PER_DAY = 5
+
+
+def build_benchmark_data(students, seed=0):
+    """
+    A deterministic school of ``students`` students: six grades, five
+    activities a day, and three bookings for nine students in ten (the
+    tenth has none, so the booking wizard is open to them).
+    """
+    rng = random.Random(seed)
+    User = get_user_model()
+    grades = Grade.objects.bulk_create([Grade(name=name) for name in BENCH_GRADES])
+    Term.objects.create(name='Bench term', is_current=True)
+
+    days = [key for key, _ in Activity.DAYS]
+    capacity = math.ceil(students * 3 / (len(days) * BENCH_ACTIVITIES_PER_DAY) * 1.5)
+    activities = Activity.objects.bulk_create([
+        Activity(
+            name=f'Activity {d}-{i}', day=day, time='3:00pm - 4:00pm',
+            start_time=time(15), end_time=time(16),
+            capacity=0 if i == 0 else capacity,
+        )
+        for d, day in enumerate(days) for i in range(BENCH_ACTIVITIES_PER_DAY)
+    ])
+    Through = Activity.allowed_grades.through
+    Through.objects.bulk_create([
+        Through(activity_id=a.pk, grade_id=g.pk)
+        for i, a in enumerate(activities) for j, g in enumerate(grades) if (i + j) % 3
+    ])
+    allowed = defaultdict(list)  # (grade id, day) -> activities
+    for i, a in enumerate(activities):
+        for j, g in enumerate(grades):
+            if (i + j) % 3:
+                allowed[g.pk, a.day].append(a)
+
+    User.objects.bulk_create([User(email=f'bench{n}@example.com', password='!') for n in range(students)])
+    users = User.objects.filter(email__startswith='bench').order_by('pk')
+    profiles = StudentProfile.objects.bulk_create([
+        StudentProfile(user=user, name=f'Student {n:05d}', grade=grades[n % len(grades)])
+        for n, user in enumerate(users)
+    ])
+
+    booked = defaultdict(int)
+    bookings = []
+    for n, student in enumerate(profiles):
+        if n % 10 == 9:
+            continue
+        for day in rng.sample(days, 3):
+            options = [a for a in allowed[student.grade_id, day] if not a.capacity or booked[a.pk] < a.capacity]
+            if options:
+                activity = rng.choice(options)
+                booked[activity.pk] += 1
+                bookings.append(Booking(student=student, activity=activity, day=day))
+    Booking.objects.bulk_create(bookings, batch_size=2000)
+    for activity_id, n in booked.items():
+        Activity.objects.filter(pk=activity_id).update(booked_count=n)
+    return profiles
+
+
+class BenchmarkTests(TestCase):
+    """Query-count and latency budgets for the main views.
+
+    Each size in ``BENCH_SIZES`` (comma-separated, default ``100``; the
+    full sweep is ``100,1000,10000``) gets a fresh data set. Every view is
+    requested cold (empty cache) ``BENCH_REPEATS`` times. The test fails
+    when a view runs more queries than its budget in
+    ``benchmark_budgets.json`` or when its query count grows with the data.
+    When ``BENCH_SIZES`` is set it also fails when a view's p95 latency is
+    over the budget for that size; a plain test run leaves timings alone,
+    since a busy shared machine can double them. The latency budgets are
+    deliberately loose so that slower machines pass. Every
+    statement the request sends counts, transaction control included; the
+    cache is pinned to LocMemCache so the numbers don't depend on CACHES.
+    ``BENCH_REPORT=1`` prints a table of the measurements to stderr, and
+    ``BENCH_WRITE_BUDGETS=1`` rewrites the file from them.
+    """
+
+    # name -> (url, who is logged in)
+    VIEWS = {
+        'activity_list': ('/activity/', 'student'),
+        'my_bookings': ('/my-bookings/', 'student'),
+        'booking_wizard': ('/booking-wizard/1/', 'new_student'),
+        'dashboard': ('/', 'admin'),
+        'dashboard_panel:summary': ('/dashboard/panel/summary/', 'admin'),
+        'dashboard_panel:top_activities': ('/dashboard/panel/top_activities/', 'admin'),
+        'dashboard_panel:students_by_grade': ('/dashboard/panel/students_by_grade/', 'admin'),
+        'dashboard_panel:zero_bookings': ('/dashboard/panel/zero_bookings/', 'admin'),
+        'dashboard_panel:unlimited_activities': ('/dashboard/panel/unlimited_activities/', 'admin'),
+        'admin:booking_changelist': ('/admin/bookings/booking/', 'admin'),
+        'admin:studentprofile_changelist': ('/admin/bookings/studentprofile/', 'admin'),
+        'admin:activity_changelist': ('/admin/bookings/activity/', 'admin'),
+    }
+
+    def setUp(self):
+        metrics_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(metrics_dir.cleanup)
+        metrics_settings = override_settings(METRICS_DIR=metrics_dir.name, CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'KEY_FUNCTION': 'bookings.tenancy.make_cache_key',
+        }})
+        metrics_settings.enable()
+        self.addCleanup(metrics_settings.disable)
+
+    def measure(self, url, user, repeats):
+        self.client.force_login(user)
+        queries, timings = [], []
+        for _ in range(repeats + 1):
+            cache.clear()
+            with CaptureQueriesContext(connection) as captured:
+                started = timeit.default_timer()
+                response = self.client.get(url)
+                elapsed = (timeit.default_timer() - started) * 1000
+            self.assertEqual(response.status_code, 200, url)
+            queries.append(len(captured))
+            timings.append(elapsed)
+        # the first request warms up templates, imports and the tenant lookup
+        timings = sorted(timings[1:])
+        return {
+            'queries': max(queries[1:]),
+            'p50_ms': timings[len(timings) // 2],
+            'p95_ms': timings[min(math.ceil(len(timings) * 0.95), len(timings)) - 1],
+        }
+
+    def run_size(self, size):
+        sid = transaction.savepoint()
+        try:
+            profiles = build_benchmark_data(size)
+            users = {
+                'student': profiles[0].user,
+                'new_student': profiles[9].user,
+                'admin': get_user_model().objects.create_superuser(f'bench-admin{size}@example.com', 'x'),
+            }
+            repeats = int(os.environ.get('BENCH_REPEATS', 5))
+            return {name: self.measure(url, users[who], repeats) for name, (url, who) in self.VIEWS.items()}
+        finally:
+            transaction.savepoint_rollback(sid)
+
+    def report(self, results):
+        sizes = sorted(results)
+        lines = [f"{'view':36}" + "".join(f"{size:>10} q {'p95 ms':>8}" for size in sizes)]
+        for name in self.VIEWS:
+            row = "".join(f"{results[s][name]['queries']:>12} {results[s][name]['p95_ms']:>8.1f}" for s in sizes)
+            if len(sizes) > 1:
+                growth = results[sizes[-1]][name]['p95_ms'] / max(results[sizes[0]][name]['p95_ms'], 0.01)
+                row += f"   x{growth:.1f} time over x{sizes[-1] // sizes[0]} data"
+            lines.append(f"{name:36}{row}")
+        sys.stderr.write("\n" + "\n".join(lines) + "\n")
+
+    def write_budgets(self, budgets, results):
+        for name in self.VIEWS:
+            entry = budgets.setdefault(name, {'queries': 0, 'p95_ms': {}})
+            entry['queries'] = max(r[name]['queries'] for r in results.values())
+            for size, r in results.items():
+                # 3x headroom, at least 100 ms: the budget has to hold on slower machines too
+                entry['p95_ms'][str(size)] = max(math.ceil(r[name]['p95_ms'] * 3 / 10) * 10, 100)
+        BUDGETS_FILE.write_text(json.dumps(budgets, indent=2, sort_keys=True) + "\n")
+
+    def test_view_budgets(self):
+        timed = 'BENCH_SIZES' in os.environ
+        sizes = [int(s) for s in os.environ.get('BENCH_SIZES', '100').split(',') if s.strip()]
+        results = {size: self.run_size(size) for size in sizes}
+        if os.environ.get('BENCH_REPORT'):
+            self.report(results)
+
+        budgets = json.loads(BUDGETS_FILE.read_text())
+        if os.environ.get('BENCH_WRITE_BUDGETS'):
+            self.write_budgets(budgets, results)
+            return
+
+        for name in self.VIEWS:
+            budget = budgets[name]
+            counts = [results[size][name]['queries'] for size in sizes]
+            with self.subTest(view=name):
+                self.assertLessEqual(max(counts), budget['queries'], f"{name} ran {counts} queries")
+                self.assertEqual(len(set(counts)), 1, f"{name}: query count grows with the data {dict(zip(sizes, counts))}")
+                for size in sizes if timed else ():
+                    limit = budget['p95_ms'].get(str(size))
+                    if limit is not None:
+                        p95 = results[size][name]['p95_ms']
+                        self.assertLessEqual(p95, limit, f"{name} p95 {p95:.1f} ms at {size} students")
@@ -0,0 +1,53 @@
+# activities/timeslots.py
+"""Parsing of the free-text ``Activity.time`` values into start/end times."""
+import re
+from datetime import time
+
+_TIME = r'(\d{1,2})(?:[:.](\d{2}))?\s*([ap]\.?m\.?)?'
+_RANGE = re.compile(rf'^\s*{_TIME}\s*(?:-|–|—|to)\s*{_TIME}\s*$', re.IGNORECASE)
+_SINGLE = re.compile(rf'^\s*{_TIME}\s*$', re.IGNORECASE)
+
+
+def _to_time(hour, minute, meridiem):
+    hour, minute = int(hour), int(minute or 0)
+    if meridiem:
+        meridiem = meridiem[0].lower()
+        if not 1 <= hour <= 12:
+            return None
+        hour = hour % 12 + (12 if meridiem == 'p' else 0)
+    if hour > 23 or minute > 59:
+        return None
+    return time(hour, minute)
+
+
+def parse_time_range(text):
+    """
+    Return ``(start, end)`` for strings like "3:00pm - 4:30pm", "15:00-16:00"
+    or "3 to 4 PM"; ``end`` is None for a single time such as "12:45".
+    Returns None when the text can't be understood.
+    """
+    if not text:
+        return None
+    m = _RANGE.match(text)
+    if m:
+        h1, m1, ap1, h2, m2, ap2 = m.groups()
+        # "3 - 4pm": the start shares the end's am/pm unless that would put it after the end
+        start = _to_time(h1, m1, ap1 or ap2)
+        end = _to_time(h2, m2, ap2)
+        if start and end and not ap1 and ap2 and start > end:
+            start = _to_time(h1, m1, 'am' if ap2[0].lower() == 'p' else 'pm')
+        if start is None or end is None or end <= start:
+            return None
+        return start, end
+    m = _SINGLE.match(text)
+    if m:
+        start = _to_time(*m.groups())
+        return (start, None) if start else None
+    return None
+
+
+def format_time_range(start, end):
+    fmt = lambda t: t.strftime('%I:%M%p').lstrip('0').lower()
+    if end is None:
+        return fmt(start)
+    return f"{fmt(start)} - {fmt(end)}"
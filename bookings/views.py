@@ -1,126 +1,106 @@
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, redirect, get_object_or_404
 
 from django.contrib.auth.decorators import login_required
-from .models import Activity, Booking, StudentProfile
+from django.contrib.auth.views import redirect_to_login
+from .models import Activity, Booking, BookingEvent, StudentProfile
+from . import dashboard as dashboard_panels
+from . import attendance, catalog, ical, journal, metrics, search, seats, suggestions, tenancy
+from .caching import get_version
+from .middleware import AdmissionControlMiddleware
+from django.conf import settings
 from django.contrib import messages
+from django.core.cache import cache
+from django.db import IntegrityError
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, HttpResponseNotModified, JsonResponse
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_time
+from django.utils.html import format_html, format_html_join
+from django.utils.safestring import mark_safe
+from django.views.decorators.gzip import gzip_page
 from django.contrib.auth import login
 from .forms import CustomUserCreationForm, StudentProfileForm
 
-from .forms import DaySelectionForm
-from django.db.models import Count, F, FloatField, ExpressionWrapper
-
-from django.db.models import Count, Q
-
-@login_required
-def dashboard(request):
-    # Restrict access to staff (or superuser) only
-    if not request.user.is_admin:
-        return redirect('booking_wizard', step=0)  
-
-    # Total students (users registered with profile)
-    total_students = StudentProfile.objects.count()
 
-    # Students by grade
-    students_by_grade = (
-        StudentProfile.objects.values('grade__name')
-        .annotate(total=Count('id'))
-        .order_by('grade')
-    )
+def _full_message(request, text, activity, student, exclude=(), links=True):
+    """Flash ``text`` followed by the day's open alternatives (as booking links with ``links``)."""
+    options = suggestions.alternatives(activity, student, exclude)
+    if options:
+        if links:
+            listed = format_html_join(", ", '<a href="{}">{}</a>{}', (
+                (reverse('book_activity', args=[o['id']]), o['name'], " (same time)" if o['same_slot'] else "")
+                for o in options
+            ))
+        else:
+            listed = ", ".join(o['name'] for o in options)
+        text = format_html("{} Still open on {}: {}.", text, activity.day, listed)
+    messages.error(request, text)
 
-    # Activities with bookings
-    activities = (
-        Activity.objects
-        .annotate(num_bookings=Count('bookings'))
-        .filter(num_bookings=0)   # only activities with 0 bookings
-        .order_by('day', 'name')
-    )
 
-    
+async def _admin_user(request):
+    user = await request.auser()
+    return user if user.is_authenticated and user.is_admin else None
 
-    # Top 5 activities by percentage booked (excluding unlimited capacity)
-    top_activities = (
-        Activity.objects
-        .annotate(
-            num_bookings=Count('bookings'),
-            booking_percentage=ExpressionWrapper(
-                (F('num_bookings') * 100.0) / F('capacity'),
-                output_field=FloatField()
-            )
-        )
-        .exclude(capacity__isnull=True)        # exclude unlimited
-        .exclude(capacity=0)                   # exclude capacity=0 to avoid division by zero
-        .order_by('-booking_percentage')[:5]   # top 5
-    )
-
-    # Unlimited capacity: just rank by number of bookings
-    unlimited_activities = (
-        Activity.objects
-        .filter(capacity=0)
-        .annotate(num_bookings=Count('bookings'))
-        .order_by('-num_bookings')[:5]
-    )
 
+async def dashboard(request):
+    """Dashboard shell: cached panels inline, the rest are fetched by the page."""
+    user = await request.auser()
+    if not user.is_authenticated:
+        return redirect_to_login(request.get_full_path())
+    # Restrict access to staff (or superuser) only
+    if not user.is_admin:
+        return redirect('booking_wizard', step=0)
 
-    # --- New Stats ---
-    # Count bookings per student
-    bookings_per_student = (
-        Booking.objects.values('student')
-        .annotate(total_bookings=Count('id'))
-    )
+    cached = await dashboard_panels.cached_panels()
+    # the base template and context processors use the ORM synchronously
+    return await sync_to_async(render)(request, 'activities/report.html', {
+        'panels': {name: mark_safe(html) for name, html in cached.items()},
+    })
 
-    # Students who booked all 7 days
-    booked_all_7 = bookings_per_student.filter(total_bookings=7).count()
 
-    # Students who booked exactly 3
-    booked_exactly_3 = bookings_per_student.filter(total_bookings=3).count()
+async def dashboard_panel(request, name):
+    """One dashboard panel as an HTML fragment."""
+    if name not in dashboard_panels.PANELS:
+        raise Http404
+    if await _admin_user(request) is None:
+        return HttpResponse(status=403)
+    return HttpResponse(await dashboard_panels.render_panel(name))
 
-    # Students who booked >3 and <7
-    booked_between = bookings_per_student.filter(total_bookings__gt=3, total_bookings__lt=7).count()
-
-    return render(request, 'activities/report.html', {
-        'total_students': total_students,
-        'students_by_grade': students_by_grade,
-        'activities': activities,
-        'booked_all_7': booked_all_7,
-        'booked_exactly_3': booked_exactly_3,
-        'booked_between': booked_between,
-        'top_activities': top_activities,
-        'unlimited_activities': unlimited_activities,
-    })
 
 
 
+def _student(request):
+    """The logged-in student (from StudentContextMiddleware); 404 for accounts without a profile."""
+    if request.student is None:
+        raise Http404("No student profile for this account.")
+    return request.student
 
-from django.core.exceptions import ObjectDoesNotExist
 
 @login_required
 def activity_list(request):
-    student = None
+    # No student profile -> treat as admin
+    student = request.student
     bookings = []
-    booked_ids = set()
-    booking_map = {}
+    if request.student_bookings:
+        bookings = list(Booking.objects.filter(student=student))
+    booked_ids = set(b.activity_id for b in bookings)
+    booking_map = {b.activity_id: b for b in bookings}
+    booked_days = {b.day: b for b in bookings}
+
+    # If student -> only their grade's activities
+    rows = catalog.with_vacancy(catalog.grade_catalog(student.grade_id if student else None), student)
+    by_day = {}
+    for row in rows:
+        by_day.setdefault(row['day'], []).append(row)
 
-    try:
-        student = StudentProfile.objects.get(user=request.user)
-        bookings = Booking.objects.filter(student=student).select_related('activity')
-        booked_ids = set(b.activity_id for b in bookings)
-        booking_map = {b.activity_id: b for b in bookings}
-    except ObjectDoesNotExist:
-        # No student profile -> treat as admin
-        pass
-
-    days = Activity.DAYS
     grouped = []
-    for day_key, day_label in days:
-        activities_qs = Activity.objects.filter(day=day_key).order_by('name')
-
-        # If student -> filter by grade
-        if student:
-            activities_qs = activities_qs.filter(allowed_grades=student.grade)
-
+    for day_key, day_label in Activity.DAYS:
         grouped.append({
             'day': day_label,
-            'activities': activities_qs
+            'activities': by_day.get(day_key, [])
         })
 
     total_booked = len(bookings)
@@ -130,42 +110,56 @@ def activity_list(request):
         'total_booked': total_booked,
         'student': student,
         'booked_ids': booked_ids,
-        'booking_map': booking_map
+        'booking_map': booking_map,
+        'booked_days': booked_days,
     })
 
 
+def _outcome(view, outcome):
+    metrics.inc('booking_outcomes_total', view=view, outcome=outcome)
+
+
 @login_required
+@tenancy.atomic()
 def book_activity(request, pk):
-    student = StudentProfile.objects.get(user=request.user)
+    student = _student(request)
     activity = get_object_or_404(Activity, pk=pk)
 
     # Check if already booked this day
     existing_booking = Booking.objects.filter(student=student, day=activity.day).first()
     if existing_booking:
-        if not existing_booking.can_modify():
-            messages.error(request, "You cannot change this booking (time limit exceeded).")
-            return redirect('activity_list')
-        else:
-            # Optional: Allow replacing within 30 min by deleting the old booking
-            existing_booking.delete()
+        # replacing the day's booking: move it in one step so the old seat is kept if this fails
+        return swap_activity(request, pk)
 
     # Total limit
     total_booked = Booking.objects.filter(student=student).count()
     if total_booked >= 7:
+        _outcome('book_activity', 'limit_7')
         messages.error(request, "You can only book up to 7 activities for the week.")
         return redirect('activity_list')
 
     # Grade check
     if student.grade not in activity.allowed_grades.all():
+        _outcome('book_activity', 'grade_not_allowed')
         messages.error(request, "You are not allowed to book this activity.")
         return redirect('activity_list')
 
-    # Capacity check
-    if activity.capacity > 0 and activity.bookings.count() >= activity.capacity:
-        messages.error(request, "This activity is full.")
+    # Capacity check: take the seat (seats held in the booking wizard count as taken)
+    try:
+        with tenancy.atomic():
+            claimed = seats.claim(activity, student)
+            if claimed:
+                booking = Booking.objects.create(student=student, activity=activity)
+    except (ValueError, IntegrityError):
+        # lost the day to a concurrent request since the checks above
+        metrics.inc('booking_claim_conflicts_total', view='book_activity')
+        claimed = False
+    if not claimed:
+        _outcome('book_activity', 'full')
+        _full_message(request, "This activity is full.", activity, student)
         return redirect('activity_list')
-
-    Booking.objects.create(student=student, activity=activity)
+    journal.record(BookingEvent.BOOK, booking, request.user, claimed=True)
+    _outcome('book_activity', 'booked')
     messages.success(request, f"Booked: {activity.name} on {activity.day}")
     return redirect('activity_list')
 
@@ -175,16 +169,53 @@ def book_activity(request, pk):
 
 
 @login_required
+@tenancy.atomic()
+def swap_activity(request, pk):
+    """Switch the student's booking on the activity's day to this activity."""
+    student = _student(request)
+    activity = get_object_or_404(Activity, pk=pk)
+    current = Booking.objects.filter(student=student, day=activity.day).select_related('activity').first()
+
+    if current is None:
+        return redirect('book_activity', pk)
+    if current.activity_id == activity.pk:
+        messages.info(request, f"You are already booked for {activity.name}.")
+        return redirect('activity_list')
+    if not current.can_modify():
+        _outcome('swap_activity', 'locked')
+        messages.error(request, "You cannot change this booking (time limit exceeded).")
+        return redirect('activity_list')
+    if not activity.allowed_grades.filter(pk=student.grade_id).exists():
+        _outcome('swap_activity', 'grade_not_allowed')
+        messages.error(request, "You are not allowed to book this activity.")
+        return redirect('activity_list')
+
+    old_name = current.activity.name
+    try:
+        seats.swap(current, activity, request.user)
+    except ValueError as e:
+        _outcome('swap_activity', 'full')
+        _full_message(request, f"{e} You are still booked for {old_name}.", activity, student, exclude=[current.activity_id])
+        return redirect('activity_list')
+    _outcome('swap_activity', 'swapped')
+    messages.success(request, f"Switched from {old_name} to {activity.name} on {activity.day}")
+    return redirect('activity_list')
+
+
+@login_required
+@tenancy.atomic()
 def unbook_activity(request, pk):
-    student = StudentProfile.objects.get(user=request.user)
+    student = _student(request)
     booking = Booking.objects.filter(student=student, activity_id=pk).first()
 
     if not booking:
+        _outcome('unbook_activity', 'not_booked')
         messages.error(request, "You have not booked this activity.")
         return redirect('activity_list')
 
     # Check if booking is locked
     if not booking.can_modify():
+        _outcome('unbook_activity', 'locked')
         messages.error(request, "You can no longer unbook this activity (time limit exceeded).")
         return redirect('activity_list')
 
@@ -193,10 +224,13 @@ def unbook_activity(request, pk):
 
     # Prevent unbooking if it would go below 3
     if total_booked <= 3:
+        _outcome('unbook_activity', 'min_3')
         messages.error(request, "You must have at least 3 bookings. Cannot unbook further.")
         return redirect('activity_list')
 
+    journal.record(BookingEvent.UNBOOK, booking, request.user)
     booking.delete()
+    _outcome('unbook_activity', 'unbooked')
     messages.success(request, "Booking removed.")
     return redirect('activity_list')
 
@@ -205,18 +239,20 @@ def unbook_activity(request, pk):
 
 
 @login_required
+@tenancy.atomic()
 def booking_wizard(request, step=0):
-    student = StudentProfile.objects.get(user=request.user)
+    student = _student(request)
 
     # Prevent entering booking wizard if already booked
-    existing_bookings = Booking.objects.filter(student=student)
-    if existing_bookings.exists():
+    if request.student_bookings:
+        _outcome('booking_wizard', 'already_booked')
         messages.warning(request, "You have already made your bookings.")
         return redirect("activity_list")
 
     # First step: reset choices
     if step == 0:
         request.session['booking_choices'] = {}
+        seats.release(student)
 
     days = Activity.DAYS
     if step >= len(days):
@@ -226,51 +262,80 @@ def booking_wizard(request, step=0):
 
         # Rule: Must choose exactly 3 activities
         if len(chosen_days) < 3:
+            _outcome('booking_wizard', 'min_3')
             messages.error(request, "You must select at least 3 activities in total.")
             return redirect('booking_wizard', step=0)
 
-        # Save bookings
-        # Save bookings
-        for activity_id in selections.values():
-            if activity_id:  # skip empty
-                try:
-                    activity = Activity.objects.get(pk=activity_id)
-                except Activity.DoesNotExist:
-                    continue
-
-                # Check if capacity is full
-                if activity.capacity != 0 and activity.bookings.count() >= activity.capacity:
-                    messages.error(
-                        request, 
-                        f"Sorry, {activity.name} on {activity.day} is already full."
-                    )
-                    return redirect("booking_wizard", step=0)
-
-                Booking.objects.get_or_create(student=student, activity=activity)
-
-
+        # Save bookings: all or nothing. The student's holds reserve their
+        # seats, so this only fails if a hold lapsed and the seat was taken.
+        day_steps = {day: i for i, (day, _) in enumerate(days)}
+        activities = Activity.objects.in_bulk([a for a in selections.values() if a])
+        booked = []
+        try:
+            with tenancy.atomic():
+                for day, activity_id in selections.items():
+                    activity = activities.get(int(activity_id)) if activity_id else None
+                    if activity is None:
+                        continue
+                    if not seats.claim(activity, student):
+                        raise seats.SeatTaken(activity)
+                    booked.append(Booking.objects.create(student=student, activity=activity))
+                for booking in booked:
+                    journal.record(BookingEvent.BOOK, booking, request.user, claimed=True)
+                seats.release(student)
+        except seats.SeatTaken as e:
+            _outcome('booking_wizard', 'full')
+            _full_message(
+                request, f"Sorry, {e.activity.name} on {e.activity.day} is already full. Please pick another activity.",
+                e.activity, student, links=False,
+            )
+            return redirect("booking_wizard", step=day_steps.get(e.activity.day, 0))
+        except (ValueError, IntegrityError):
+            metrics.inc('booking_claim_conflicts_total', view='booking_wizard')
+            _outcome('booking_wizard', 'full')
+            messages.error(request, "Your bookings changed in the meantime. Please try again.")
+            return redirect("booking_wizard", step=0)
+
+        _outcome('booking_wizard', 'booked')
         messages.success(request, "Your activities have been booked successfully!")
         return redirect('my_bookings')  # Or summary page
 
     day_key, day_label = days[step]
-    activities = Activity.objects.filter(
+    activities = list(Activity.objects.filter(
         day=day_key,
         allowed_grades=student.grade
-    )
+    ))
 
     if request.method == "POST":
         choice = request.POST.get("activity")
+        activity = next((a for a in activities if str(a.pk) == choice), None)
+        if activity is None:
+            seats.release(student, day_key)
+        elif not seats.hold(student, activity):
+            _outcome('booking_wizard', 'hold_full')
+            _full_message(
+                request, f"Sorry, {activity.name} has just filled up. Please pick another activity.",
+                activity, student, links=False,
+            )
+            return redirect('booking_wizard', step=step)
         choices = request.session.get('booking_choices', {})
-        choices[day_key] = choice
+        choices[day_key] = choice if activity else ''
         request.session['booking_choices'] = choices
         return redirect('booking_wizard', step=step+1)
 
+    # vacancy net of other students' holds; the student's own hold counts as theirs
+    held = seats.held_counts([a.pk for a in activities], student)
+    for a in activities:
+        a.vacancy = max(a.capacity - a.booked_count - held.get(a.pk, 0), 0)
+
     return render(request, 'activities/booking_wizard.html', {
         'step': step,
         'day_label': day_label,
         'activities': activities,
         'total_steps': len(days),
-        'current_choices': request.session.get('booking_choices', {})
+        'current_choices': request.session.get('booking_choices', {}),
+        'current_choice': request.session.get('booking_choices', {}).get(day_key, ''),
+        'hold_minutes': int(seats.HOLD_TTL.total_seconds() // 60),
     })
 
 
@@ -304,10 +369,229 @@ def register(request):
 
 @login_required
 def my_bookings(request):
-    student = StudentProfile.objects.get(user=request.user)
+    student = _student(request)
     bookings = Booking.objects.filter(student=student).select_related("activity")
 
+    calendar_url = request.build_absolute_uri(reverse("calendar_feed", args=[ical.make_token(student)]))
     return render(request, "activities/my_bookings.html", {
         "student": student,
         "bookings": bookings,
-    })
\ No newline at end of file
+        "calendar_url": calendar_url,
+    })
+
+
+def calendar_feed(request, token):
+    """
+    Login-free .ics feed of a student's bookings. The ETag is built from
+    cache version counters, so unchanged calendars are answered with a 304
+    (or a cached body) without touching the database.
+    """
+    student_id = ical.read_token(token)
+    if student_id is None:
+        raise Http404("Unknown calendar.")
+
+    etag = f'"{student_id}-{get_version("student", student_id)}-{get_version("activities")}"'
+    if etag in request.headers.get('If-None-Match', ''):
+        response = HttpResponseNotModified()
+    else:
+        key = f'ical:{etag}'
+        body = cache.get(key)
+        if body is None:
+            body = ical.build_calendar(student_id, request.get_host())
+            cache.set(key, body, 60 * 60 * 24)
+        response = HttpResponse(body, content_type='text/calendar; charset=utf-8')
+        response['Content-Disposition'] = 'inline; filename="activities.ics"'
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, max-age=900'
+    return response
+
+
+
+@login_required
+def roll_call(request):
+    """What's on now (with who should be there) and what's next, for a day and time."""
+    if not request.user.is_admin:
+        return redirect('booking_wizard', step=0)
+
+    now = timezone.localtime()
+    day = request.GET.get('day') or now.strftime('%A')
+    if day not in dict(Activity.DAYS):
+        return HttpResponseBadRequest("day must be a weekday name, e.g. Monday.")
+    try:
+        # parse_time returns None for a malformed value but raises for an impossible one (25:00)
+        at = parse_time(request.GET.get('at') or '') or now.time().replace(second=0, microsecond=0)
+    except ValueError:
+        return HttpResponseBadRequest("at must be a time of day, e.g. 15:30.")
+
+    running = list(Activity.objects.running_at(day, at).order_by('start_time', 'name'))
+    bookings = (
+        Booking.objects.roll_call(day, at)
+        .select_related('student__user', 'student__grade')
+        .order_by('student__name')
+    )
+    roster = {a.pk: [] for a in running}
+    for b in bookings:
+        roster.setdefault(b.activity_id, []).append(b)
+
+    return render(request, 'activities/roll_call.html', {
+        'day': day,
+        'at': at,
+        'days': Activity.DAYS,
+        'running': [(a, roster.get(a.pk, [])) for a in running],
+        'upcoming': Activity.objects.starting_after(day, at)[:10],
+        'register_date': attendance.last_date(day),
+    })
+
+
+@login_required
+def take_register(request, pk):
+    """The register for one dated session of an activity; POST saves the whole register."""
+    if not request.user.is_admin:
+        return redirect('booking_wizard', step=0)
+
+    activity = get_object_or_404(Activity, pk=pk)
+    try:
+        date = parse_date(request.GET.get('date') or '') or attendance.last_date(activity.day)
+    except ValueError:
+        return HttpResponseBadRequest("date must be a calendar date, e.g. 2025-01-31.")
+    if date.strftime('%A') != activity.day:
+        raise Http404("The activity doesn't run on that date.")
+
+    if request.method == 'POST':
+        present = [int(pk) for pk in request.POST.getlist('present') if pk.isdigit()]
+        attendance.mark(activity, date, present, request.user)
+        messages.success(request, f"Register saved for {activity.name} on {date:%A %d %B}.")
+        return redirect(f"{reverse('take_register', args=[activity.pk])}?date={date.isoformat()}")
+
+    rows = attendance.register(activity, date)
+    return render(request, 'activities/register.html', {
+        'activity': activity,
+        'date': date,
+        'rows': rows,
+        'taken': any(present is not None for _, present in rows),
+        'previous': date - timedelta(days=7),
+        'next': date + timedelta(days=7),
+    })
+
+
+
+
+def _compact_json(data, status=200):
+    return JsonResponse(data, status=status, json_dumps_params={'separators': (',', ':')})
+
+
+def _selected_fields(request, available):
+    """Fields named in ``?fields=a,b`` (all by default), or None if any is unknown."""
+    wanted = [f for f in request.GET.get('fields', '').split(',') if f]
+    if not wanted:
+        return available
+    return wanted if set(wanted) <= set(available) else None
+
+
+@gzip_page
+def api_catalog(request):
+    """The activities the student can book, with live vacancy, as compact rows."""
+    if not request.user.is_authenticated:
+        return _compact_json({'error': 'login required'}, status=401)
+    available = catalog.CATALOG_FIELDS + ['booked', 'spots_left']
+    fields = _selected_fields(request, available)
+    if fields is None:
+        return _compact_json({'error': f'fields must be from: {",".join(available)}'}, status=400)
+
+    student = request.student
+    rows = catalog.grade_catalog(student.grade_id if student else None)
+    if {'booked', 'spots_left'} & set(fields):
+        rows = catalog.with_vacancy(rows, student)
+    return _compact_json(catalog.encode(rows, fields))
+
+
+@gzip_page
+def api_my_bookings(request):
+    """The student's bookings as compact rows; join to the catalog on activity_id."""
+    if not request.user.is_authenticated:
+        return _compact_json({'error': 'login required'}, status=401)
+    fields = _selected_fields(request, catalog.BOOKING_FIELDS)
+    if fields is None:
+        return _compact_json({'error': f'fields must be from: {",".join(catalog.BOOKING_FIELDS)}'}, status=400)
+
+    student = request.student
+    rows = catalog.student_bookings(student.pk) if student else []
+    return _compact_json(catalog.encode(rows, fields))
+
+
+@login_required
+def student_lookup(request):
+    """Staff type-ahead: ``?q=`` matches name, email, grade or booked activity."""
+    if not request.user.is_admin:
+        return JsonResponse({'error': 'forbidden'}, status=403)
+    ids = search.search_students(request.GET.get('q', ''), limit=20)
+    students = StudentProfile.objects.filter(pk__in=ids).select_related('user', 'grade').order_by('name')
+    return JsonResponse({
+        'results': [
+            {'id': s.pk, 'name': s.name, 'email': s.user.email, 'grade': s.grade.name}
+            for s in students
+        ],
+    })
+
+
+
+def booking_changes(request):
+    """
+    Incremental feed of the booking journal for downstream syncs.
+
+    Page with ``?since=<seq>&limit=<n>`` (1 to ``journal.MAX_PAGE``) and pass
+    the returned ``next`` back as ``since``. Events younger than
+    ``journal.SETTLE_DELAY`` are held back (see there). Staff can browse it
+    logged in; sync jobs send ``Authorization: Bearer <BOOKING_FEED_TOKEN>``.
+    """
+    token = getattr(settings, 'BOOKING_FEED_TOKEN', '')
+    authorized = token and request.headers.get('Authorization') == f'Bearer {token}'
+    if not authorized and not (request.user.is_authenticated and request.user.is_admin):
+        return JsonResponse({'error': 'forbidden'}, status=403)
+
+    try:
+        since = int(request.GET.get('since', 0))
+        limit = int(request.GET.get('limit', 500))
+    except ValueError:
+        return JsonResponse({'error': 'since and limit must be integers'}, status=400)
+    if since < 0 or not 1 <= limit <= journal.MAX_PAGE:
+        return JsonResponse({'error': f'since must be >= 0 and limit between 1 and {journal.MAX_PAGE}'}, status=400)
+
+    events = journal.changes_since(since, limit)
+    return JsonResponse({
+        'events': [
+            {
+                'seq': e.pk,
+                'kind': e.kind,
+                'booking': e.booking_id,
+                'student': e.student_id,
+                'activity': e.activity_id,
+                'day': e.day,
+                'actor': e.actor_id,
+                'data': e.data,
+                'at': e.date_created.isoformat(),
+            }
+            for e in events
+        ],
+        'next': events[-1].pk if events else since,
+        'has_more': len(events) == limit,
+    })
+
+
+
+@login_required
+def admission_stats(request):
+    """This worker's admitted/shed counters and the school's booking requests it has in flight."""
+    if not request.user.is_admin:
+        return JsonResponse({'error': 'forbidden'}, status=403)
+    return JsonResponse(AdmissionControlMiddleware.stats())
+
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint: staff login or ``Authorization: Bearer <METRICS_TOKEN>``."""
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    authorized = token and request.headers.get('Authorization') == f'Bearer {token}'
+    if not authorized and not (request.user.is_authenticated and request.user.is_admin):
+        return HttpResponse('forbidden', status=403, content_type='text/plain')
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -5,6 +5,9 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
+
+The dashboard panels (bookings.dashboard) are async views; under ASGI each
+panel request runs on its own, so the page's panels load concurrently.
 """
 
 import os
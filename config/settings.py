@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
 from pathlib import Path
+import json
 import os
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -55,10 +56,15 @@ CRISPY_TEMPLATE_PACK = "bootstrap5"
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'bookings.tenancy.TenantMiddleware',
+    'bookings.metrics.MetricsMiddleware',
+    # before sessions and auth, so shed requests never reach the database
+    'bookings.middleware.AdmissionControlMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'bookings.middleware.StudentContextMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -105,6 +111,37 @@ DATABASES = {
     }
 }
 
+# Extra schools each get their own database alias, e.g.
+# TENANT_DATABASES='{"school_b": {"ENGINE": "django.db.backends.mysql", "NAME": "school_b", ...}}'
+# then: python manage.py provision_tenant school-b --database school_b --host b.example.org
+DATABASES.update(json.loads(os.environ.get('TENANT_DATABASES', '{}')))
+
+DATABASE_ROUTERS = ['bookings.tenancy.TenantRouter']
+
+# Version counters (bookings.caching), cached catalogs/feeds and the cached
+# student context live here. A version bump only reaches the cache it is made
+# in, so with more than one worker process per school use a shared cache:
+# Redis when REDIS_URL is set (needs the redis package), or Memcached. The
+# per-process LocMemCache default is right for a single worker and for
+# development. Don't use the database cache: its incr is a read then a write
+# that resets the key's timeout, and every request would queue on its rows.
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+            'KEY_FUNCTION': 'bookings.tenancy.make_cache_key',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'KEY_FUNCTION': 'bookings.tenancy.make_cache_key',
+        }
+    }
+
+
 
 # DATABASES = {
 #     'default': {
@@ -162,6 +199,27 @@ STATICFILES_DIRS = [
     os.path.join(BASE_DIR, 'static'),
 ]
 
+# Uploaded files and background job output (exports, reports)
+MEDIA_URL = 'media/'
+MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# Admission control for book/unbook/wizard-finalize (see bookings.middleware).
+# The limits are per worker process: keep workers x MAX_IN_FLIGHT under the
+# database's connection limit.
+BOOKING_ADMISSION = {
+    'MAX_IN_FLIGHT': 8,
+    'RETRY_AFTER': 2,
+    'RATE': 1.0,
+    'BURST': 5,
+}
+
+# Worker processes write their metrics here; /metrics sums them (Prometheus text format)
+METRICS_DIR = os.environ.get('METRICS_DIR', os.path.join(BASE_DIR, 'metrics'))
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# Shared secret for sync clients reading /api/booking-changes/ (empty = staff login only)
+BOOKING_FEED_TOKEN = os.environ.get('BOOKING_FEED_TOKEN', '')
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -171,6 +229,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 AUTH_USER_MODEL = "accounts.CustomUser"
 
 
+# URL names rather than paths, so redirects keep a /t/<slug>/ tenant prefix
 LOGIN_REDIRECT_URL = "dashboard"   # redirect after successful login
-LOGOUT_REDIRECT_URL = "/login/"  # redirect after logout
-LOGIN_URL = "/login/"     # if @login_required, redirect here
+LOGOUT_REDIRECT_URL = "login"  # redirect after logout
+LOGIN_URL = "login"     # if @login_required, redirect here
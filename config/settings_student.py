@@ -0,0 +1,18 @@
+"""
+Lean settings for workers that only serve students.
+
+Leaves out the admin and the import-export stack (tablib, openpyxl,
+diff-match-patch), so those are never imported by these workers. Run staff
+traffic and ``manage.py run_jobs`` against ``config.settings``.
+
+    DJANGO_SETTINGS_MODULE=config.settings_student gunicorn config.wsgi
+"""
+
+from .settings import *  # noqa: F401,F403
+
+INSTALLED_APPS = [
+    app for app in INSTALLED_APPS
+    if app not in ('django.contrib.admin', 'import_export')
+]
+
+ROOT_URLCONF = 'config.urls_student'
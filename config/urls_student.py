@@ -0,0 +1,33 @@
+"""
+Student-facing URLs. Used on its own by ``config.settings_student`` and
+included by the full ``config.urls`` alongside the admin.
+"""
+from django.urls import path
+from bookings import views
+from django.contrib.auth import views as auth_views
+
+
+urlpatterns = [
+    path('activity/', views.activity_list, name='activity_list'),
+    path('book/<int:pk>/', views.book_activity, name='book_activity'),
+    path('swap/<int:pk>/', views.swap_activity, name='swap_activity'),
+    path('unbook/<int:pk>/', views.unbook_activity, name='unbook_activity'),
+    path('', views.dashboard, name='dashboard'),
+    path('dashboard/panel/<str:name>/', views.dashboard_panel, name='dashboard_panel'),
+    path('booking-wizard/<int:step>/', views.booking_wizard, name='booking_wizard'),
+
+    path("register", views.register, name="register"),
+    path("login/", auth_views.LoginView.as_view(template_name="accounts/login.html"), name="login"),
+    path("logout/", auth_views.LogoutView.as_view(), name="logout"),
+
+    path("my-bookings/", views.my_bookings, name="my_bookings"),
+    path("roll-call/", views.roll_call, name="roll_call"),
+    path("roll-call/<int:pk>/", views.take_register, name="take_register"),
+    path("calendar/<str:token>.ics", views.calendar_feed, name="calendar_feed"),
+    path("api/catalog/", views.api_catalog, name="api_catalog"),
+    path("api/my-bookings/", views.api_my_bookings, name="api_my_bookings"),
+    path("api/students/", views.student_lookup, name="student_lookup"),
+    path("api/booking-changes/", views.booking_changes, name="booking_changes"),
+    path("api/admission-stats/", views.admission_stats, name="admission_stats"),
+    path("metrics", views.metrics_view, name="metrics"),
+]